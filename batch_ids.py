@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетный файл ID: все предметы пользователя одной задачей
+
+Задача передается по всем слоям (журнал, сервис, общая очередь) как обычная,
+только вместо URL - список URL через пробел. Воркер обходит предметы по очереди,
+держа один браузер на хост, и возвращает наборы ID по каждому предмету.
+Пользователь получает один архив с файлом на каждый предмет.
+"""
+import os
+import zipfile
+from datetime import datetime
+from typing import Dict, List
+
+BATCH_OPERATION = "Пакетный файл ID"
+BATCH_BUTTON = "📦 Все мои предметы"
+
+
+def batch_target(urls: List[str]) -> str:
+    """Список URL -> строка-цель задачи"""
+    return " ".join(urls)
+
+
+def batch_urls(target: str) -> List[str]:
+    """Строка-цель задачи -> список URL"""
+    return target.split()
+
+
+def is_batch_target(target: str) -> bool:
+    return " " in target
+
+
+def write_archive(fname: str, subjects: Dict[str, object]) -> str:
+    """Пишет zip-архив: файл с отсортированными ID на каждый предмет
+
+    subjects - {название предмета: набор ID}.
+    """
+    with zipfile.ZipFile(fname, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, ids in subjects.items():
+            archive.writestr(f"{name}.txt", "".join(t + "\n" for t in sorted(ids)))
+    return fname
+
+
+def archive_name(chat_id: str) -> str:
+    return f"ids_all_{chat_id}_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.zip"
+
+
+def remove_archive(fname: str):
+    try:
+        os.remove(fname)
+    except OSError:
+        pass
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Публикация изменений в Telegram-каналы предметов
+
+Для предметов с каналом (CHANNELS: URL или "ОГЭ"/"ЕГЭ" -> канал) изменение
+публикуется один раз в канал, а личные сообщения получают только подписчики,
+включившие их кнопкой "📢 Уведомления в личку". Подписка на предмет
+по-прежнему нужна: по ней бот решает, какие предметы проверять.
+"""
+import logging
+from typing import Optional
+
+from telegram.ext import ContextTypes
+
+from database import store, save_store
+from utils import get_subject_type, split_message
+from config import CHANNELS, CHANNEL_DM_DEFAULT
+
+log = logging.getLogger("FIPI-Bot")
+
+
+def channel_for(url: str) -> Optional[str]:
+    """Канал предмета (сначала по URL, затем по типу экзамена)"""
+    return CHANNELS.get(url) or CHANNELS.get(get_subject_type(url))
+
+
+def chat_ref(chat_id):
+    """chat_id для Bot API: числовые ID - числом, @username канала - строкой"""
+    chat_id = str(chat_id)
+    return int(chat_id) if chat_id.lstrip("-").isdigit() else chat_id
+
+
+def get_dm_enabled(chat_id: str) -> bool:
+    return store.get("notify_settings", {}).get(chat_id, {}).get("dm", CHANNEL_DM_DEFAULT)
+
+
+def set_dm_enabled(chat_id: str, enabled: bool):
+    store.setdefault("notify_settings", {}).setdefault(chat_id, {})["dm"] = enabled
+    save_store(store)
+
+
+def direct_subscribers(url: str) -> list:
+    """Подписчики, которым изменения предмета отправляются в личные сообщения"""
+    has_channel = channel_for(url) is not None
+    return [chat_id for chat_id, urls in store["subscriptions"].items()
+            if url in urls and (not has_channel or get_dm_enabled(chat_id))]
+
+
+async def publish(context: ContextTypes.DEFAULT_TYPE, url: str, text: str) -> Optional[str]:
+    """Публикует сообщение в канал предмета; возвращает канал или None"""
+    channel = channel_for(url)
+    if not channel:
+        return None
+    try:
+        for msg in split_message(text):
+            await context.bot.send_message(chat_id=chat_ref(channel), text=msg)
+        log.info(f"📢 Изменение опубликовано в {channel}")
+    except Exception as e:
+        log.error(f"❌ Ошибка публикации в канал {channel}: {e}")
+    return channel
+
+
+def channel_hint(url: str) -> str:
+    """Строка для пользователя о канале предмета (пустая, если канала нет)"""
+    channel = channel_for(url)
+    if not channel:
+        return ""
+    return f"📢 Изменения публикуются в канале {channel}"
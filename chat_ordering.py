@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Параллельная обработка обновлений с сохранением порядка внутри чата
+
+Обновления разных чатов обрабатываются одновременно (не больше
+MAX_CONCURRENT_UPDATES), а обновления одного чата - строго по очереди:
+состояние диалога в context.user_data рассчитано на последовательные
+нажатия. Пока обновление ждет свой чат, оно не занимает общий слот,
+поэтому один активный пользователь не тормозит остальных.
+
+PTB забирает обновления из update_queue сразу, поэтому ограничение
+очереди здесь не работает: число принятых, но не обработанных обновлений
+считает процессор (pending), а webhook при is_full() отвечает 503.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict
+
+from telegram.ext import BaseUpdateProcessor
+
+log = logging.getLogger("FIPI-Bot")
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Ограничивает общее число обработчиков и упорядочивает обновления по чатам"""
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int):
+        super().__init__(max_concurrent_updates)
+        self.max_pending_updates = max_pending_updates
+        self.pending = 0  # Принятые обновления: в работе и ожидающие слота или своего чата
+        # chat_id -> [блокировка, число обновлений чата в работе или в очереди]
+        self._chats: Dict[int, list] = {}
+
+    def is_full(self, queued: int = 0) -> bool:
+        """True - новых обновлений не принимать (queued - еще лежат в update_queue)"""
+        return self.pending + queued >= self.max_pending_updates
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        self.pending += 1
+        try:
+            chat = getattr(update, "effective_chat", None)
+            if chat is None:
+                await super().process_update(update, coroutine)
+                return
+
+            entry = self._chats.setdefault(chat.id, [asyncio.Lock(), 0])
+            entry[1] += 1
+            try:
+                # asyncio.Lock отдает блокировку ожидающим в порядке очереди
+                async with entry[0]:
+                    await super().process_update(update, coroutine)
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._chats.pop(chat.id, None)
+        finally:
+            self.pending -= 1
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._chats:
+            log.info(f"🧵 Остановка: обновления еще обрабатываются в {len(self._chats)} чатах")
@@ -22,11 +22,130 @@ MAX_WEBDRIVERS = 4
 
 PARSING_TIMEOUT = 18000 # 30 минут максимум на парсинг
 
+PAGE_TIMEOUT = 300 # Максимум 5 минут на одну страницу (включая повторы и ожидание хоста)
+
+CHECKPOINT_INTERVAL_PAGES = 5 # Контрольная точка парсинга каждые 5 страниц
+
+# Вынос парсинга в отдельный сервис (crawler_service.py)
+CRAWLER_MODE = "local" # "local" - пул внутри бота, "service" - отдельный сервис, "distributed" - общая очередь
+CRAWLER_SERVICE_SOCKET = "/tmp/fipi-crawler.sock"
+CRAWLER_RESULT_TTL = 3600 # Результаты хранятся в сервисе 1 час
+CRAWLER_RECONNECT_TIMEOUT = 120 # Сколько ждать перезапуска сервиса, не теряя задачу
+
+# Распределенный парсинг (CRAWLER_MODE = "distributed", воркеры - remote_worker.py)
+JOB_QUEUE_URL = "redis://127.0.0.1:6379/0" # "local" - очередь в памяти (для тестов)
+JOB_LEASE_SECONDS = 120 # Задача возвращается в очередь, если воркер молчит 2 минуты
+JOB_POLL_INTERVAL = 5 # Опрос очереди и heartbeat каждые 5 секунд
+REMOTE_WORKER_SLOTS = 2 # Параллельных парсингов на одном удаленном воркере
+
+# Выключатель по хостам ФИПИ (состояние общее для бота и воркеров)
+HOST_STATE_FILE = "host_health.json"
+HOST_BREAKER_FAILURES = 3 # Ошибок подряд до паузы
+HOST_BREAKER_BASE_DELAY = 60 # Первая пауза 1 минута, дальше удваивается
+HOST_BREAKER_MAX_DELAY = 1800 # Не больше 30 минут
+
+# Общий лимит загрузок страниц ФИПИ на все процессы: (запросов в секунду, пачка)
+RATE_LIMIT_STATE_FILE = "rate_limits.json"
+RATE_LIMITS = {
+    "oge.fipi.ru": (0.5, 3),
+    "ege.fipi.ru": (0.5, 3),
+}
+RATE_LIMIT_DEFAULT = (0.5, 3)
+
+# Уведомления об изменениях: "digest" - сводка на чат, "instant" - сообщение на каждый предмет
+NOTIFY_MODE_DEFAULT = "digest" # Пользователь может переключить режим в меню подписок
+DIGEST_WINDOW = 600 # Изменения за 10 минут с первого события собираются в одну сводку
+DIGEST_MAX_DELAY = 3600 # Даже при идущем автопарсинге сводка уходит не позже чем через час
+DIGEST_MAX_ATTEMPTS = 5 # После 5 неудачных отправок подряд сводка отбрасывается
+DIGEST_CHECK_INTERVAL = 60 # Проверка готовых сводок раз в минуту
+
+# Ежедневные напоминания о расписании
+REMINDER_DAYS = (1, 7) # За сколько дней до работы напоминать
+REMINDER_SEND_RATE = 25 # Сообщений в секунду (лимит Telegram - около 30)
+REMINDER_SEND_CONCURRENCY = 8 # Одновременных запросов к Bot API
+
+# Каналы изменений: URL предмета или "ОГЭ"/"ЕГЭ" -> @username или ID канала (бот - администратор)
+CHANNELS = {} # Например: {"ОГЭ": "@fipi_oge_changes", "ЕГЭ": "@fipi_ege_changes"}
+CHANNEL_DM_DEFAULT = False # Личные уведомления по предметам с каналом - только по желанию
+
+# Кэш количества заданий для кнопки "📊 Количество заданий"
+COUNT_MAX_AGE = 600 # Старше 10 минут - показываем и обновляем в фоне
+COUNT_REFRESH_CONCURRENCY = 2 # Не более 2 браузеров на обновление количества
+
+# Отпечаток банка: хэши ID на первой, последней и нескольких средних страницах
+FINGERPRINT_PROBE_ENABLED = True # Ловит замену заданий при неизменном количестве
+FINGERPRINT_MIDDLE_PAGES = 1 # Средних страниц за одну проверку (по кругу)
+FINGERPRINT_PROBE_INTERVAL = 900 # Не чаще раза в 15 минут на предмет: ~4 запроса к сайту за проверку
+
+# Снимки наборов ID: воркеру передается ссылка, обратно - только разница
+SNAPSHOT_DIR = "id_snapshots" # Каталог общий для бота и локальных воркеров
+
+# Ночной прогрев кэша: самые популярные предметы парсятся заранее
+PREWARM_ENABLED = True
+PREWARM_TIME = "03:30" # Время запуска (как и напоминания - по времени job_queue)
+PREWARM_TOP_SUBJECTS = 5 # Сколько предметов с наибольшим числом подписчиков прогревать
+
+# История наборов ID (запись - только при изменении состава)
+HISTORY_RETENTION_DAYS = 30 # Запросы "изменения с даты" работают в пределах этого срока
+
+# Содержимое заданий для поиска отредактированных (только сравнение и автопарсинг)
+TASK_CONTENT_CAPTURE = False # Текст каждого задания хэшируется при каждом проходе
+TASK_CONTENT_DIR = "task_content" # Тексты и манифесты, адресуемые хэшем
+
+# Кэш результатов парсинга (ключ - URL и операция)
+PARSING_CACHE_MAX_ENTRIES = 200 # Давно не использованные записи вытесняются
+PARSING_CACHE_TTL_HOURS = 24 # Даже при неизменном количестве заданий результат не старше суток
+
+# Получение обновлений от Telegram
+BOT_UPDATE_MODE = "polling" # "polling" - long polling, "webhook" - встроенный HTTP-сервер
+WEBHOOK_URL = "" # Публичный HTTPS-адрес (прокси перенаправляет его на WEBHOOK_LISTEN:WEBHOOK_PORT)
+WEBHOOK_LISTEN = "127.0.0.1"
+WEBHOOK_PORT = 8080
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_SECRET = "" # Пусто - секрет выводится из токена бота
+WEBHOOK_MAX_CONNECTIONS = 40 # Параллельных соединений от Telegram
+
+# Параллельная обработка обновлений (внутри одного чата - строго по очереди)
+MAX_CONCURRENT_UPDATES = 32 # Одновременно обрабатываемых обновлений разных чатов
+MAX_PENDING_UPDATES = 1000 # Принятых, но не обработанных обновлений; сверх этого webhook отвечает 503
+BOT_CONNECTION_POOL_SIZE = MAX_CONCURRENT_UPDATES + 16 # Соединений к Bot API: обработчики + рассылки и фоновые задачи
+BOT_POOL_TIMEOUT = 10.0 # Секунд ожидания свободного соединения из пула
+
+# Ограничения на редактирование сообщений о прогрессе
+UI_GLOBAL_EDITS_PER_SECOND = 20 # Не более 20 правок в секунду на весь бот
+UI_CHAT_MIN_INTERVAL = 3.0 # Не чаще одной правки в 3 секунды на чат
+
+# Администраторы бота (могут отменять все задачи)
+ADMIN_CHAT_IDS = []
+
 # Настройки параллельного парсинга
 MAX_CONCURRENT_PARSING = 6 # Максимум 3 парсинга одновременно
 MAX_CONCURRENT_AUTO_PARSING = 4 # Максимум 2 автоматических парсинга одновременно
 MEMORY_LIMIT_PERCENT = 85 # Если память > 85%, не запускать новые парсинги
 CPU_LIMIT_PERCENT = 90 # Если CPU > 90%, не запускать новые парсинги
+RESOURCE_WAIT_INTERVAL = 10 # Секунд между проверками ресурсов, пока парсинг ждет в очереди
+
+# Переработка воркеров пула процессов
+WORKER_MAX_TASKS = 5 # Воркер перезапускается после 5 задач
+WORKER_MAX_RSS_MB = 1500 # Пул пересоздается, если воркер вместе со своим Chrome занял > 1500 MB
+
+# Фоновый сбор системных метрик
+METRICS_SAMPLE_INTERVAL = 5 # Обновление снимка метрик каждые 5 секунд
+
+# Блокировка ненужных ресурсов в Chrome (через DevTools)
+NETWORK_FILTER_ENABLED = True
+NETWORK_BLOCKED_URL_PATTERNS = [ # Для "*.расширение" добавляется и вариант "*.расширение?*"
+    # Изображения и медиа
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.ico", "*.webp", "*.bmp",
+    "*.mp4", "*.webm", "*.mp3",
+    # Шрифты
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    # Аналитика и сторонние счетчики
+    "*mc.yandex.ru*", "*google-analytics.com*", "*googletagmanager.com*",
+    "*top-fwz1.mail.ru*", "*counter.yadro.ru*",
+]
+# CSS и JS не блокируются: пагинация и iframe с заданиями строятся скриптами,
+# а видимость кнопок (element_to_be_clickable) зависит от стилей
 
 OGE_SUBJECTS = {
     "Английский язык": "https://oge.fipi.ru/bank/index.php?proj=8BBD5C99F37898B6402964AB11955663",
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш количества заданий: мгновенный ответ из последних значений с фоновым обновлением
+
+Значения приходят из периодической проверки и из запросов пользователей.
+Устаревшее значение отдается сразу, а обновление запускается в фоне;
+параллельные запросы одного URL ждут одно общее обновление.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from database import store
+from utils import get_current_count
+from config import COUNT_MAX_AGE, COUNT_REFRESH_CONCURRENCY
+
+log = logging.getLogger("FIPI-Bot")
+
+# url -> (количество, время получения)
+counts: Dict[str, Tuple[int, float]] = {}
+# url -> идущее обновление, которое разделяют все ожидающие
+refreshing: Dict[str, asyncio.Task] = {}
+
+_refresh_semaphore = None
+
+
+def get_refresh_semaphore() -> asyncio.Semaphore:
+    """Ограничивает число браузеров, одновременно проверяющих сайт"""
+    global _refresh_semaphore
+    if _refresh_semaphore is None:
+        _refresh_semaphore = asyncio.Semaphore(COUNT_REFRESH_CONCURRENCY)
+    return _refresh_semaphore
+
+
+def record_count(url: str, count: int):
+    """Запоминает свежее количество заданий"""
+    counts[url] = (count, time.time())
+
+
+def get_cached_count(url: str) -> Tuple[Optional[int], Optional[float]]:
+    """Количество и его возраст в секундах (возраст None - время получения неизвестно)"""
+    if url in counts:
+        count, fetched_at = counts[url]
+        return count, time.time() - fetched_at
+    # После перезапуска остается только сохраненное значение периодической проверки
+    return store["last_counts"].get(url), None
+
+
+def is_stale(url: str) -> bool:
+    count, age = get_cached_count(url)
+    return count is None or age is None or age > COUNT_MAX_AGE
+
+
+async def _refresh(url: str) -> Optional[int]:
+    try:
+        async with get_refresh_semaphore():
+            count = await asyncio.to_thread(get_current_count, url)
+        if count is not None:
+            record_count(url, count)
+        return count
+    finally:
+        refreshing.pop(url, None)
+
+
+async def refresh_count(url: str) -> Optional[int]:
+    """Получает количество с сайта; одновременные запросы одного URL делят один браузер"""
+    task = refreshing.get(url)
+    if task is None:
+        task = asyncio.create_task(_refresh(url))
+        refreshing[url] = task
+    # shield: отмена одного ожидающего не прерывает общее обновление
+    return await asyncio.shield(task)
+
+
+def revalidate_if_stale(url: str) -> bool:
+    """Запускает фоновое обновление устаревшего значения; True - обновление идет"""
+    if url in refreshing:
+        return True
+    if not is_stale(url):
+        return False
+    task = asyncio.create_task(refresh_count(url))
+    task.add_done_callback(_log_refresh_error)
+    return True
+
+
+def _log_refresh_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        log.warning(f"⚠️ Ошибка фонового обновления количества: {task.exception()}")
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Клиент сервиса парсинга (crawler_service.py) для бота
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Callable
+
+from config import CRAWLER_SERVICE_SOCKET, CRAWLER_RECONNECT_TIMEOUT, JOB_POLL_INTERVAL
+
+log = logging.getLogger("FIPI-Bot")
+
+# Общая очередь распределенного режима (создается при первом обращении)
+job_queue = None
+
+
+def get_job_queue():
+    global job_queue
+    if job_queue is None:
+        from job_queue import create_job_queue
+        job_queue = create_job_queue()
+    return job_queue
+
+
+async def _request(payload: dict) -> dict:
+    """Отправляет одну команду и возвращает ответ"""
+    reader, writer = await asyncio.open_unix_connection(CRAWLER_SERVICE_SOCKET)
+    try:
+        writer.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+        await writer.drain()
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("Сервис парсинга закрыл соединение")
+        return json.loads(line.decode("utf-8"))
+    finally:
+        writer.close()
+
+
+async def run_remote_job(task_id: str, url: str, operation: str, chat_id: str,
+                         on_progress: Callable[[str], None], prev_ids: dict = None) -> dict:
+    """Запускает задачу в сервисе и ждет результат, передавая прогресс в on_progress
+
+    При потере соединения переподключается с тем же task_id: сервис либо продолжает
+    идущую задачу, либо (после своего перезапуска) начинает ее с контрольной точки.
+    """
+    payload = {"cmd": "run", "task_id": task_id, "url": url,
+               "operation": operation, "chat_id": chat_id, "prev_ids": prev_ids}
+    disconnected_since = None
+    delay = 1
+
+    while True:
+        try:
+            reader, writer = await asyncio.open_unix_connection(CRAWLER_SERVICE_SOCKET)
+        except (ConnectionError, FileNotFoundError) as e:
+            reader = writer = None
+            error = e
+        else:
+            try:
+                writer.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+                await writer.drain()
+                disconnected_since = None
+                delay = 1
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        raise ConnectionError("Сервис парсинга закрыл соединение")
+                    msg = json.loads(line.decode("utf-8"))
+                    if msg.get("event") == "progress":
+                        on_progress(msg["text"])
+                    elif msg.get("event") == "result":
+                        return msg["result"]
+                    elif msg.get("ok") is False:
+                        return {"status": "error", "result": None, "error": msg.get("error")}
+            except ConnectionError as e:
+                error = e
+            finally:
+                writer.close()
+
+        if disconnected_since is None:
+            disconnected_since = time.monotonic()
+        if time.monotonic() - disconnected_since > CRAWLER_RECONNECT_TIMEOUT:
+            raise ConnectionError(f"Сервис парсинга недоступен: {error}")
+        log.warning(f"⚠️ Нет связи с сервисом парсинга ({error}), повтор через {delay} сек")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 30)
+
+
+async def cancel_remote_job(task_id: str) -> bool:
+    """Отменяет задачу в сервисе"""
+    try:
+        response = await _request({"cmd": "cancel", "task_id": task_id})
+        return bool(response.get("ok"))
+    except (ConnectionError, FileNotFoundError) as e:
+        log.warning(f"⚠️ Не удалось отменить задачу {task_id} в сервисе: {e}")
+        return False
+
+
+async def get_service_status() -> dict:
+    """Состояние сервиса парсинга (None, если он недоступен)"""
+    try:
+        return await _request({"cmd": "status"})
+    except (ConnectionError, FileNotFoundError):
+        return None
+
+
+async def run_distributed_job(task_id: str, url: str, operation: str, chat_id: str,
+                              prev_ids: list, on_progress: Callable[[str], None]) -> dict:
+    """Ставит задачу в общую очередь и ждет, пока ее выполнит один из удаленных воркеров
+
+    Бот заодно возвращает в очередь задачи воркеров с истекшей арендой.
+    """
+    queue = get_job_queue()
+    await asyncio.to_thread(queue.push, {"task_id": task_id, "url": url, "operation": operation,
+                                         "chat_id": chat_id, "prev_ids": prev_ids})
+    last_progress = None
+    while True:
+        await asyncio.to_thread(queue.requeue_expired)
+        job = await asyncio.to_thread(queue.get, task_id)
+        if job is None:
+            return {"status": "error", "result": None, "error": "Задача пропала из очереди"}
+        if job["status"] == "done":
+            return job["result"]
+        if job.get("progress") and job["progress"] != last_progress:
+            last_progress = job["progress"]
+            on_progress(last_progress)
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+async def cancel_distributed_job(task_id: str) -> bool:
+    """Помечает задачу в общей очереди как отмененную"""
+    try:
+        return await asyncio.to_thread(get_job_queue().cancel, task_id)
+    except Exception as e:
+        log.warning(f"⚠️ Не удалось отменить задачу {task_id} в очереди: {e}")
+        return False
+
+
+async def get_distributed_status() -> dict:
+    """Состояние общей очереди (None, если она недоступна)"""
+    try:
+        return await asyncio.to_thread(get_job_queue().stats)
+    except Exception:
+        return None
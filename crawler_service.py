@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Сервис парсинга - отдельный процесс, владеющий браузерами, очередью и результатами
+
+Запуск: python crawler_service.py
+
+Бот подключается к Unix-сокету CRAWLER_SERVICE_SOCKET. Протокол - JSON-строки:
+  {"cmd": "run", "task_id", "url", "operation", "chat_id", "prev_ids"} - запуск (или подключение
+      к уже идущей задаче) и поток событий {"event": "progress", "text"} до
+      финального {"event": "result", "result": {...}}
+  {"cmd": "cancel", "task_id"}  - отмена задачи
+  {"cmd": "status"}             - состояние сервиса
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from typing import Dict
+
+from parsing_worker import (parsing_worker_with_progress, create_worker_pool, cancel_file_path,
+                            remove_checkpoints, pool_pids)
+from system_metrics import metrics_sampler, get_snapshot, set_worker_pids_provider
+from config import (CRAWLER_SERVICE_SOCKET, CRAWLER_RESULT_TTL, MAX_CONCURRENT_PARSING,
+                    WORKER_MAX_RSS_MB)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+)
+
+log = logging.getLogger("FIPI-Crawler")
+
+executor = None
+# Старые пулы после пересоздания: доделывают свои задачи, затем завершаются
+retiring_executors: list = []
+# Слоты воркеров на оба пула сразу: при пересоздании браузеров не становится вдвое больше
+worker_slots = asyncio.Semaphore(MAX_CONCURRENT_PARSING)
+shutting_down = False
+# task_id -> {"status", "progress", "result", "done", "finished_at", ...}
+jobs: Dict[str, Dict] = {}
+
+
+def get_worker_pids() -> list:
+    """PID воркеров текущего и завершающихся пулов"""
+    pids = pool_pids(executor)
+    for pool in retiring_executors:
+        pids.extend(pool_pids(pool))
+    return pids
+
+
+async def retire_executor(pool):
+    """Дожидается завершения задач старого пула (до этого он учитывается в метриках)"""
+    try:
+        await asyncio.to_thread(pool.shutdown, wait=True)
+    finally:
+        retiring_executors.remove(pool)
+
+
+def read_progress(task_id: str) -> str:
+    """Читает файл прогресса, который пишет воркер"""
+    try:
+        with open(f"progress_{task_id}.txt", "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+async def run_job(task_id: str):
+    """Выполняет задачу в пуле и сохраняет результат"""
+    job = jobs[task_id]
+    loop = asyncio.get_running_loop()
+    try:
+        async with worker_slots:
+            job["status"] = "running"
+            job["result"] = await loop.run_in_executor(
+                executor, parsing_worker_with_progress,
+                job["url"], job["operation"], job["chat_id"], task_id, job["prev_ids"]
+            )
+    except Exception as e:
+        log.error(f"❌ Ошибка задачи {task_id}: {e}")
+        job["result"] = {"status": "error", "result": None, "error": str(e)}
+    finally:
+        # Сервис переживает перезапуск бота: завершение задачи здесь окончательное,
+        # кроме остановки самого сервиса - тогда задача продолжится с контрольной точки
+        if not shutting_down:
+            remove_checkpoints(task_id)
+        job["status"] = "done"
+        job["finished_at"] = time.time()
+        job["done"].set()
+        log.info(f"✅ Задача {task_id} завершена: {job['result'].get('status')}")
+
+
+def submit_job(msg: dict) -> dict:
+    """Ставит задачу в очередь; повторная отправка того же task_id подключается к ней"""
+    task_id = msg["task_id"]
+    job = jobs.get(task_id)
+    if job is None:
+        job = {
+            "task_id": task_id,
+            "url": msg["url"],
+            "operation": msg["operation"],
+            "chat_id": msg.get("chat_id", ""),
+            "prev_ids": msg.get("prev_ids"),
+            "status": "queued",
+            "result": None,
+            "done": asyncio.Event(),
+            "submitted_at": time.time(),
+            "finished_at": None,
+        }
+        jobs[task_id] = job
+        asyncio.create_task(run_job(task_id))
+        log.info(f"🚀 Принята задача {task_id}: {msg['operation']} для {msg['url']}")
+    return job
+
+
+async def send(writer: asyncio.StreamWriter, payload: dict):
+    writer.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+    await writer.drain()
+
+
+async def stream_job(job: dict, writer: asyncio.StreamWriter):
+    """Отправляет прогресс задачи по мере изменения, затем результат"""
+    last_progress = None
+    while not job["done"].is_set():
+        progress = read_progress(job["task_id"])
+        if progress and progress != last_progress:
+            await send(writer, {"event": "progress", "text": progress})
+            last_progress = progress
+        try:
+            await asyncio.wait_for(job["done"].wait(), timeout=1)
+        except asyncio.TimeoutError:
+            pass
+    if shutting_down:
+        # Задача прервана остановкой сервиса - бот переподключится и продолжит ее
+        return
+    await send(writer, {"event": "result", "result": job["result"]})
+
+
+def cancel_job(task_id: str) -> bool:
+    """Запрашивает отмену: воркер остановится на следующей странице"""
+    job = jobs.get(task_id)
+    if not job or job["done"].is_set():
+        return False
+    try:
+        with open(cancel_file_path(task_id), "w", encoding="utf-8") as f:
+            f.write(str(time.time()))
+    except OSError as e:
+        log.warning(f"⚠️ Не удалось создать флаг отмены для {task_id}: {e}")
+        return False
+    log.info(f"⛔ Запрошена отмена задачи {task_id}")
+    return True
+
+
+def service_status() -> dict:
+    """Состояние сервиса для бота"""
+    metrics = get_snapshot()
+    return {
+        "queued": sum(1 for j in jobs.values() if j["status"] == "queued"),
+        "running": sum(1 for j in jobs.values() if j["status"] == "running"),
+        "stored_results": sum(1 for j in jobs.values() if j["status"] == "done"),
+        "worker_rss_mb": metrics["worker_rss_mb"],
+        "chrome_count": metrics["chrome_count"],
+    }
+
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Обрабатывает одно подключение бота"""
+    try:
+        line = await reader.readline()
+        if not line:
+            return
+        msg = json.loads(line.decode("utf-8"))
+        cmd = msg.get("cmd")
+
+        if cmd == "run":
+            await stream_job(submit_job(msg), writer)
+        elif cmd == "cancel":
+            await send(writer, {"ok": cancel_job(msg["task_id"])})
+        elif cmd == "status":
+            await send(writer, {"ok": True, **service_status()})
+        else:
+            await send(writer, {"ok": False, "error": f"Неизвестная команда: {cmd}"})
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    except Exception as e:
+        log.error(f"❌ Ошибка обработки запроса: {e}")
+        try:
+            await send(writer, {"ok": False, "error": str(e)})
+        except Exception:
+            pass
+    finally:
+        writer.close()
+
+
+async def housekeeping():
+    """Удаляет старые результаты и пересоздает пул при разрастании воркеров"""
+    global executor
+    while True:
+        await asyncio.sleep(30)
+        now = time.time()
+        expired = [tid for tid, j in jobs.items()
+                   if j["finished_at"] and now - j["finished_at"] > CRAWLER_RESULT_TTL]
+        for task_id in expired:
+            del jobs[task_id]
+
+        current = set(pool_pids(executor))
+        workers = get_snapshot().get("worker_processes", {})
+        if any(rss > WORKER_MAX_RSS_MB for pid, rss in workers.items() if pid in current):
+            log.warning(f"⚠️ Воркер превысил {WORKER_MAX_RSS_MB} MB, пересоздаю пул")
+            old_executor = executor
+            executor = create_worker_pool()
+            retiring_executors.append(old_executor)
+            asyncio.create_task(retire_executor(old_executor))
+
+
+async def main():
+    global executor, shutting_down
+    executor = create_worker_pool()
+    set_worker_pids_provider(get_worker_pids)
+
+    if os.path.exists(CRAWLER_SERVICE_SOCKET):
+        os.remove(CRAWLER_SERVICE_SOCKET)
+    server = await asyncio.start_unix_server(handle_client, path=CRAWLER_SERVICE_SOCKET)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    tasks = [asyncio.create_task(metrics_sampler()), asyncio.create_task(housekeeping())]
+    log.info(f"🛰️ Сервис парсинга слушает {CRAWLER_SERVICE_SOCKET} ({MAX_CONCURRENT_PARSING} workers)")
+
+    async with server:
+        await stop.wait()
+
+    log.info("🔧 Остановка сервиса парсинга")
+    shutting_down = True
+    for task in tasks:
+        task.cancel()
+    # Воркеры остановятся на следующей странице, контрольные точки сохранятся
+    for task_id in list(jobs.keys()):
+        cancel_job(task_id)
+    await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+    for pool in list(retiring_executors):
+        await asyncio.to_thread(pool.shutdown, wait=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
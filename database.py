@@ -8,7 +8,8 @@ import os
 import json
 from typing import Dict
 from datetime import datetime, timedelta
-from config import DATA_FILE
+from id_set import IdSet
+from config import DATA_FILE, PARSING_CACHE_MAX_ENTRIES, PARSING_CACHE_TTL_HOURS
 
 def ensure_store() -> Dict:
     """Создает или загружает хранилище данных"""
@@ -21,19 +22,24 @@ def ensure_store() -> Dict:
                 "last_counts": {},
                 "last_ids": {},
                 "historical_ids": {},
-                "recent_parsing": {}  # Кэш недавних результатов
+                "parsing_cache": {},  # Кэш результатов: "операция::url" -> результат (LRU)
+                "job_journal": {}  # Журнал задач парсинга (переживает перезапуск)
             }, f, ensure_ascii=False)
 
     with open(DATA_FILE, "r", encoding="utf-8") as f:
         data = json.load(f)
 
     # Добавляем новые поля если их нет
-    if "recent_parsing" not in data:
-        data["recent_parsing"] = {}
+    if "parsing_cache" not in data:
+        data["parsing_cache"] = {}
+    # Старый кэш (одна запись на URL) заменен parsing_cache
+    data.pop("recent_parsing", None)
     if "reminder_subscriptions" not in data:
         data["reminder_subscriptions"] = {}
     if "statgrad_subscriptions" not in data:  # НОВОЕ!
         data["statgrad_subscriptions"] = {}
+    if "job_journal" not in data:
+        data["job_journal"] = {}
 
     save_store(data)
     return data
@@ -43,68 +49,123 @@ def save_store(store: Dict):
     with open(DATA_FILE, "w", encoding="utf-8") as f:
         json.dump(store, f, ensure_ascii=False)
 
-def save_parsing_result(url: str, operation: str, result, user_id: str):
-    """Сохраняет результат парсинга в кэш"""
-    timestamp = datetime.now().isoformat()
-    store = ensure_store()
-    store["recent_parsing"][url] = {
-        "timestamp": timestamp,
+def _cache_key(url: str, operation: str) -> str:
+    return f"{operation}::{url}"
+
+def save_parsing_result(url: str, operation: str, result, user_id: str, count: int = None):
+    """Сохраняет результат парсинга в кэш
+
+    count - количество заданий на момент парсинга: пока оно не изменилось,
+    результат считается актуальным (в пределах PARSING_CACHE_TTL_HOURS).
+    """
+    cache = store.setdefault("parsing_cache", {})
+    key = _cache_key(url, operation)
+    cache.pop(key, None)
+    cache[key] = {
+        "url": url,
+        "timestamp": datetime.now().isoformat(),
         "operation": operation,
-        "result": list(result) if isinstance(result, set) else result,
-        "user_id": user_id
+        "result": IdSet.from_store(result).to_store() if isinstance(result, (set, list, IdSet)) else result,
+        "user_id": user_id,
+        "count": count if count is not None else store["last_counts"].get(url)
     }
+    # LRU: самые давно использованные записи в начале словаря
+    while len(cache) > PARSING_CACHE_MAX_ENTRIES:
+        del cache[next(iter(cache))]
     save_store(store)
 
-def get_recent_parsing(url: str, operation: str, max_age_hours: int = 2) -> Dict:
-    """Получает недавний результат парсинга если он есть"""
-    store = ensure_store()
-    if url not in store.get("recent_parsing", {}):
+def get_recent_parsing(url: str, operation: str, max_age_hours: int = 2,
+                       current_count: int = None) -> Dict:
+    """Получает результат парсинга из кэша, если он еще актуален
+
+    Если известно количество заданий при парсинге и сейчас, результат актуален,
+    пока оно не изменилось; иначе - не дольше max_age_hours.
+    """
+    cache = store.get("parsing_cache", {})
+    key = _cache_key(url, operation)
+    cached = cache.get(key)
+    if cached is None:
         return None
 
-    cached = store["recent_parsing"][url]
+    if current_count is None:
+        current_count = store["last_counts"].get(url)
 
-    # Проверяем операцию
-    if cached.get("operation") != operation:
-        return None
-
-    # Проверяем возраст
     try:
-        cache_time = datetime.fromisoformat(cached["timestamp"])
-        max_age = timedelta(hours=max_age_hours)
-        if datetime.now() - cache_time > max_age:
-            # Удаляем устаревший результат
-            del store["recent_parsing"][url]
-            save_store(store)
-            return None
+        age = datetime.now() - datetime.fromisoformat(cached["timestamp"])
     except Exception:
+        age = None
+
+    if age is None or age > timedelta(hours=PARSING_CACHE_TTL_HOURS):
+        valid = False
+    elif cached.get("count") is not None and current_count is not None:
+        valid = cached["count"] == current_count
+    else:
+        valid = age <= timedelta(hours=max_age_hours)
+
+    if not valid:
+        del cache[key]
+        save_store(store)
         return None
 
+    # Отмечаем использование для LRU
+    cache[key] = cache.pop(key)
     return cached
 
 def clean_old_parsing_cache():
-    """Очищает устаревшие результаты парсинга"""
-    store = ensure_store()
+    """Очищает результаты парсинга старше PARSING_CACHE_TTL_HOURS"""
+    cache = store.get("parsing_cache", {})
+    max_age = timedelta(hours=PARSING_CACHE_TTL_HOURS)
     current_time = datetime.now()
-    max_age = timedelta(hours=6)  # Максимальный возраст 6 часов
 
     to_remove = []
-    for url, cached in store.get("recent_parsing", {}).items():
+    for key, cached in cache.items():
+        try:
+            if current_time - datetime.fromisoformat(cached["timestamp"]) > max_age:
+                to_remove.append(key)
+        except Exception:
+            to_remove.append(key)
+
+    for key in to_remove:
+        del cache[key]
+
+    if to_remove:
+        save_store(store)
+
+def journal_job(task_id: str, **fields):
+    """Создает или обновляет запись журнала задач парсинга"""
+    journal = store.setdefault("job_journal", {})
+    entry = journal.setdefault(task_id, {"task_id": task_id})
+    entry.update(fields)
+    entry["updated_at"] = datetime.now().isoformat()
+    save_store(store)
+
+def get_unfinished_jobs() -> list:
+    """Возвращает задачи, не завершенные до остановки бота"""
+    return [entry for entry in store.get("job_journal", {}).values()
+            if entry.get("status") in ("queued", "running")]
+
+def clean_finished_jobs(max_age_hours: int = 24):
+    """Удаляет из журнала давно завершенные задачи"""
+    cutoff = datetime.now() - timedelta(hours=max_age_hours)
+    journal = store.get("job_journal", {})
+    to_remove = []
+    for task_id, entry in journal.items():
+        if entry.get("status") in ("queued", "running"):
+            continue
         try:
-            cache_time = datetime.fromisoformat(cached["timestamp"])
-            if current_time - cache_time > max_age:
-                to_remove.append(url)
+            if datetime.fromisoformat(entry["updated_at"]) < cutoff:
+                to_remove.append(task_id)
         except Exception:
-            to_remove.append(url)
+            to_remove.append(task_id)
 
-    for url in to_remove:
-        del store["recent_parsing"][url]
+    for task_id in to_remove:
+        del journal[task_id]
 
     if to_remove:
         save_store(store)
 
 def add_statgrad_subscription(chat_id: str, subject: str):
     """Добавляет подписку на Статград"""
-    store = ensure_store()
     subs = store["statgrad_subscriptions"].setdefault(chat_id, [])
     if subject not in subs:
         subs.append(subject)
@@ -114,7 +175,6 @@ def add_statgrad_subscription(chat_id: str, subject: str):
 
 def remove_statgrad_subscription(chat_id: str, subject: str):
     """Удаляет подписку на Статград"""
-    store = ensure_store()
     subs = store["statgrad_subscriptions"].get(chat_id, [])
     if subject in subs:
         subs.remove(subject)
@@ -124,7 +184,6 @@ def remove_statgrad_subscription(chat_id: str, subject: str):
 
 def get_statgrad_subscriptions(chat_id: str) -> list:
     """Получает подписки на Статград для пользователя"""
-    store = ensure_store()
     return store["statgrad_subscriptions"].get(chat_id, [])
 
 # Глобальное хранилище
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Сводки изменений: одно сообщение и один файл на чат вместо сообщения на предмет
+
+В режиме "digest" события (изменилось количество, найдены изменения ID)
+копятся в store["pending_digests"] и отправляются одной сводкой, когда с
+первого события прошло DIGEST_WINDOW секунд. Пока по предметам сводки идет
+автопарсинг, отправка откладывается (не дольше DIGEST_MAX_DELAY), чтобы
+изменение количества и найденные изменения ID пришли вместе.
+
+Текст сводки и файл отправляются раздельно: после отправки текста его события
+удаляются из очереди, а неотправленный файл повторяется отдельно. Ошибки
+отправки повторяются с растущей паузой (не больше DIGEST_MAX_ATTEMPTS раз).
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+
+from telegram.error import Forbidden, BadRequest
+from telegram.ext import ContextTypes
+
+from database import store, save_store
+from id_set import IdSet
+from keyboards import kb_main_reply
+from utils import subj_by_url, split_message
+from config import (NOTIFY_MODE_DEFAULT, DIGEST_WINDOW, DIGEST_MAX_DELAY, DIGEST_MAX_ATTEMPTS,
+                    DIGEST_CHECK_INTERVAL)
+
+log = logging.getLogger("FIPI-Bot")
+
+NOTIFY_MODES = {
+    "digest": "📬 Сводкой",
+    "instant": "🔔 Сразу по каждому предмету",
+}
+
+
+def get_notify_mode(chat_id: str) -> str:
+    return store.get("notify_settings", {}).get(chat_id, {}).get("mode", NOTIFY_MODE_DEFAULT)
+
+
+def set_notify_mode(chat_id: str, mode: str):
+    store.setdefault("notify_settings", {}).setdefault(chat_id, {})["mode"] = mode
+    save_store(store)
+
+
+def queue_for_digest(subscribers: list, event: dict) -> list:
+    """Добавляет событие в сводки подписчиков в режиме "digest"
+
+    Возвращает подписчиков, которым уведомление нужно отправить сразу.
+    """
+    now = datetime.now().isoformat()
+    event["time"] = now
+    pending = store.setdefault("pending_digests", {})
+    instant = []
+    for chat_id in subscribers:
+        if get_notify_mode(chat_id) != "digest":
+            instant.append(chat_id)
+            continue
+        digest = pending.setdefault(chat_id, {"since": now, "events": []})
+        if not digest["events"]:
+            digest["since"] = now
+        digest["events"].append(event)
+    if len(instant) < len(subscribers):
+        save_store(store)
+    return instant
+
+
+def count_event(url: str, old_count: int, new_count: int) -> dict:
+    return {"type": "count", "url": url, "old": old_count, "new": new_count}
+
+
+def ids_event(url: str, added, removed, total_count: int, edited=()) -> dict:
+    return {"type": "ids", "url": url, "total": total_count,
+            "added": IdSet(added).to_store(), "removed": IdSet(removed).to_store(),
+            "edited": IdSet(edited).to_store()}
+
+
+def no_ids_event(url: str, total_count: int) -> dict:
+    return {"type": "no_ids", "url": url, "total": total_count}
+
+
+def _auto_parsing_urls() -> set:
+    from queue_manager import active_tasks
+    return {t["url"] for t in active_tasks.values() if t.get("is_auto")}
+
+
+def _is_due(digest: dict, now: datetime, busy_urls: set) -> bool:
+    if digest.get("retry_at") and now < datetime.fromisoformat(digest["retry_at"]):
+        return False
+    if not digest["events"]:
+        return bool(digest.get("unsent_files"))
+    age = (now - datetime.fromisoformat(digest["since"])).total_seconds()
+    if age >= DIGEST_MAX_DELAY:
+        return True
+    if age < DIGEST_WINDOW:
+        return False
+    return not any(e["url"] in busy_urls for e in digest["events"])
+
+
+def format_digest(events: list) -> str:
+    """Текст сводки: по строке на событие, сгруппировано по предметам"""
+    by_url = {}
+    for event in events:
+        by_url.setdefault(event["url"], []).append(event)
+    lines = [f"📬 Сводка изменений ({len(by_url)} предм.)\n"]
+    for url, url_events in by_url.items():
+        lines.append(f"📚 {subj_by_url(url)}")
+        for event in url_events:
+            if event["type"] == "count":
+                trend = "📈" if event["new"] > event["old"] else "📉"
+                lines.append(f"  {trend} Заданий: {event['old']} → {event['new']}")
+            elif event["type"] == "ids":
+                edited = event.get("edited", {}).get("n", 0)
+                lines.append(f"  🔍 ID: +{event['added']['n']} / -{event['removed']['n']} "
+                             + (f"/ ✏️{edited} " if edited else "") + f"(всего {event['total']})")
+            else:
+                lines.append(f"  ℹ️ Состав ID прежний (всего {event['total']})")
+    if any(e["type"] == "ids" for e in events):
+        lines.append("\n📄 Изменения ID в файле ↓")
+    return "\n".join(lines)
+
+
+def write_digest_file(filename: str, events: list):
+    """Один файл с изменениями ID по всем предметам сводки"""
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write("📬 СВОДКА ИЗМЕНЕНИЙ\n")
+        f.write(f"Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write("=" * 50 + "\n\n")
+        for event in events:
+            if event["type"] != "ids":
+                continue
+            added = IdSet.from_store(event["added"])
+            removed = IdSet.from_store(event["removed"])
+            f.write(f"📚 {subj_by_url(event['url'])} ({event['time'][:16].replace('T', ' ')})\n")
+            f.write("-" * 30 + "\n")
+            if added:
+                f.write(f"➕ ДОБАВЛЕНЫ ID ({len(added)}):\n")
+                f.write("".join(f"{task_id}\n" for task_id in added))
+            if removed:
+                f.write(f"➖ УДАЛЕНЫ ID ({len(removed)}):\n")
+                f.write("".join(f"{task_id}\n" for task_id in removed))
+            edited = IdSet.from_store(event.get("edited", []))
+            if edited:
+                f.write(f"✏️ ИЗМЕНЕН ТЕКСТ ({len(edited)}):\n")
+                f.write("".join(f"{task_id}\n" for task_id in edited))
+            f.write("\n")
+
+
+async def send_digest_text(context: ContextTypes.DEFAULT_TYPE, chat_id: str, events: list):
+    for msg in split_message(format_digest(events)):
+        await context.bot.send_message(chat_id=int(chat_id), text=msg, reply_markup=kb_main_reply())
+
+
+async def send_digest_file(context: ContextTypes.DEFAULT_TYPE, chat_id: str, events: list):
+    filename = f"changes_digest_{chat_id}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.txt"
+    try:
+        write_digest_file(filename, events)
+        with open(filename, "rb") as f:
+            await context.bot.send_document(chat_id=int(chat_id), document=f, filename=filename,
+                                            caption="📬 Изменения ID по предметам сводки")
+    finally:
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+async def flush_digests(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическая задача: отправляет сводки, у которых истекло окно"""
+    pending = store.get("pending_digests", {})
+    if not pending:
+        return
+    now = datetime.now()
+    busy_urls = _auto_parsing_urls()
+    for chat_id in [c for c, d in pending.items() if _is_due(d, now, busy_urls)]:
+        digest = pending[chat_id]
+        try:
+            if digest["events"]:
+                sent = len(digest["events"])
+                await send_digest_text(context, chat_id, digest["events"][:sent])
+                # Текст доставлен: повторять можно только файл. События, пришедшие
+                # во время отправки, остаются для следующей сводки
+                digest.setdefault("unsent_files", []).extend(
+                    e for e in digest["events"][:sent] if e["type"] == "ids")
+                del digest["events"][:sent]
+                digest["since"] = datetime.now().isoformat()
+                save_store(store)
+                log.info(f"📬 Сводка из {sent} событий отправлена {chat_id}")
+            if digest.get("unsent_files"):
+                await send_digest_file(context, chat_id, digest["unsent_files"])
+                digest["unsent_files"] = []
+        except (Forbidden, BadRequest) as e:
+            # Бот заблокирован или чат недоступен - повторять бессмысленно
+            log.warning(f"⚠️ Сводка {chat_id} отброшена: {e}")
+            pending.pop(chat_id, None)
+            save_store(store)
+            continue
+        except Exception as e:
+            attempts = digest.get("attempts", 0) + 1
+            if attempts >= DIGEST_MAX_ATTEMPTS:
+                log.error(f"❌ Сводка {chat_id} отброшена после {attempts} попыток: {e}")
+                pending.pop(chat_id, None)
+            else:
+                delay = DIGEST_CHECK_INTERVAL * 2 ** attempts
+                digest.update(attempts=attempts,
+                              retry_at=(datetime.now() + timedelta(seconds=delay)).isoformat())
+                log.error(f"❌ Ошибка отправки сводки {chat_id}, повтор через {delay} сек: {e}")
+            save_store(store)
+            continue
+        digest.pop("attempts", None)
+        digest.pop("retry_at", None)
+        if not digest["events"] and not digest.get("unsent_files"):
+            pending.pop(chat_id, None)
+        save_store(store)
@@ -26,5 +26,32 @@ module.exports = {
     // Специальные настройки для root
     uid: 0,
     gid: 0
+  }, {
+    // Сервис парсинга (используется при CRAWLER_MODE = "service" в config.py)
+    name: 'fipi-crawler',
+    script: '/root/fipi-bot/venv/bin/python',
+    args: '/root/fipi-bot/crawler_service.py',
+    interpreter: 'none',
+    cwd: '/root/fipi-bot',
+    autorestart: true,
+    watch: false,
+    max_memory_restart: '3G',
+    min_uptime: '10s',
+    max_restarts: 5,
+    restart_delay: 5000,
+    kill_timeout: 60000,
+    env: {
+      PYTHONPATH: '/root/fipi-bot',
+      DISPLAY: ':99',
+      VIRTUAL_ENV: '/root/fipi-bot/venv',
+      PATH: '/root/fipi-bot/venv/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin'
+    },
+    error_file: '/root/fipi-bot/logs/crawler-err.log',
+    out_file: '/root/fipi-bot/logs/crawler-out.log',
+    log_file: '/root/fipi-bot/logs/crawler-combined.log',
+    time: true,
+    log_date_format: 'YYYY-MM-DD HH:mm:ss Z',
+    uid: 0,
+    gid: 0
   }]
 };
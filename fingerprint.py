@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Отпечаток банка заданий: хэши упорядоченных ID на нескольких страницах
+
+Проверка количества не замечает замену задания (одно удалили, другое добавили).
+При каждой периодической проверке загружаются первая, последняя и одна-две
+"средние" страницы по кругу; несовпадение хэша с прошлым значением означает,
+что состав банка изменился и нужен повторный парсинг.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from parser import TaskIdExtractor
+from database import store, save_store
+from count_cache import record_count, get_refresh_semaphore
+from config import FINGERPRINT_MIDDLE_PAGES, FINGERPRINT_PROBE_INTERVAL
+
+log = logging.getLogger("FIPI-Bot")
+
+
+def pick_middle_pages(total_pages: int, rotation: int, count: int = FINGERPRINT_MIDDLE_PAGES) -> List[int]:
+    """Средние страницы для очередной проверки (по кругу между 2 и total_pages - 1)"""
+    middle = list(range(2, total_pages))
+    if not middle:
+        return []
+    start = (rotation * count) % len(middle)
+    return [middle[(start + i) % len(middle)] for i in range(min(count, len(middle)))]
+
+
+def probe_due(url: str) -> bool:
+    """Пора ли снимать отпечаток (между проверками хватает запроса количества)"""
+    checked_at = store.get("fingerprints", {}).get(url, {}).get("checked_at")
+    if not checked_at:
+        return True
+    return (datetime.now() - datetime.fromisoformat(checked_at)).total_seconds() >= FINGERPRINT_PROBE_INTERVAL
+
+
+async def run_probe(url: str) -> Optional[Dict]:
+    """Снимает отпечаток в отдельном потоке (браузеры делят лимит с обновлением количества)"""
+    rotation = store.get("fingerprints", {}).get(url, {}).get("rotation", 0)
+    try:
+        async with get_refresh_semaphore():
+            probe = await asyncio.to_thread(
+                TaskIdExtractor().probe_fingerprint, url,
+                lambda total: pick_middle_pages(total, rotation)
+            )
+    except Exception as e:
+        log.warning(f"⚠️ Не удалось снять отпечаток {url}: {e}")
+        return None
+    record_count(url, probe["count"])
+    return probe
+
+
+def update_fingerprint(url: str, probe: Dict) -> List[int]:
+    """Сохраняет отпечаток и возвращает страницы, чей хэш изменился
+
+    При изменении числа страниц или заданий старые хэши сбрасываются:
+    такое изменение обрабатывает проверка количества.
+    """
+    fingerprints = store.setdefault("fingerprints", {})
+    previous = fingerprints.get(url)
+    changed = []
+
+    if (previous and previous.get("total_pages") == probe["total_pages"]
+            and previous.get("count") == probe["count"]):
+        pages = previous["pages"]
+        changed = [int(p) for p, digest in probe["pages"].items() if p in pages and pages[p] != digest]
+        pages.update(probe["pages"])
+    else:
+        pages = dict(probe["pages"])
+
+    fingerprints[url] = {
+        "count": probe["count"],
+        "total_pages": probe["total_pages"],
+        "pages": pages,
+        "rotation": (previous or {}).get("rotation", 0) + 1,
+        "checked_at": datetime.now().isoformat(),
+    }
+    save_store(store)
+    return sorted(changed)
@@ -11,21 +11,30 @@ from datetime import datetime, date
 
 from telegram import Update, Message
 from telegram.ext import ContextTypes, ApplicationHandlerStop
+from telegram.error import RetryAfter
 
 from keyboards import (kb_main_reply, kb_subjects_reply, kb_user_subjects_reply,
                       kb_subscriptions_menu_reply, kb_cached_result_choice,
                       kb_reminders_menu, kb_subjects_reminders)
 
-from database import (store, save_store, get_recent_parsing, save_parsing_result,
+from database import (store, save_store, get_recent_parsing,
                      clean_old_parsing_cache, add_statgrad_subscription, 
                      remove_statgrad_subscription, get_statgrad_subscriptions)
 
-from utils import subj_by_url, get_current_count, split_message, send_changes_file
-from queue_manager import queue_parsing_task, get_queue_status
+from utils import subj_by_url, split_message, send_changes_file, format_time_diff
+from count_cache import get_cached_count, refresh_count, revalidate_if_stale
+from id_set import IdSet
+from digest import NOTIFY_MODES, get_notify_mode, set_notify_mode
+from channels import channel_for, channel_hint, get_dm_enabled, set_dm_enabled
+from id_history import diff_between, seen_range
+from reminders import invalidate_subscribers, exams_for_subject, build_daily_reminders, send_many
+from batch_ids import (BATCH_OPERATION, BATCH_BUTTON, batch_target, write_archive, archive_name,
+                       remove_archive)
+from queue_manager import (queue_parsing_task, get_queue_status, cancel_user_tasks, cancel_all_tasks,
+                           register_resume_callback)
 
 from config import (OGE_SUBJECT_LIST, EGE_SUBJECT_LIST, OGE_SUBJECTS, EGE_SUBJECTS, 
-                   ALL_SUBJECTS, EXAMS_LIST, STATGRAD_OGE_LIST, ALL_EXAMS_LIST, 
-                   SUBJECT_MAPPING)
+                   ALL_SUBJECTS, SUBJECT_MAPPING, ADMIN_CHAT_IDS)
 
 log = logging.getLogger("FIPI-Bot")
 
@@ -48,6 +57,55 @@ async def status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     status = await get_queue_status()
     await update.message.reply_text(status, reply_markup=kb_main_reply())
 
+async def task_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /task ID - когда задание появилось и когда было видно последний раз"""
+    if not context.args:
+        await update.message.reply_text("ℹ️ Использование: /task ID_задания", reply_markup=kb_main_reply())
+        return
+    task_id = context.args[0].strip().upper()
+    chat_id = str(update.message.from_user.id)
+    urls = store["subscriptions"].get(chat_id) or list(store.get("historical_ids", {}))
+    lines = [f"🆔 Задание {task_id}:"]
+    for url in urls:
+        seen = seen_range(url, task_id)
+        if seen:
+            state = "✅ есть сейчас" if seen["present"] else f"❌ удалено (последний раз {_fmt_ts(seen['last_seen'])})"
+            lines.append(f"📚 {subj_by_url(url)}: с {_fmt_ts(seen['first_seen'])}, {state}")
+    if len(lines) == 1:
+        lines.append("❓ Не найдено в истории ваших предметов")
+    await update.message.reply_text("\n".join(lines), reply_markup=kb_main_reply())
+
+def _fmt_ts(timestamp: str) -> str:
+    try:
+        return datetime.fromisoformat(timestamp).strftime("%d.%m.%Y %H:%M")
+    except ValueError:
+        return timestamp
+
+async def cancel_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /cancel - отменяет парсинги пользователя"""
+    await cancel_my_parsing(update.message, context)
+
+async def cancel_all_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /cancel_all - отменяет все парсинги (только администратор)"""
+    chat_id = str(update.message.from_user.id)
+    if chat_id not in [str(admin_id) for admin_id in ADMIN_CHAT_IDS]:
+        await update.message.reply_text("⛔ Команда доступна только администратору.", reply_markup=kb_main_reply())
+        return
+
+    cancelled = cancel_all_tasks()
+    log.info(f"⛔ Администратор {chat_id} отменил все задачи: {cancelled}")
+    await update.message.reply_text(f"⛔ Отменено задач: {cancelled}", reply_markup=kb_main_reply())
+
+async def cancel_my_parsing(message: Message, context: ContextTypes.DEFAULT_TYPE):
+    """Отменяет активные парсинги пользователя"""
+    chat_id = str(message.from_user.id)
+    cancelled = cancel_user_tasks(chat_id)
+
+    if cancelled:
+        await message.reply_text(f"⛔ Отменено парсингов: {cancelled}", reply_markup=kb_main_reply())
+    else:
+        await message.reply_text("📭 У вас нет активных парсингов.", reply_markup=kb_main_reply())
+
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик текстовых сообщений (Reply кнопки)"""
     message: Message = update.message
@@ -64,6 +122,11 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         await handle_cache_choice(message, context, text)
         return
 
+    # ПРИОРИТЕТ 1.5: Ввод даты для "изменений с даты"
+    if context.user_data.get("waiting_for_history_date"):
+        await handle_history_date(message, context, text)
+        return
+
     # ПРИОРИТЕТ 2: Обработка выбора предмета пользователем
     if context.user_data.get("waiting_for_subject"):
         await handle_user_subject_action(message, context, text)
@@ -88,9 +151,17 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         await show_unsubscribe_menu(message, context)
     elif text == "📋 Мои подписки":
         await show_my_subscriptions(message, context)
+    elif text == "🔔 Режим уведомлений":
+        await toggle_notify_mode(message, context)
+    elif text == "📢 Уведомления в личку":
+        await toggle_channel_dm(message, context)
     elif text == "ℹ️ Статус очереди":
         status = await get_queue_status()
         await message.reply_text(status, reply_markup=kb_main_reply())
+    elif text == "🕓 Изменения с даты":
+        await show_history_menu(message, context)
+    elif text == "⛔ Отменить парсинг":
+        await cancel_my_parsing(message, context)
     elif text == "📅 Расписание и напоминания":
         await show_reminders_menu(message, context)
     elif text == "📝 Подписаться на предметы":
@@ -148,7 +219,7 @@ async def handle_cache_choice(message: Message, context: ContextTypes.DEFAULT_TY
 
     if text == "📁 Использовать готовый результат":
         if operation == "Создание файла ID":
-            result = set(cached_data["result"])
+            result = IdSet.from_store(cached_data["result"])
             await send_cached_ids_file(message, result, url, cached_data["timestamp"])
         elif operation == "Сравнение ID":
             await message.reply_text(
@@ -206,9 +277,14 @@ async def start_new_parsing(message: Message, context: ContextTypes.DEFAULT_TYPE
             self.status_message = status_message
             self.from_user = message.from_user
 
-        async def edit_message_text(self, text, reply_markup=None):
+        async def edit_message_text(self, text, reply_markup=None, raise_on_flood=False):
             try:
                 await self.status_message.edit_text(text)
+            except RetryAfter as e:
+                # При flood limit новое сообщение только усугубит ситуацию
+                if raise_on_flood:
+                    raise
+                log.warning(f"Flood limit при редактировании сообщения: {e}")
             except Exception as e:
                 log.warning(f"Ошибка редактирования сообщения: {e}")
                 await self.message.reply_text(text)
@@ -221,6 +297,9 @@ async def start_new_parsing(message: Message, context: ContextTypes.DEFAULT_TYPE
     elif operation == "Сравнение ID":
         context.user_data["cmp_map"] = {"0": url}
         await queue_parsing_task(editable_query, context, "cmp_0", operation, compare_ids_now_result)
+    elif operation == BATCH_OPERATION:
+        context.user_data["ids_map"] = {"0": url}
+        await queue_parsing_task(editable_query, context, "ids_0", operation, send_batch_ids_result)
 
 async def show_subscriptions_menu(message: Message, context: ContextTypes.DEFAULT_TYPE):
     """Показывает меню подписок"""
@@ -229,6 +308,37 @@ async def show_subscriptions_menu(message: Message, context: ContextTypes.DEFAUL
         reply_markup=kb_subscriptions_menu_reply()
     )
 
+async def toggle_notify_mode(message: Message, context: ContextTypes.DEFAULT_TYPE):
+    """Переключает режим уведомлений об изменениях: сводкой или сразу"""
+    chat_id = str(message.from_user.id)
+    mode = "instant" if get_notify_mode(chat_id) == "digest" else "digest"
+    set_notify_mode(chat_id, mode)
+    hint = ("Изменения по всем предметам придут одним сообщением и одним файлом"
+            if mode == "digest" else "Каждое изменение придет отдельным сообщением")
+    await message.reply_text(
+        f"🔔 Режим уведомлений: {NOTIFY_MODES[mode]}\n{hint}",
+        reply_markup=kb_subscriptions_menu_reply()
+    )
+
+async def toggle_channel_dm(message: Message, context: ContextTypes.DEFAULT_TYPE):
+    """Включает или выключает личные уведомления по предметам, у которых есть канал"""
+    chat_id = str(message.from_user.id)
+    channels = sorted({channel_for(url) for url in store["subscriptions"].get(chat_id, [])} - {None})
+    if not channels:
+        await message.reply_text(
+            "ℹ️ У ваших предметов нет каналов - уведомления и так приходят в личные сообщения",
+            reply_markup=kb_subscriptions_menu_reply()
+        )
+        return
+    enabled = not get_dm_enabled(chat_id)
+    set_dm_enabled(chat_id, enabled)
+    state = "включены" if enabled else "выключены"
+    await message.reply_text(
+        f"📢 Личные уведомления по предметам с каналом {state}\n"
+        f"Каналы: {', '.join(channels)}",
+        reply_markup=kb_subscriptions_menu_reply()
+    )
+
 def extract_subject_from_fipi_selection(text: str) -> str:
     """Извлекает название предмета из выбора ФИПИ для сопоставления с расписанием"""
     if text.startswith("ОГЭ "):
@@ -271,11 +381,16 @@ async def handle_subject_selection(message: Message, context: ContextTypes.DEFAU
         )
     else:
         subs.append(url)
+        hint = channel_hint(url)
+        if hint and not get_dm_enabled(chat_id):
+            await message.reply_text(f"{hint}\n"
+                                     f"Личные уведомления: «📢 Уведомления в личку» в меню подписок")
         
         # НОВАЯ ЛОГИКА: Автоматическая подписка на Статград
         mapped_subject = extract_subject_from_fipi_selection(text)
         if mapped_subject:
             statgrad_added = add_statgrad_subscription(chat_id, mapped_subject)
+            invalidate_subscribers()
             if statgrad_added:
                 save_store(store)
                 await message.reply_text(
@@ -316,7 +431,8 @@ async def show_my_subscriptions(message: Message, context: ContextTypes.DEFAULT_
         if subs:
             text_lines.append("📚 Ваши подписки на ФИПИ и пробники:")
             for i, url in enumerate(subs, 1):
-                text_lines.append(f"{i}. {subj_by_url(url)}")
+                channel = channel_for(url)
+                text_lines.append(f"{i}. {subj_by_url(url)}" + (f" (📢 {channel})" if channel else ""))
         
         if statgrad_subs:
             if subs:
@@ -331,7 +447,7 @@ async def show_my_subscriptions(message: Message, context: ContextTypes.DEFAULT_
         )
 
 async def show_task_counts(message: Message, context: ContextTypes.DEFAULT_TYPE):
-    """ИСПРАВЛЕННАЯ ВЕРСИЯ - НЕ БЛОКИРУЕТ БОТ"""
+    """Количество заданий из кэша - браузер запускается только для неизвестных значений"""
     chat_id = str(message.from_user.id)
     subs = store["subscriptions"].get(chat_id, [])
     
@@ -342,28 +458,34 @@ async def show_task_counts(message: Message, context: ContextTypes.DEFAULT_TYPE)
         )
         return
 
-    msg = await message.reply_text("📊 Получение данных...")
+    # Неизвестные значения получаем сразу (общие обновления для одинаковых URL)
+    missing = [url for url in subs if get_cached_count(url)[0] is None]
+    if missing:
+        msg = await message.reply_text(f"📊 Получение данных... (0/{len(missing)})")
+        for i, coro in enumerate(asyncio.as_completed([refresh_count(url) for url in missing]), 1):
+            try:
+                await coro
+            except Exception as e:
+                log.error(f"Ошибка получения количества: {e}")
+            await msg.edit_text(f"📊 Получение данных... ({i}/{len(missing)})")
 
     lines = ["📊 Текущее количество заданий:"]
-
-    # ПАРАЛЛЕЛЬНОЕ ВЫПОЛНЕНИЕ - НЕ БЛОКИРУЕТ БОТ
-    tasks = []
+    updating = False
     for url in subs:
-        task = asyncio.get_event_loop().run_in_executor(None, get_current_count, url)
-        tasks.append((url, task))
-
-    # Обрабатываем результаты по мере готовности  
-    for i, (url, task) in enumerate(tasks, 1):
-        try:
-            await msg.edit_text(f"📊 Получение данных... ({i}/{len(subs)})")
-            cnt = await task
-            lines.append(f"• {subj_by_url(url)}: {cnt if cnt is not None else 'не получено'}")
-        except Exception as e:
-            log.error(f"Ошибка получения количества для {url}: {e}")
-            lines.append(f"• {subj_by_url(url)}: ошибка")
+        cnt, age = get_cached_count(url)
+        # Только что не полученные значения повторно не запрашиваем
+        if cnt is not None and revalidate_if_stale(url):
+            updating = True
+        if cnt is None:
+            lines.append(f"• {subj_by_url(url)}: не получено")
+        elif age is None:
+            lines.append(f"• {subj_by_url(url)}: {cnt}")
+        else:
+            lines.append(f"• {subj_by_url(url)}: {cnt} ({format_time_diff(int(age))} назад)")
 
-    await msg.edit_text("\n".join(lines))
-    await message.reply_text("✅ Данные обновлены", reply_markup=kb_main_reply())
+    if updating:
+        lines.append("\n🔄 Устаревшие значения обновляются, запросите позже")
+    await message.reply_text("\n".join(lines), reply_markup=kb_main_reply())
 
 async def show_ids_menu(message: Message, context: ContextTypes.DEFAULT_TYPE):
     """Показывает меню для создания файла ID"""
@@ -384,6 +506,68 @@ async def show_ids_menu(message: Message, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=kb_user_subjects_reply(subs, "ids")
     )
 
+async def show_history_menu(message: Message, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает меню "изменения с даты" (по истории, без парсинга)"""
+    chat_id = str(message.from_user.id)
+    subs = store["subscriptions"].get(chat_id, [])
+
+    if not subs:
+        await message.reply_text("📭 У вас нет подписок.", reply_markup=kb_main_reply())
+        return
+
+    context.user_data["waiting_for_subject"] = "history"
+    await message.reply_text(
+        "🕓 Выберите предмет, чтобы увидеть изменения с указанной даты:",
+        reply_markup=kb_user_subjects_reply(subs, "history")
+    )
+
+async def handle_history_date(message: Message, context: ContextTypes.DEFAULT_TYPE, text: str):
+    """Отвечает на "изменения с даты" по индексу истории"""
+    if text == "⬅ Назад в меню":
+        context.user_data.clear()
+        await message.reply_text("🏠 Главное меню:", reply_markup=kb_main_reply())
+        return
+    try:
+        since = datetime.strptime(text.strip(), "%d.%m.%Y")
+    except ValueError:
+        await message.reply_text("❓ Не понял дату. Формат: ДД.ММ.ГГГГ, например 01.10.2025")
+        return
+
+    url = context.user_data.pop("waiting_for_history_date")
+    context.user_data.clear()
+    diff = diff_between(url, since)
+    if diff is None:
+        await message.reply_text(f"📭 Для {subj_by_url(url)} еще нет истории парсинга",
+                                 reply_markup=kb_main_reply())
+        return
+
+    added, removed = diff["added"], diff["removed"]
+    lines = [f"🕓 {subj_by_url(url)}",
+             f"📅 С {_fmt_ts(diff['from'])} по {_fmt_ts(diff['to'])}"]
+    if since.isoformat() < diff["from"]:
+        lines.append(f"ℹ️ История начинается с {_fmt_ts(diff['from'])}")
+    if not added and not removed:
+        lines.append("🔄 Состав ID не изменился")
+        await message.reply_text("\n".join(lines), reply_markup=kb_main_reply())
+        return
+    lines.append(f"➕ Добавлено: {len(added)} ID\n➖ Удалено: {len(removed)} ID\n🆔 Сейчас: {diff['total']} ID")
+    await message.reply_text("\n".join(lines), reply_markup=kb_main_reply())
+
+    fname = f"changes_{url.split('=')[-1]}_{since.strftime('%Y-%m-%d')}.txt"
+    with open(fname, "w", encoding="utf-8") as f:
+        if added:
+            f.write(f"➕ ДОБАВЛЕНЫ ID ({len(added)}):\n" + "".join(t + "\n" for t in added) + "\n")
+        if removed:
+            f.write(f"➖ УДАЛЕНЫ ID ({len(removed)}):\n" + "".join(t + "\n" for t in removed))
+    try:
+        with open(fname, "rb") as f:
+            await message.reply_document(f, filename=fname, caption=f"🕓 {subj_by_url(url)}: изменения с {text.strip()}")
+    finally:
+        try:
+            os.remove(fname)
+        except OSError:
+            pass
+
 async def show_compare_menu(message: Message, context: ContextTypes.DEFAULT_TYPE):
     """Показывает меню для сравнения ID"""
     chat_id = str(message.from_user.id)
@@ -433,7 +617,12 @@ async def handle_user_subject_action(message: Message, context: ContextTypes.DEF
 
     chat_id = str(message.from_user.id)
     subs = store["subscriptions"].get(chat_id, [])
-    
+
+    if action == "ids" and text == BATCH_BUTTON and subs:
+        context.user_data.clear()
+        await start_batch_ids_parsing(message, context, subs)
+        return
+
     url = None
     for sub_url in subs:
         if subj_by_url(sub_url) == text:
@@ -451,9 +640,17 @@ async def handle_user_subject_action(message: Message, context: ContextTypes.DEF
 
     if action == "unsubscribe":
         await process_unsubscribe(message, context, url)
+    elif action == "history":
+        context.user_data.clear()
+        context.user_data["waiting_for_history_date"] = url
+        await message.reply_text(
+            f"🕓 {subj_by_url(url)}\nВведите дату в формате ДД.ММ.ГГГГ (например, 01.10.2025):",
+            reply_markup=kb_user_subjects_reply([], "history")
+        )
+        return
     else:
         if operation in ["Создание файла ID", "Сравнение ID"]:
-            cached = get_recent_parsing(url, operation)
+            cached = get_recent_parsing(url, operation, current_count=get_cached_count(url)[0])
             if cached:
                 try:
                     dt = datetime.fromisoformat(cached["timestamp"])
@@ -471,7 +668,7 @@ async def handle_user_subject_action(message: Message, context: ContextTypes.DEF
                     f"📚 {subj_by_url(url)}\n"
                     f"🕒 Время парсинга: {time_str}\n"
                     f"📋 Операция: {operation}\n"
-                    f"🆔 Найдено ID: {len(cached['result'])}\n\n"
+                    f"🆔 Найдено ID: {len(IdSet.from_store(cached['result']))}\n\n"
                     f"Что хотите сделать?",
                     reply_markup=kb_cached_result_choice()
                 )
@@ -488,6 +685,17 @@ async def start_ids_parsing(message: Message, context: ContextTypes.DEFAULT_TYPE
     """Запускает парсинг ID"""
     await start_new_parsing(message, context, url, "Создание файла ID")
 
+async def start_batch_ids_parsing(message: Message, context: ContextTypes.DEFAULT_TYPE, subs: list):
+    """Запускает одну задачу на все предметы пользователя (готовые результаты берутся из кэша)"""
+    missing = [url for url in subs
+               if not get_recent_parsing(url, "Создание файла ID", current_count=get_cached_count(url)[0])]
+    if not missing:
+        await send_batch_archive(message, str(message.from_user.id), {}, {})
+        return
+    if len(missing) < len(subs):
+        await message.reply_text(f"📁 Из кэша: {len(subs) - len(missing)}, парсинг: {len(missing)} предметов")
+    await start_new_parsing(message, context, batch_target(missing), BATCH_OPERATION)
+
 async def start_compare_parsing(message: Message, context: ContextTypes.DEFAULT_TYPE, url: str):
     """Запускает сравнение ID"""
     await start_new_parsing(message, context, url, "Сравнение ID")
@@ -517,6 +725,7 @@ async def process_unsubscribe(message: Message, context: ContextTypes.DEFAULT_TY
         # Если больше нет подписок на этот предмет, отписываем от Статграда
         if mapped_subject and not still_subscribed_to_subject:
             statgrad_removed = remove_statgrad_subscription(chat_id, mapped_subject)
+            invalidate_subscribers()
             if statgrad_removed:
                 save_store(store)
                 await message.reply_text(
@@ -543,16 +752,13 @@ async def process_unsubscribe(message: Message, context: ContextTypes.DEFAULT_TY
         )
 
 async def send_ids_file_result(query, context: ContextTypes.DEFAULT_TYPE, ids: set, url: str):
-    """Отправляет файл с ID заданий и сохраняет в кэш"""
+    """Отправляет файл с ID заданий (в кэш результат сохраняет менеджер очереди)"""
     fname = f"ids_{url.split('=')[-1]}.txt"
     
     with open(fname, "w", encoding="utf-8") as f:
         for t in sorted(ids):
             f.write(t + "\n")
 
-    # Сохраняем в кэш
-    save_parsing_result(url, "Создание файла ID", ids, str(query.from_user.id))
-
     # Обновляем статусное сообщение
     await query.edit_message_text("✅ Парсинг завершен! Отправляю файл...")
 
@@ -569,12 +775,51 @@ async def send_ids_file_result(query, context: ContextTypes.DEFAULT_TYPE, ids: s
     except:
         pass
 
+async def send_batch_ids_result(query, context: ContextTypes.DEFAULT_TYPE, result: dict, url: str):
+    """Отправляет архив по результату пакетного парсинга"""
+    await query.edit_message_text("✅ Парсинг завершен! Собираю архив...")
+    await send_batch_archive(query.message, str(query.from_user.id), result["subjects"], result["failed"])
+
+async def send_batch_archive(message, chat_id: str, parsed: dict, failed: dict):
+    """Собирает архив из свежих результатов и кэша по всем подпискам пользователя"""
+    subs = store["subscriptions"].get(chat_id, [])
+    subjects = {}
+    from_cache = 0
+    for url in subs + [u for u in parsed if u not in subs]:
+        ids = parsed.get(url)
+        if ids is None and url not in failed:
+            cached = get_recent_parsing(url, "Создание файла ID", current_count=get_cached_count(url)[0])
+            if cached:
+                ids = IdSet.from_store(cached["result"])
+                from_cache += 1
+        if ids is not None:
+            subjects[subj_by_url(url)] = ids
+
+    if not subjects:
+        await message.reply_text("❌ Не удалось получить ID ни по одному предмету", reply_markup=kb_main_reply())
+        return
+
+    caption = [f"📦 Файлы ID по {len(subjects)} предметам"]
+    caption += [f"• {name}: {len(ids)} ID" for name, ids in subjects.items()]
+    if from_cache:
+        caption.append(f"📁 Из кэша: {from_cache}")
+    if failed:
+        caption.append(f"⚠️ Не удалось: {', '.join(subj_by_url(u) for u in failed)}")
+
+    fname = write_archive(archive_name(chat_id), subjects)
+    try:
+        with open(fname, "rb") as f:
+            await message.reply_document(f, filename=fname, caption="\n".join(caption)[:1024])
+        await message.reply_text("✅ Архив отправлен!", reply_markup=kb_main_reply())
+    finally:
+        remove_archive(fname)
+
 async def compare_ids_now_result(query, context: ContextTypes.DEFAULT_TYPE, result: tuple, url: str):
     """Обрабатывает результат сравнения ID"""
-    current_ids, added, removed = result
+    current_ids, added, removed, edited = result
     timestamp = datetime.now().isoformat()
 
-    if not added and not removed:
+    if not added and not removed and not edited:
         await query.edit_message_text("🔄 Парсинг завершен. Изменений не найдено.")
         await query.message.reply_text(
             "🔄 Изменений нет.",
@@ -592,6 +837,10 @@ async def compare_ids_now_result(query, context: ContextTypes.DEFAULT_TYPE, resu
             txt_lines.append(f"➖ Удалены ({len(removed)}): " + ", ".join(sorted(list(removed)[:10])))
             if len(removed) > 10:
                 txt_lines.append(f" ... и ещё {len(removed) - 10}")
+        if edited:
+            txt_lines.append(f"✏️ Изменены ({len(edited)}): " + ", ".join(list(edited)[:10]))
+            if len(edited) > 10:
+                txt_lines.append(f" ... и ещё {len(edited) - 10}")
 
         txt = "\n".join(txt_lines)
         messages = split_message(txt)
@@ -601,6 +850,11 @@ async def compare_ids_now_result(query, context: ContextTypes.DEFAULT_TYPE, resu
         await send_changes_file(query, context, url, added, removed, timestamp)
         await query.message.reply_text("✅ Результаты отправлены!", reply_markup=kb_main_reply())
 
+# Колбэки результата для задач, продолженных после перезапуска бота
+register_resume_callback("Создание файла ID", send_ids_file_result)
+register_resume_callback("Сравнение ID", compare_ids_now_result)
+register_resume_callback(BATCH_OPERATION, send_batch_ids_result)
+
 async def on_shutdown(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Очищает ресурсы при остановке бота."""
     log.info("Остановка бота, очистка ресурсов")
@@ -628,6 +882,7 @@ async def handle_reminder_subscription(message: Message, context: ContextTypes.D
         await message.reply_text(f"✅ Подписка на {text}", reply_markup=kb_reminders_menu())
     
     save_store(store)
+    invalidate_subscribers()
     context.user_data.clear()
 
 async def show_my_reminder_subs(message: Message, context: ContextTypes.DEFAULT_TYPE):
@@ -643,8 +898,8 @@ async def show_my_reminder_subs(message: Message, context: ContextTypes.DEFAULT_
     context.user_data.clear()
 
 async def show_schedule_by_subject(message: Message, context: ContextTypes.DEFAULT_TYPE, text: str):
-    # Объединяем все экзамены по предмету
-    subject_exams = [exam for exam in ALL_EXAMS_LIST if exam["subject"] == text]
+    # Все экзамены по предмету, уже отсортированные по дате
+    subject_exams = exams_for_subject(text)
     
     if not subject_exams:
         await message.reply_text(f"Нет расписания для {text}.", reply_markup=kb_reminders_menu())
@@ -652,19 +907,19 @@ async def show_schedule_by_subject(message: Message, context: ContextTypes.DEFAU
 
     msg_text = f"📅 Расписание для {text}:\n\n"
     
-    # Сортируем по дате и группируем по типам экзаменов
+    # Группируем по типам экзаменов
     ege_exams = [e for e in subject_exams if e.get("grade") != 9]
     oge_exams = [e for e in subject_exams if e.get("grade") == 9]
     
     if ege_exams:
         msg_text += "🎓 ЕГЭ (11 класс):\n"
-        for exam in sorted(ege_exams, key=lambda x: x["date"]):
+        for exam in ege_exams:
             msg_text += f"• {exam['date'].strftime('%d.%m.%Y')}: {exam['title']}\n"
         msg_text += "\n"
     
     if oge_exams:
         msg_text += "📝 ОГЭ (9 класс):\n"
-        for exam in sorted(oge_exams, key=lambda x: x["date"]):
+        for exam in oge_exams:
             msg_text += f"• {exam['date'].strftime('%d.%m.%Y')}: {exam['title']}\n"
 
     await message.reply_text(msg_text, reply_markup=kb_reminders_menu())
@@ -672,46 +927,10 @@ async def show_schedule_by_subject(message: Message, context: ContextTypes.DEFAU
 
 # Функция для ежедневных напоминаний (обновленная)
 async def send_notification(context: ContextTypes.DEFAULT_TYPE):
-    """Функция, которая проверяет даты и рассылает уведомления."""
-    today = date.today()
-    bot = context.bot
-
-    # Проверяем ЕГЭ экзамены (старая логика)
-    for exam in EXAMS_LIST:
-        days_until = (exam["date"] - today).days
-        
-        if days_until in (1, 7):
-            message_text = f"🔔 Напоминание! Через {days_until} день(дня) состоится:\n{exam['title']}"
-            
-            subscribers = []
-            for chat_id, subjects in store.get("reminder_subscriptions", {}).items():
-                if exam["subject"] in subjects:
-                    subscribers.append(chat_id)
-
-            for user_id in subscribers:
-                try:
-                    await bot.send_message(chat_id=user_id, text=message_text)
-                    log.info(f"Уведомление ЕГЭ отправлено пользователю {user_id} о {exam['subject']}")
-                except Exception as e:
-                    log.error(f"Ошибка отправки ЕГЭ уведомления пользователю {user_id}: {e}")
-                await asyncio.sleep(0.1)
-
-    # НОВОЕ: Проверяем Статград экзамены
-    for exam in STATGRAD_OGE_LIST:
-        days_until = (exam["date"] - today).days
-        
-        if days_until in (1, 7):
-            message_text = f"🎯 Статград через {days_until} день(дня)!\n📚 {exam['title']}"
-            
-            subscribers = []
-            for chat_id, subjects in store.get("statgrad_subscriptions", {}).items():
-                if exam["subject"] in subjects:
-                    subscribers.append(chat_id)
-
-            for user_id in subscribers:
-                try:
-                    await bot.send_message(chat_id=user_id, text=message_text)
-                    log.info(f"Уведомление Статград отправлено пользователю {user_id} о {exam['subject']}")
-                except Exception as e:
-                    log.error(f"Ошибка отправки Статград уведомления пользователю {user_id}: {e}")
-                await asyncio.sleep(0.1)
+    """Рассылает напоминания: одно сообщение на пользователя со всеми работами дня"""
+    per_chat = build_daily_reminders(date.today())
+    if not per_chat:
+        return
+    messages = {chat_id: "\n\n".join(lines) for chat_id, lines in per_chat.items()}
+    delivered = await send_many(context.bot, messages)
+    log.info(f"🔔 Напоминания отправлены: {delivered}/{len(messages)} пользователей")
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Состояние сайтов ФИПИ и автоматический выключатель (circuit breaker) по хостам
+
+После HOST_BREAKER_FAILURES неудач подряд хост считается недоступным: проверки
+пропускаются, парсинги ждут. По истечении паузы пропускается один пробный
+запрос (half-open): успех закрывает выключатель, неудача удваивает паузу.
+Состояние хранится в файле и общее для бота и воркеров.
+"""
+import logging
+import random
+import time
+from urllib.parse import urlparse
+
+from shared_state import locked_json, read_json
+from config import (HOST_STATE_FILE, HOST_BREAKER_FAILURES, HOST_BREAKER_BASE_DELAY,
+                    HOST_BREAKER_MAX_DELAY, INITIAL_RETRY_DELAY, RETRY_DELAY_MULTIPLIER)
+
+log = logging.getLogger("FIPI-Bot")
+
+# Пробный запрос, не отчитавшийся за это время, считается потерянным
+HALF_OPEN_PROBE_TIMEOUT = 300
+
+
+class HostUnavailable(Exception):
+    """Сайт временно недоступен (выключатель разомкнут)"""
+
+
+def host_of(url: str) -> str:
+    return urlparse(url).netloc or url
+
+
+def _entry(state: dict, host: str) -> dict:
+    return state.setdefault(host, {"state": "closed", "failures": 0, "opens": 0,
+                                   "retry_at": 0.0, "probe_at": 0.0, "last_error": ""})
+
+
+def _open(entry: dict, now: float):
+    """Размыкает выключатель с экспоненциальной паузой и случайным разбросом"""
+    entry["opens"] += 1
+    delay = min(HOST_BREAKER_BASE_DELAY * 2 ** (entry["opens"] - 1), HOST_BREAKER_MAX_DELAY)
+    entry["state"] = "open"
+    entry["retry_at"] = now + delay * random.uniform(0.8, 1.2)
+
+
+def allow_request(url: str) -> bool:
+    """Можно ли обращаться к хосту (при истечении паузы разрешает один пробный запрос)"""
+    host = host_of(url)
+    now = time.time()
+    with locked_json(HOST_STATE_FILE) as state:
+        entry = _entry(state, host)
+        if entry["state"] == "closed":
+            return True
+        if entry["state"] == "open" and now >= entry["retry_at"]:
+            entry["state"] = "half_open"
+            entry["probe_at"] = now
+            log.info(f"🔌 {host}: пробный запрос после паузы")
+            return True
+        if entry["state"] == "half_open" and now - entry["probe_at"] > HALF_OPEN_PROBE_TIMEOUT:
+            entry["probe_at"] = now
+            return True
+        return False
+
+
+def record_success(url: str):
+    host = host_of(url)
+    with locked_json(HOST_STATE_FILE) as state:
+        entry = _entry(state, host)
+        if entry["state"] != "closed":
+            log.info(f"✅ {host}: сайт снова доступен")
+        entry.update(state="closed", failures=0, opens=0, retry_at=0.0, probe_at=0.0)
+
+
+def record_failure(url: str, error: str = ""):
+    host = host_of(url)
+    now = time.time()
+    with locked_json(HOST_STATE_FILE) as state:
+        entry = _entry(state, host)
+        entry["failures"] += 1
+        entry["last_error"] = str(error)[:200]
+        if entry["state"] == "half_open" or (
+                entry["state"] == "closed" and entry["failures"] >= HOST_BREAKER_FAILURES):
+            _open(entry, now)
+            log.warning(f"🔌 {host}: сайт недоступен ({entry['failures']} ошибок подряд), "
+                        f"пауза {entry['retry_at'] - now:.0f} сек")
+
+
+def is_open(url: str) -> bool:
+    """Хост на паузе (без изменения состояния - для решения, стоит ли начинать проверку)"""
+    entry = read_json(HOST_STATE_FILE).get(host_of(url))
+    if not entry:
+        return False
+    now = time.time()
+    if entry["state"] == "open":
+        return now < entry["retry_at"]
+    if entry["state"] == "half_open":
+        return now - entry["probe_at"] <= HALF_OPEN_PROBE_TIMEOUT
+    return False
+
+
+def retry_in(url: str) -> float:
+    """Сколько секунд до следующей попытки"""
+    entry = read_json(HOST_STATE_FILE).get(host_of(url))
+    if not entry or entry["state"] == "closed":
+        return 0.0
+    return max(0.0, entry["retry_at"] - time.time())
+
+
+def backoff_delay(attempt: int) -> float:
+    """Пауза перед повтором: экспоненциальная, со случайным разбросом"""
+    delay = INITIAL_RETRY_DELAY * RETRY_DELAY_MULTIPLIER ** max(0, attempt - 1)
+    return min(delay, 60) * random.uniform(0.5, 1.0)
+
+
+def get_hosts_status() -> dict:
+    """Состояние всех известных хостов"""
+    return read_json(HOST_STATE_FILE)
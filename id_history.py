@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Запросы к истории наборов ID: состав на момент T, разница между датами,
+когда задание появилось и когда было видно последний раз
+
+store["historical_ids"][url] - записи {"timestamp", "checked", "ids"} по
+возрастанию времени; новая запись появляется только при изменении состава
+("checked" - последний проход с тем же составом). Для каждого URL строится
+индекс: отсортированные метки времени (поиск записи на момент T - бинарный)
+и интервалы присутствия каждого ID. Индекс дополняется только новыми
+записями, полный пересчет - лишь после очистки старой истории.
+"""
+import logging
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database import store
+from id_set import IdSet
+
+log = logging.getLogger("FIPI-Bot")
+
+# URL -> индекс истории
+_indexes: Dict[str, dict] = {}
+
+
+def _new_index() -> dict:
+    return {
+        "timestamps": [],
+        "checked": [],
+        "presence": {},  # ID -> [[первое появление, последний проход или None]]
+        "last": IdSet(),
+    }
+
+
+def _extend(index: dict, entries: list):
+    """Добавляет записи в индекс: обрабатываются только изменения состава"""
+    for entry in entries:
+        ids = IdSet.from_store(entry["ids"])
+        added, removed = ids.changes_since(index["last"])
+        timestamp = entry["timestamp"]
+        previous_checked = index["checked"][-1] if index["checked"] else timestamp
+        for task_id in added:
+            index["presence"].setdefault(task_id, []).append([timestamp, None])
+        for task_id in removed:
+            index["presence"][task_id][-1][1] = previous_checked
+        index["timestamps"].append(timestamp)
+        index["checked"].append(entry.get("checked", timestamp))
+        index["last"] = ids
+
+
+def get_index(url: str) -> Optional[dict]:
+    """Индекс истории URL (дополняется при появлении новых записей)"""
+    history = store.get("historical_ids", {}).get(url)
+    if not history:
+        _indexes.pop(url, None)
+        return None
+    index = _indexes.get(url)
+    known = len(index["timestamps"]) if index else 0
+    if (index is None or len(history) < known
+            or [e["timestamp"] for e in history[:known]] != index["timestamps"]):
+        index = _new_index()
+        known = 0
+        _indexes[url] = index
+    if len(history) > known:
+        _extend(index, history[known:])
+    # Последняя запись могла подтвердиться новым проходом
+    index["checked"][-1] = history[-1].get("checked", history[-1]["timestamp"])
+    return index
+
+
+def ids_at(url: str, when: datetime) -> Optional[dict]:
+    """Состав на момент when: {"timestamp": время записи, "ids": IdSet} или None"""
+    index = get_index(url)
+    if index is None:
+        return None
+    pos = bisect_right(index["timestamps"], when.isoformat()) - 1
+    if pos < 0:
+        return None
+    entry = store["historical_ids"][url][pos]
+    return {"timestamp": entry["timestamp"], "ids": IdSet.from_store(entry["ids"])}
+
+
+def diff_between(url: str, start: datetime, end: datetime = None) -> Optional[dict]:
+    """Разница между составом на start и на end (по умолчанию - последним)
+
+    Если start раньше начала истории, сравнение идет с самой старой записью.
+    """
+    index = get_index(url)
+    if index is None:
+        return None
+    before = ids_at(url, start)
+    if before is None:
+        entry = store["historical_ids"][url][0]
+        before = {"timestamp": entry["timestamp"], "ids": IdSet.from_store(entry["ids"])}
+    after = ids_at(url, end or datetime.now())
+    added, removed = after["ids"].changes_since(before["ids"])
+    return {"from": before["timestamp"], "to": after["timestamp"],
+            "added": added, "removed": removed, "total": len(after["ids"])}
+
+
+def seen_range(url: str, task_id: str) -> Optional[dict]:
+    """Когда задание появилось и когда было видно последний раз
+
+    {"first_seen", "last_seen", "present", "intervals"} или None, если ID не встречался.
+    """
+    index = get_index(url)
+    if index is None or task_id not in index["presence"]:
+        return None
+    intervals: List[list] = [[start, end or index["checked"][-1]]
+                             for start, end in index["presence"][task_id]]
+    return {
+        "first_seen": intervals[0][0],
+        "last_seen": intervals[-1][1],
+        "present": index["presence"][task_id][-1][1] is None,
+        "intervals": intervals,
+    }
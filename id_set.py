@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Компактное множество ID заданий ФИПИ
+
+ID - шестнадцатеричные строки одной длины (например, "4A7C1F"). Они хранятся
+отсортированным массивом 64-битных чисел, разность и пересечение считаются
+слиянием за линейное время. Для хранилища и передачи между процессами массив
+сериализуется разностями соседних значений со сжатием zlib и base64.
+
+ID другого вида (строчные буквы, разная длина) хранятся отсортированным
+списком строк - поведение то же, только без экономии памяти.
+
+Проверка совместимости со строковыми множествами: python id_set.py
+"""
+import base64
+import re
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Iterable, List, Optional, Set, Tuple
+
+HEX_ID = re.compile(r"[0-9A-F]{1,16}")
+
+STORE_VERSION = 1
+
+
+def _merge_difference(a, b) -> list:
+    """Элементы отсортированной последовательности a, которых нет в b"""
+    result = []
+    i = j = 0
+    len_a, len_b = len(a), len(b)
+    while i < len_a:
+        if j >= len_b:
+            result.extend(a[i:])
+            break
+        x, y = a[i], b[j]
+        if x < y:
+            result.append(x)
+            i += 1
+        elif x > y:
+            j += 1
+        else:
+            i += 1
+            j += 1
+    return result
+
+
+def _merge_intersection(a, b) -> list:
+    """Общие элементы двух отсортированных последовательностей"""
+    result = []
+    i = j = 0
+    len_a, len_b = len(a), len(b)
+    while i < len_a and j < len_b:
+        x, y = a[i], b[j]
+        if x < y:
+            i += 1
+        elif x > y:
+            j += 1
+        else:
+            result.append(x)
+            i += 1
+            j += 1
+    return result
+
+
+class IdSet:
+    """Неизменяемое отсортированное множество ID"""
+
+    __slots__ = ("width", "values")
+
+    def __init__(self, ids: Iterable[str] = ()):
+        ids = set(ids)
+        widths = {len(i) for i in ids}
+        if len(widths) <= 1 and all(HEX_ID.fullmatch(i) for i in ids):
+            self.width = widths.pop() if widths else 0
+            self.values = array("Q", sorted(int(i, 16) for i in ids))
+        else:
+            self.width = None
+            self.values = sorted(ids)
+
+    @classmethod
+    def _from_sorted(cls, width: Optional[int], values) -> "IdSet":
+        obj = cls.__new__(cls)
+        obj.width = width
+        obj.values = array("Q", values) if width is not None else list(values)
+        return obj
+
+    @property
+    def is_compact(self) -> bool:
+        return self.width is not None
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self):
+        if self.width is None:
+            return iter(self.values)
+        fmt = f"0{self.width}X"
+        return (format(v, fmt) for v in self.values)
+
+    def __contains__(self, task_id: str) -> bool:
+        if self.width is None:
+            key = task_id
+        elif len(task_id) != self.width or not HEX_ID.fullmatch(task_id):
+            return False
+        else:
+            key = int(task_id, 16)
+        pos = bisect_left(self.values, key)
+        return pos < len(self.values) and self.values[pos] == key
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, IdSet):
+            if self.width == other.width:
+                return self.values == other.values
+            return self.to_list() == other.to_list()
+        if isinstance(other, (set, frozenset)):
+            return self.to_set() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"IdSet({len(self)} ID)"
+
+    def to_set(self) -> Set[str]:
+        return set(self)
+
+    def to_list(self) -> List[str]:
+        """ID в отсортированном порядке"""
+        return list(self)
+
+    def _aligned(self, other: "IdSet") -> Tuple[Optional[int], object, object]:
+        """Приводит два множества к общему представлению для слияния"""
+        if self.width is not None and self.width == other.width:
+            return self.width, self.values, other.values
+        if not len(other):
+            return self.width, self.values, []
+        if not len(self):
+            return other.width, [], other.values
+        return None, self.to_list(), other.to_list()
+
+    def difference(self, other: "IdSet") -> "IdSet":
+        width, a, b = self._aligned(other)
+        return IdSet._from_sorted(width, _merge_difference(a, b))
+
+    def intersection(self, other: "IdSet") -> "IdSet":
+        width, a, b = self._aligned(other)
+        return IdSet._from_sorted(width, _merge_intersection(a, b))
+
+    def union(self, other: "IdSet") -> "IdSet":
+        width, a, b = self._aligned(other)
+        return IdSet._from_sorted(width, sorted(set(a).union(b)))
+
+    def changes_since(self, previous: "IdSet") -> Tuple["IdSet", "IdSet"]:
+        """(добавленные, удаленные) относительно предыдущего набора"""
+        return self.difference(previous), previous.difference(self)
+
+    __sub__ = difference
+    __and__ = intersection
+    __or__ = union
+
+    def to_bytes(self) -> bytes:
+        """Сжатое двоичное представление (для файлов и IPC)"""
+        if self.width is None:
+            return b"S" + zlib.compress("\n".join(self.values).encode("utf-8"))
+        deltas = array("Q", (b - a for a, b in zip([0] + list(self.values[:-1]), self.values)))
+        if sys.byteorder == "big":
+            deltas.byteswap()
+        return b"Q" + bytes([self.width]) + zlib.compress(deltas.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "IdSet":
+        if data[:1] == b"S":
+            text = zlib.decompress(data[1:]).decode("utf-8")
+            return cls._from_sorted(None, text.split("\n") if text else [])
+        width = data[1]
+        deltas = array("Q")
+        deltas.frombytes(zlib.decompress(data[2:]))
+        if sys.byteorder == "big":
+            deltas.byteswap()
+        return cls._from_sorted(width, accumulate(deltas))
+
+    def to_store(self) -> dict:
+        """Представление для JSON-хранилища и JSON-протоколов"""
+        return {"v": STORE_VERSION, "n": len(self),
+                "data": base64.b64encode(self.to_bytes()).decode("ascii")}
+
+    @classmethod
+    def from_store(cls, value) -> "IdSet":
+        """Читает to_store() или старый формат - список строк"""
+        if isinstance(value, IdSet):
+            return value
+        if isinstance(value, dict) and "data" in value:
+            return cls.from_bytes(base64.b64decode(value["data"]))
+        return cls(value or [])
+
+
+def _self_check():
+    """Сверка с обычными множествами строк на случайных данных"""
+    import random
+
+    def check(a_ids: set, b_ids: set):
+        a, b = IdSet(a_ids), IdSet(b_ids)
+        assert a.to_set() == a_ids and a == a_ids
+        assert IdSet.from_bytes(a.to_bytes()).to_set() == a_ids
+        assert IdSet.from_store(a.to_store()) == a
+        assert IdSet.from_store(sorted(a_ids)) == a
+        assert (a - b).to_set() == a_ids - b_ids
+        assert (a & b).to_set() == a_ids & b_ids
+        assert (a | b).to_set() == a_ids | b_ids
+        added, removed = a.changes_since(b)
+        assert added.to_set() == a_ids - b_ids and removed.to_set() == b_ids - a_ids
+        assert a.to_list() == sorted(a_ids)
+        for task_id in list(a_ids)[:50] + ["ZZZ", "0"]:
+            assert (task_id in a) == (task_id in a_ids)
+
+    rnd = random.Random(42)
+    for _ in range(200):
+        width = rnd.choice([4, 6, 8])
+        pool = [format(rnd.randrange(16 ** width), f"0{width}X") for _ in range(rnd.randint(0, 400))]
+        a_ids = set(rnd.sample(pool, rnd.randint(0, len(pool))))
+        b_ids = set(rnd.sample(pool, rnd.randint(0, len(pool))))
+        check(a_ids, b_ids)
+    # Нестандартные ID и смешанные представления
+    check({"abc", "0A1B", "ФИПИ"}, {"0A1B", "FFFF"})
+    check({"0A1B", "FFFF"}, {"0A1B2C"})
+    check(set(), {"00FF"})
+    print("✅ IdSet совпадает со строковыми множествами")
+
+
+if __name__ == "__main__":
+    _self_check()
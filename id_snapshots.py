@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Снимки наборов ID в файлах, адресуемых хэшем содержимого
+
+Бот передает воркеру не список ID, а ссылку на снимок {"snapshot": хэш}.
+Воркер читает файл сам, записывает снимок нового набора и возвращает только
+разницу (added/removed) и хэш нового снимка. Одинаковые наборы хранятся один раз.
+"""
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from id_set import IdSet
+from config import SNAPSHOT_DIR
+
+log = logging.getLogger("FIPI-Bot")
+
+# Недавно использованные снимки в памяти процесса (хэш -> IdSet)
+_cache: "OrderedDict[str, IdSet]" = OrderedDict()
+CACHE_SIZE = 32
+
+
+def snapshot_path(digest: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"ids_{digest}.bin")
+
+
+def _remember(digest: str, ids: IdSet):
+    _cache[digest] = ids
+    _cache.move_to_end(digest)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def write_snapshot(ids: IdSet) -> str:
+    """Сохраняет набор (если такого еще нет) и возвращает его хэш"""
+    data = ids.to_bytes()
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    path = snapshot_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    _remember(digest, ids)
+    return digest
+
+
+def read_snapshot(digest: str) -> IdSet:
+    """Читает снимок по хэшу"""
+    ids = _cache.get(digest)
+    if ids is None:
+        with open(snapshot_path(digest), "rb") as f:
+            ids = IdSet.from_bytes(f.read())
+    _remember(digest, ids)
+    return ids
+
+
+def snapshot_ref(ids: IdSet) -> dict:
+    """Ссылка на снимок для хранилища и передачи воркеру"""
+    return {"snapshot": write_snapshot(ids), "n": len(ids)}
+
+
+def load_ids(value) -> IdSet:
+    """Набор ID из ссылки на снимок, IdSet.to_store() или списка строк"""
+    if isinstance(value, dict) and "snapshot" in value:
+        return read_snapshot(value["snapshot"])
+    return IdSet.from_store(value)
+
+
+def clean_snapshots(keep: set, max_age_hours: int = 24) -> int:
+    """Удаляет снимки, на которые нет ссылок и которые старше max_age_hours"""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for name in os.listdir(SNAPSHOT_DIR):
+        if not name.startswith("ids_"):
+            continue
+        digest = name[4:].split(".", 1)[0]
+        path = os.path.join(SNAPSHOT_DIR, name)
+        try:
+            if digest not in keep and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                _cache.pop(digest, None)
+                removed += 1
+        except OSError as e:
+            log.warning(f"⚠️ Не удалось удалить снимок {name}: {e}")
+    return removed
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Общая очередь задач парсинга для распределенных воркеров (Redis или память процесса)
+
+Воркер берет задачу в аренду (lease) и продлевает ее heartbeat'ами. Если воркер
+пропал и аренда истекла, requeue_expired() возвращает задачу в очередь.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from config import JOB_QUEUE_URL, JOB_LEASE_SECONDS, CRAWLER_RESULT_TTL
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+log = logging.getLogger("FIPI-Bot")
+
+
+class LocalJobQueue:
+    """Очередь в памяти процесса - заменяет Redis в тестах и на одном сервере"""
+
+    def __init__(self):
+        self.pending = deque()
+        self.jobs: Dict[str, Dict] = {}
+        self.leases: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def push(self, job: dict) -> bool:
+        """Добавляет задачу; повторная отправка незавершенной задачи игнорируется"""
+        with self.lock:
+            existing = self.jobs.get(job["task_id"])
+            if existing and existing["status"] != "done":
+                return False
+            self.jobs[job["task_id"]] = dict(job, status="queued", worker="", progress="",
+                                             result=None, cancel=False)
+            self.pending.appendleft(job["task_id"])
+            return True
+
+    def lease(self, worker_id: str, lease_seconds: int = JOB_LEASE_SECONDS) -> Optional[dict]:
+        """Выдает воркеру следующую задачу"""
+        with self.lock:
+            while self.pending:
+                task_id = self.pending.pop()
+                job = self.jobs.get(task_id)
+                if not job or job["status"] != "queued":
+                    continue
+                if job["cancel"]:
+                    job.update(status="done", result={"status": "cancelled", "result": None,
+                                                      "error": "Парсинг отменен"})
+                    continue
+                job.update(status="running", worker=worker_id)
+                self.leases[task_id] = time.time() + lease_seconds
+                return dict(job)
+            return None
+
+    def heartbeat(self, task_id: str, worker_id: str, progress: str = "",
+                  lease_seconds: int = JOB_LEASE_SECONDS) -> bool:
+        """Продлевает аренду; False - задача передана другому воркеру"""
+        with self.lock:
+            job = self.jobs.get(task_id)
+            if not job or job["worker"] != worker_id or job["status"] != "running":
+                return False
+            self.leases[task_id] = time.time() + lease_seconds
+            if progress:
+                job["progress"] = progress
+            return True
+
+    def complete(self, task_id: str, worker_id: str, result: dict) -> bool:
+        """Сохраняет результат; False - аренда уже у другого воркера или задача завершена"""
+        with self.lock:
+            job = self.jobs.get(task_id)
+            if not job or job["worker"] != worker_id or job["status"] != "running":
+                return False
+            job.update(status="done", result=result, finished_at=time.time())
+            self.leases.pop(task_id, None)
+            return True
+
+    def cancel(self, task_id: str) -> bool:
+        with self.lock:
+            job = self.jobs.get(task_id)
+            if not job or job["status"] == "done":
+                return False
+            job["cancel"] = True
+            return True
+
+    def is_cancelled(self, task_id: str) -> bool:
+        with self.lock:
+            job = self.jobs.get(task_id)
+            return bool(job and job["cancel"])
+
+    def get(self, task_id: str) -> Optional[dict]:
+        with self.lock:
+            job = self.jobs.get(task_id)
+            return dict(job) if job else None
+
+    def requeue_expired(self) -> int:
+        """Возвращает в очередь задачи воркеров, переставших присылать heartbeat"""
+        now = time.time()
+        with self.lock:
+            expired = [tid for tid, deadline in self.leases.items() if deadline < now]
+            for task_id in expired:
+                del self.leases[task_id]
+                job = self.jobs[task_id]
+                log.warning(f"♻️ Аренда задачи {task_id} истекла (воркер {job['worker']}), возврат в очередь")
+                job.update(status="queued", worker="")
+                self.pending.append(task_id)
+            # Завершенные задачи хранятся ограниченное время
+            for task_id in [tid for tid, j in self.jobs.items()
+                            if j["status"] == "done" and now - j.get("finished_at", now) > CRAWLER_RESULT_TTL]:
+                del self.jobs[task_id]
+            return len(expired)
+
+    def stats(self) -> dict:
+        with self.lock:
+            running = [j for j in self.jobs.values() if j["status"] == "running"]
+            return {
+                "queued": sum(1 for j in self.jobs.values() if j["status"] == "queued"),
+                "running": len(running),
+                "workers": len({j["worker"] for j in running}),
+            }
+
+
+class RedisJobQueue:
+    """Очередь в Redis, общая для бота и воркеров на разных серверах"""
+
+    PENDING_KEY = "fipi:jobs:pending"
+    LEASES_KEY = "fipi:jobs:leases"
+    JOB_KEY = "fipi:job:{}"
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("Для распределенного парсинга нужен пакет redis (pip install redis)")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    def _job_key(self, task_id: str) -> str:
+        return self.JOB_KEY.format(task_id)
+
+    def _decode(self, data: dict) -> Optional[dict]:
+        if not data:
+            return None
+        job = dict(data)
+        job["result"] = json.loads(job["result"]) if job.get("result") else None
+        job["prev_ids"] = json.loads(job["prev_ids"]) if job.get("prev_ids") else None
+        job["cancel"] = job.get("cancel") == "1"
+        return job
+
+    def push(self, job: dict) -> bool:
+        key = self._job_key(job["task_id"])
+        status = self.client.hget(key, "status")
+        if status and status != "done":
+            return False
+        fields = {
+            "task_id": job["task_id"],
+            "url": job["url"],
+            "operation": job["operation"],
+            "chat_id": job.get("chat_id", ""),
+            "prev_ids": json.dumps(job.get("prev_ids")) if job.get("prev_ids") is not None else "",
+            "status": "queued",
+            "worker": "",
+            "progress": "",
+            "result": "",
+            "cancel": "0",
+        }
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping=fields)
+        pipe.lpush(self.PENDING_KEY, job["task_id"])
+        pipe.execute()
+        return True
+
+    def lease(self, worker_id: str, lease_seconds: int = JOB_LEASE_SECONDS) -> Optional[dict]:
+        while True:
+            task_id = self.client.rpop(self.PENDING_KEY)
+            if task_id is None:
+                return None
+            key = self._job_key(task_id)
+            job = self._decode(self.client.hgetall(key))
+            if not job or job["status"] != "queued":
+                continue
+            if job["cancel"]:
+                pipe = self.client.pipeline()
+                self._finish(pipe, task_id, {"status": "cancelled", "result": None,
+                                             "error": "Парсинг отменен"})
+                pipe.execute()
+                continue
+            pipe = self.client.pipeline()
+            pipe.hset(key, mapping={"status": "running", "worker": worker_id})
+            pipe.zadd(self.LEASES_KEY, {task_id: time.time() + lease_seconds})
+            pipe.execute()
+            job.update(status="running", worker=worker_id)
+            return job
+
+    def heartbeat(self, task_id: str, worker_id: str, progress: str = "",
+                  lease_seconds: int = JOB_LEASE_SECONDS) -> bool:
+        key = self._job_key(task_id)
+        worker, status = self.client.hmget(key, "worker", "status")
+        if worker != worker_id or status != "running":
+            return False
+        pipe = self.client.pipeline()
+        pipe.zadd(self.LEASES_KEY, {task_id: time.time() + lease_seconds}, xx=True)
+        if progress:
+            pipe.hset(key, "progress", progress)
+        pipe.execute()
+        return True
+
+    def _finish(self, pipe, task_id: str, result: dict):
+        key = self._job_key(task_id)
+        pipe.hset(key, mapping={"status": "done", "result": json.dumps(result, ensure_ascii=False),
+                                "finished_at": str(time.time())})
+        pipe.zrem(self.LEASES_KEY, task_id)
+        pipe.expire(key, CRAWLER_RESULT_TTL)
+
+    def complete(self, task_id: str, worker_id: str, result: dict) -> bool:
+        """Сохраняет результат, только если аренда все еще у этого воркера (WATCH/MULTI)"""
+        key = self._job_key(task_id)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    worker, status = pipe.hmget(key, "worker", "status")
+                    if worker != worker_id or status != "running":
+                        pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    self._finish(pipe, task_id, result)
+                    pipe.execute()
+                    return True
+                except redis.WatchError:
+                    # Задачу изменили между проверкой и записью - проверяем заново
+                    continue
+
+    def cancel(self, task_id: str) -> bool:
+        key = self._job_key(task_id)
+        if self.client.hget(key, "status") in (None, "done"):
+            return False
+        self.client.hset(key, "cancel", "1")
+        return True
+
+    def is_cancelled(self, task_id: str) -> bool:
+        return self.client.hget(self._job_key(task_id), "cancel") == "1"
+
+    def get(self, task_id: str) -> Optional[dict]:
+        return self._decode(self.client.hgetall(self._job_key(task_id)))
+
+    def requeue_expired(self) -> int:
+        requeued = 0
+        for task_id in self.client.zrangebyscore(self.LEASES_KEY, 0, time.time()):
+            # ZREM атомарен - задачу вернет в очередь только один из конкурирующих процессов
+            if not self.client.zrem(self.LEASES_KEY, task_id):
+                continue
+            key = self._job_key(task_id)
+            worker = self.client.hget(key, "worker")
+            log.warning(f"♻️ Аренда задачи {task_id} истекла (воркер {worker}), возврат в очередь")
+            pipe = self.client.pipeline()
+            pipe.hset(key, mapping={"status": "queued", "worker": ""})
+            pipe.rpush(self.PENDING_KEY, task_id)
+            pipe.execute()
+            requeued += 1
+        return requeued
+
+    def stats(self) -> dict:
+        running = self.client.zrange(self.LEASES_KEY, 0, -1)
+        workers = {self.client.hget(self._job_key(tid), "worker") for tid in running}
+        return {
+            "queued": self.client.llen(self.PENDING_KEY),
+            "running": len(running),
+            "workers": len(workers - {None, ""}),
+        }
+
+
+def create_job_queue(url: str = JOB_QUEUE_URL):
+    """Создает очередь по адресу из конфигурации"""
+    if url == "local":
+        return LocalJobQueue()
+    return RedisJobQueue(url)
@@ -11,7 +11,8 @@ def kb_main_reply() -> ReplyKeyboardMarkup:
         ["📚 Подписки", "📊 Количество заданий"],
         ["🆔 Файл всех ID", "🔄 Сравнить ID"],
         ["❌ Отписаться", "📋 Мои подписки"],
-        ["📅 Расписание и напоминания", "ℹ️ Статус очереди"]
+        ["📅 Расписание и напоминания", "ℹ️ Статус очереди"],
+        ["🕓 Изменения с даты", "⛔ Отменить парсинг"]
     ]
     return ReplyKeyboardMarkup(
         keyboard,
@@ -50,6 +51,9 @@ def kb_user_subjects_reply(subjects_urls: list, action: str) -> ReplyKeyboardMar
             subject_name = subj_by_url(subjects_urls[j])
             row.append(subject_name)
         keyboard.append(row)
+    if action == "ids" and len(subjects_urls) > 1:
+        from batch_ids import BATCH_BUTTON
+        keyboard.append([BATCH_BUTTON])
     keyboard.append(["⬅ Назад в меню"])
     return ReplyKeyboardMarkup(
         keyboard,
@@ -61,6 +65,7 @@ def kb_subscriptions_menu_reply() -> ReplyKeyboardMarkup:
     """Меню подписок - Reply"""
     keyboard = [
         ["Подписаться на ОГЭ", "Подписаться на ЕГЭ"],
+        ["🔔 Режим уведомлений", "📢 Уведомления в личку"],
         ["⬅ Назад в меню"]
     ]
     return ReplyKeyboardMarkup(
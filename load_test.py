@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест обработчиков бота против локального фейкового Bot API
+
+Запуск: python load_test.py [--users 200] [--ramp 5] [--live-counts]
+
+Поднимает настоящий Application с обработчиками из handlers.py, направляет его
+запросы на фейковый Bot API (asyncio HTTP-сервер) и прогоняет сценарий N
+пользователей: подписка, список подписок, количество заданий, файл ID из кэша,
+статус очереди. Данные бота пишутся во временный каталог, bot_data.json
+не затрагивается. Отчет: p50/p95/p99 задержки по действиям, вызовы Bot API
+на действие и задержка event loop.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from urllib.parse import parse_qs
+
+FAKE_TOKEN = "123456:LOADTEST"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "FIPI LoadTest", "username": "fipi_load_bot"}
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class FakeBotAPI:
+    """Отвечает на методы Bot API правдоподобными объектами и считает вызовы"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.server = None
+        self.port = None
+        self.message_id = 0
+        self.calls = Counter()  # метод -> количество
+        self.calls_by_chat = Counter()  # chat_id -> количество
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @staticmethod
+    def parse_params(headers: dict, body: bytes) -> dict:
+        content_type = headers.get("content-type", "")
+        if "multipart/form-data" in content_type:
+            # Для файлов нужен только chat_id
+            match = re.search(rb'name="chat_id"\r\n\r\n([^\r]+)', body)
+            return {"chat_id": match.group(1).decode()} if match else {}
+        if "application/json" in content_type:
+            return json.loads(body or b"{}")
+        return {k: v[0] for k, v in parse_qs(body.decode("utf-8")).items()}
+
+    def make_message(self, params: dict, **extra) -> dict:
+        self.message_id += 1
+        chat_id = int(params.get("chat_id", 0) or 0)
+        message = {
+            "message_id": int(params.get("message_id") or self.message_id),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        message.update(extra)
+        return message
+
+    def respond(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            return self.make_message(params)
+        if method == "sendDocument":
+            return self.make_message(params, document={"file_id": f"doc{self.message_id}",
+                                                       "file_unique_id": f"u{self.message_id}"})
+        return True
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                _, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+
+                method = path.rstrip("/").rsplit("/", 1)[-1]
+                params = self.parse_params(headers, body)
+                self.calls[method] += 1
+                if params.get("chat_id"):
+                    self.calls_by_chat[str(params["chat_id"])] += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                payload = json.dumps({"ok": True, "result": self.respond(method, params)},
+                                     ensure_ascii=False).encode("utf-8")
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             + f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def measure_loop_lag(samples: list, stop: asyncio.Event, interval: float = 0.05):
+    """Насколько позже запланированного просыпается event loop"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+def build_scenario(subject_name: str, subject_label: str) -> list:
+    """Действия одного пользователя: (название для отчета, текст сообщения)"""
+    return [
+        ("Меню подписок", "📚 Подписки"),
+        ("Выбор ОГЭ", "Подписаться на ОГЭ"),
+        ("Подписка", f"ОГЭ {subject_name}"),
+        ("Мои подписки", "📋 Мои подписки"),
+        ("Количество заданий", "📊 Количество заданий"),
+        ("Меню файла ID", "🆔 Файл всех ID"),
+        ("Выбор предмета", subject_label),
+        ("Файл ID из кэша", "📁 Использовать готовый результат"),
+        ("Статус очереди", "ℹ️ Статус очереди"),
+    ]
+
+
+async def run_load_test(args) -> dict:
+    # Импорт после перехода во временный каталог: хранилище создается при импорте
+    from telegram import Update
+    from telegram.ext import Application, MessageHandler, CommandHandler, filters
+    import handlers
+    import count_cache
+    from config import OGE_SUBJECT_LIST
+    from database import save_parsing_result
+    from utils import subj_by_url
+
+    api = FakeBotAPI(latency=args.api_latency)
+    await api.start()
+
+    if not args.live_counts:
+        # Сайт ФИПИ не нагружаем: количество "получаем" с типичной задержкой
+        def fake_get_current_count(url):
+            time.sleep(random.uniform(0.2, 0.6))
+            return random.randint(1000, 5000)
+        count_cache.get_current_count = fake_get_current_count
+
+    # Готовые результаты, чтобы запрос файла ID не запускал браузер
+    for _, url in OGE_SUBJECT_LIST:
+        save_parsing_result(url, "Создание файла ID",
+                            [f"{i:06X}" for i in range(args.ids_per_subject)], "loadtest")
+
+    pending = {}
+    handler_times = []
+
+    async def timed_text_handler(update, context):
+        started = time.perf_counter()
+        try:
+            await handlers.handle_text_message(update, context)
+        finally:
+            handler_times.append(time.perf_counter() - started)
+            future = pending.pop(update.update_id, None)
+            if future and not future.done():
+                future.set_result(None)
+
+    app = (Application.builder().token(FAKE_TOKEN)
+           .base_url(f"http://127.0.0.1:{api.port}/bot")
+           .base_file_url(f"http://127.0.0.1:{api.port}/file/bot")
+           .build())
+    app.add_handler(CommandHandler("start", handlers.start_cmd))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed_text_handler))
+    app.add_error_handler(handlers.on_error)
+
+    latencies = defaultdict(list)
+    api_calls = defaultdict(list)
+    update_ids = iter(range(1, 10 ** 9))
+    lag_samples = []
+    stop = asyncio.Event()
+
+    async def simulate_user(user_id: int):
+        await asyncio.sleep(random.uniform(0, args.ramp))
+        subject_name, url = random.choice(OGE_SUBJECT_LIST)
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        for action, text in build_scenario(subject_name, subj_by_url(url)):
+            update_id = next(update_ids)
+            update = Update.de_json({
+                "update_id": update_id,
+                "message": {"message_id": update_id, "date": int(time.time()),
+                            "chat": {"id": user_id, "type": "private"},
+                            "from": user, "text": text},
+            }, app.bot)
+            future = asyncio.get_running_loop().create_future()
+            pending[update_id] = future
+            calls_before = api.calls_by_chat[str(user_id)]
+            started = time.perf_counter()
+            await app.update_queue.put(update)
+            await future
+            latencies[action].append(time.perf_counter() - started)
+            api_calls[action].append(api.calls_by_chat[str(user_id)] - calls_before)
+            await asyncio.sleep(random.uniform(0, args.think_time))
+
+    async with app:
+        await app.start()
+        lag_task = asyncio.create_task(measure_loop_lag(lag_samples, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(simulate_user(10 ** 6 + i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await lag_task
+        await app.stop()
+    await api.stop()
+
+    return {
+        "elapsed": elapsed,
+        "latencies": latencies,
+        "api_calls": api_calls,
+        "handler_times": handler_times,
+        "lag": lag_samples,
+        "calls_by_method": api.calls,
+    }
+
+
+def print_report(report: dict, users: int):
+    total_actions = sum(len(v) for v in report["latencies"].values())
+    print(f"\n👥 Пользователей: {users}, действий: {total_actions}, "
+          f"время: {report['elapsed']:.1f} сек ({total_actions / report['elapsed']:.1f} действий/сек)")
+    print(f"\n{'Действие':<22}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'API/действие':>15}")
+    for action, values in report["latencies"].items():
+        calls = report["api_calls"][action]
+        print(f"{action:<22}{percentile(values, 0.5) * 1000:>10.1f}{percentile(values, 0.95) * 1000:>10.1f}"
+              f"{percentile(values, 0.99) * 1000:>10.1f}{sum(calls) / len(calls):>15.2f}")
+
+    handler = report["handler_times"]
+    print(f"\n⚙️ Время самого обработчика: p50 {percentile(handler, 0.5) * 1000:.1f} мс, "
+          f"p99 {percentile(handler, 0.99) * 1000:.1f} мс")
+    lag = report["lag"]
+    print(f"⏱️ Задержка event loop: p50 {percentile(lag, 0.5) * 1000:.1f} мс, "
+          f"p99 {percentile(lag, 0.99) * 1000:.1f} мс, max {max(lag, default=0) * 1000:.1f} мс")
+    print(f"📡 Вызовы Bot API: {dict(report['calls_by_method'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест обработчиков ФИПИ-бота")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--ramp", type=float, default=5.0, help="Разброс старта пользователей, сек")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Пауза между действиями, сек")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Задержка ответа Bot API, сек")
+    parser.add_argument("--ids-per-subject", type=int, default=3000)
+    parser.add_argument("--live-counts", action="store_true",
+                        help="Получать количество заданий с настоящего сайта ФИПИ")
+    parser.add_argument("--verbose", action="store_true", help="Не скрывать вывод обработчиков")
+    args = parser.parse_args()
+
+    # Хранилище и временные файлы бота - во временном каталоге
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, project_dir)
+    workdir = tempfile.mkdtemp(prefix="fipi-load-")
+    os.chdir(workdir)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        report = asyncio.run(run_load_test(args))
+    print_report(report, args.users)
+    print(f"\n📁 Данные теста: {workdir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,11 +11,17 @@ import datetime
 
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 
-from config import BOT_TOKEN, CHECK_INTERVAL
-from handlers import (start_cmd, status_cmd, handle_text_message,
+from config import (BOT_TOKEN, CHECK_INTERVAL, BOT_UPDATE_MODE,
+                    PREWARM_ENABLED, PREWARM_TIME, DIGEST_CHECK_INTERVAL,
+                    MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES, BOT_CONNECTION_POOL_SIZE, BOT_POOL_TIMEOUT)
+from chat_ordering import ChatOrderedUpdateProcessor
+from handlers import (start_cmd, status_cmd, handle_text_message, cancel_cmd, cancel_all_cmd, task_cmd,
                      on_shutdown, on_error, send_notification)  # Добавили send_notification
-from periodic_tasks import periodic_check, daily_cleanup
+from periodic_tasks import periodic_check, daily_cleanup, nightly_prewarm
+from digest import flush_digests
 from queue_manager import process_queue_manager, shutdown_executor
+from system_metrics import metrics_sampler
+from webhook_server import run_webhook
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,6 +31,7 @@ logging.basicConfig(
 log = logging.getLogger("FIPI-Bot")
 
 queue_task = None
+metrics_task = None
 application_instance = None
 
 def get_application_context():
@@ -33,15 +40,16 @@ def get_application_context():
 
 async def on_startup(context):
     """Инициализация при старте"""
-    global queue_task
+    global queue_task, metrics_task
     log.info("🤖 Бот инициализирован, запуск систем...")
-    queue_task = asyncio.create_task(process_queue_manager())
+    metrics_task = asyncio.create_task(metrics_sampler())
+    queue_task = asyncio.create_task(process_queue_manager(context))
     log.info(f"⏰ Автоматические проверки каждые {CHECK_INTERVAL} секунд")
     log.info("🎯 Уведомления о Статграде настроены на 9:00 MSK")
 
 async def cleanup():
     """Очистка ресурсов при завершении"""
-    global queue_task
+    global queue_task, metrics_task
     log.info("🧹 Начало очистки ресурсов...")
     
     if queue_task and not queue_task.done():
@@ -50,6 +58,13 @@ async def cleanup():
             await queue_task
         except asyncio.CancelledError:
             log.info("⏹️ Менеджер очереди остановлен")
+
+    if metrics_task and not metrics_task.done():
+        metrics_task.cancel()
+        try:
+            await metrics_task
+        except asyncio.CancelledError:
+            log.info("⏹️ Сбор метрик остановлен")
     
     await shutdown_executor()
     log.info("✅ Очистка ресурсов завершена")
@@ -66,12 +81,19 @@ def main():
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
     
-    app = Application.builder().token(BOT_TOKEN).build()
+    builder = (Application.builder().token(BOT_TOKEN)
+               .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES))
+               .connection_pool_size(BOT_CONNECTION_POOL_SIZE)
+               .pool_timeout(BOT_POOL_TIMEOUT))
+    app = builder.build()
     application_instance = app
 
     # Обработчики команд
     app.add_handler(CommandHandler("start", start_cmd))
     app.add_handler(CommandHandler("status", status_cmd))
+    app.add_handler(CommandHandler("cancel", cancel_cmd))
+    app.add_handler(CommandHandler("task", task_cmd))
+    app.add_handler(CommandHandler("cancel_all", cancel_all_cmd))
     app.add_handler(CommandHandler("stop", on_shutdown))
 
     # Обработчик текстовых сообщений  
@@ -81,6 +103,10 @@ def main():
     app.job_queue.run_once(on_startup, when=0)
     app.job_queue.run_repeating(periodic_check, interval=CHECK_INTERVAL, first=30)  # Проверка каждую минуту
     app.job_queue.run_repeating(daily_cleanup, interval=86400, first=3600)  # Очистка каждые 24 часа, первая через час
+    app.job_queue.run_repeating(flush_digests, interval=DIGEST_CHECK_INTERVAL, first=DIGEST_CHECK_INTERVAL)  # Сводки изменений
+    if PREWARM_ENABLED:
+        # Ночной прогрев кэша популярных предметов
+        app.job_queue.run_daily(nightly_prewarm, time=datetime.datetime.strptime(PREWARM_TIME, "%H:%M").time())
 
     # ИЗМЕНЕНО: ежедневные напоминания о расписании (на 9:00 MSK вместо 10:00)
     app.job_queue.run_daily(send_notification, time=datetime.datetime.strptime("09:00", "%H:%M").time())
@@ -91,8 +117,15 @@ def main():
     print("🤖 ФИПИ-бот запущен с автоматическими проверками!")
     print(f"⏰ Проверка изменений каждые {CHECK_INTERVAL} секунд")
     print("🧹 Ежедневная очистка данных активирована")
+    if PREWARM_ENABLED:
+        print(f"🔥 Ночной прогрев кэша в {PREWARM_TIME}")
     print("🎯 Уведомления о Статграде: ежедневно в 9:00 MSK")
 
+    if BOT_UPDATE_MODE == "webhook":
+        print("🌐 Получение обновлений через webhook")
+        asyncio.run(run_webhook(app, on_stop=cleanup))
+        return
+
     try:
         app.run_polling(drop_pending_updates=True)
     except KeyboardInterrupt:
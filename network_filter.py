@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Фильтрация сетевых запросов Chrome через DevTools Protocol
+"""
+import json
+import logging
+
+from config import NETWORK_FILTER_ENABLED, NETWORK_BLOCKED_URL_PATTERNS
+
+log = logging.getLogger("FIPI-Bot")
+
+
+def with_query_variants(patterns) -> list:
+    """Добавляет к шаблонам расширений вариант с параметрами запроса
+
+    Шаблон Network.setBlockedURLs должен совпасть со всем URL, поэтому "*.png"
+    не блокирует "logo.png?v=3" - для него добавляется "*.png?*".
+    """
+    result = []
+    for pattern in patterns:
+        result.append(pattern)
+        if pattern.startswith("*.") and not pattern.endswith("*"):
+            result.append(pattern + "?*")
+    return result
+
+
+class NetworkFilter:
+    """Блокирует ненужные для извлечения ID ресурсы и считает трафик за парсинг"""
+
+    def __init__(self, patterns=None):
+        self.patterns = with_query_variants(patterns if patterns is not None else NETWORK_BLOCKED_URL_PATTERNS)
+        self.requests = 0
+        self.blocked = 0
+        self.bytes = 0
+
+    @staticmethod
+    def configure_options(options):
+        """Включает performance-лог, из которого считаются запросы и байты"""
+        if NETWORK_FILTER_ENABLED:
+            options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+    def attach(self, driver):
+        """Включает блокировку URL в новом экземпляре WebDriver"""
+        if not NETWORK_FILTER_ENABLED:
+            return
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": self.patterns})
+            log.info(f"Сетевой фильтр включен: {len(self.patterns)} шаблонов")
+        except Exception as e:
+            log.warning(f"Не удалось включить сетевой фильтр: {e}")
+
+    def collect(self, driver):
+        """Забирает накопленные события из performance-лога и обновляет счетчики"""
+        if not NETWORK_FILTER_ENABLED or not driver:
+            return
+        try:
+            entries = driver.get_log("performance")
+        except Exception as e:
+            log.debug(f"Performance-лог недоступен: {e}")
+            return
+
+        for entry in entries:
+            try:
+                message = json.loads(entry["message"])["message"]
+            except (KeyError, ValueError):
+                continue
+            method = message.get("method")
+            params = message.get("params", {})
+            if method == "Network.requestWillBeSent":
+                self.requests += 1
+            elif method == "Network.loadingFinished":
+                self.bytes += int(params.get("encodedDataLength", 0))
+            elif method == "Network.loadingFailed" and params.get("blockedReason"):
+                self.blocked += 1
+
+    def summary(self) -> str:
+        """Краткая сводка по трафику"""
+        return (f"запросов: {self.requests}, заблокировано: {self.blocked}, "
+                f"загружено: {self.bytes / 1024 / 1024:.1f} MB")
@@ -6,8 +6,8 @@ import time
 import logging
 import os
 import shutil
-from typing import Set
-from datetime import datetime
+import hashlib
+from typing import Dict, List, Set
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
@@ -15,21 +15,45 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-from database import store, save_store
-from config import INITIAL_RETRY_DELAY, RETRY_DELAY_MULTIPLIER, PARSING_TIMEOUT
+from network_filter import NetworkFilter
+from rate_limiter import acquire
+from task_content import write_blob
+from host_health import (allow_request, record_success, record_failure, retry_in, backoff_delay,
+                         host_of, HostUnavailable)
+from config import PARSING_TIMEOUT, PAGE_TIMEOUT
 
 log = logging.getLogger("FIPI-Bot")
 
 
+class ParsingCancelled(Exception):
+    """Парсинг отменен пользователем или администратором"""
+
+
+class PageTimeoutError(Exception):
+    """Превышено время на обработку одной страницы"""
+
+
 class ServerTaskIdExtractor:
     """WebDriver для серверного окружения с улучшенной стабильностью"""
 
-    def __init__(self, timeout: int = 15, max_reloads: int = 2):
+    def __init__(self, timeout: int = 15, max_reloads: int = 2, cancel_file: str = None,
+                 job_timeout: int = PARSING_TIMEOUT, page_timeout: int = PAGE_TIMEOUT):
         self.timeout = timeout
         self.max_reloads = max_reloads
+        self.cancel_file = cancel_file
+        self.job_timeout = job_timeout
+        self.page_timeout = page_timeout
         self.driver = None
         self.start_time = None
+        self.page_start_time = None
         self.driver_pid = None
+        self.network = NetworkFilter()
+        # Снятие текста заданий: ID -> хэш содержимого
+        self.capture_content = False
+        self.content_hashes: Dict[str, str] = {}
+        # Проверка в процессе бота: при ошибке сразу выходим, без перезапуска Chrome,
+        # который завершает все браузеры на сервере (и чужие парсинги)
+        self.fail_fast = False
         log.info("Создан ServerTaskIdExtractor для серверного окружения")
 
     # Замените метод _init_driver в parser.py:
@@ -56,9 +80,7 @@ class ServerTaskIdExtractor:
             options.add_argument("--disable-gpu")
             options.add_argument("--disable-extensions")
             options.add_argument("--disable-plugins")
-            options.add_argument("--disable-images")  # Не загружаем изображения
-            options.add_argument("--disable-javascript")  # Отключаем JS если не нужен
-            options.add_argument("--disable-css")  # Не загружаем CSS
+            options.add_argument("--blink-settings=imagesEnabled=false")  # Не загружаем изображения
 
             # Память и стабильность
             options.add_argument("--max_old_space_size=4096")
@@ -88,6 +110,9 @@ class ServerTaskIdExtractor:
             }
             options.add_experimental_option("prefs", prefs)
 
+            # Performance-лог для подсчета трафика
+            NetworkFilter.configure_options(options)
+
             # Путь к Chrome
             options.binary_location = chrome_path
 
@@ -110,6 +135,9 @@ class ServerTaskIdExtractor:
             driver.set_page_load_timeout(60)
             driver.implicitly_wait(10)
 
+            # Блокировка шрифтов, медиа и сторонних счетчиков
+            self.network.attach(driver)
+
             # Сохраняем PID для мониторинга
             self.driver_pid = driver.service.process.pid if hasattr(driver.service, 'process') else None
 
@@ -138,6 +166,7 @@ class ServerTaskIdExtractor:
         """Перезапуск WebDriver при сбоях"""
         try:
             if self.driver:
+                self.network.collect(self.driver)
                 try:
                     self.driver.quit()
                 except:
@@ -173,10 +202,28 @@ class ServerTaskIdExtractor:
         except Exception as e:
             log.warning(f"Ошибка завершения Chrome процессов: {e}")
 
+    def _check_cancelled(self):
+        """Проверяет, не запрошена ли отмена парсинга"""
+        if self.cancel_file and os.path.exists(self.cancel_file):
+            raise ParsingCancelled("Парсинг отменен")
+
     def _check_timeout(self):
-        """Проверяет, не превышен ли общий таймаут парсинга"""
-        if self.start_time and time.time() - self.start_time > PARSING_TIMEOUT:
-            raise TimeoutError(f"Превышен максимальный таймаут парсинга ({PARSING_TIMEOUT} сек)")
+        """Проверяет отмену и таймауты парсинга (общий и на страницу)"""
+        self._check_cancelled()
+        if self.start_time and time.time() - self.start_time > self.job_timeout:
+            raise TimeoutError(f"Превышен максимальный таймаут парсинга ({self.job_timeout} сек)")
+        if self.page_start_time and time.time() - self.page_start_time > self.page_timeout:
+            raise PageTimeoutError(f"Превышен таймаут страницы ({self.page_timeout} сек)")
+
+    def _wait_for_host(self):
+        """Ждет, пока выключатель хоста пропустит запрос (ожидание входит в время страницы)"""
+        announced = False
+        while not allow_request(self.current_url):
+            if not announced:
+                log.warning(f"🔌 {host_of(self.current_url)} недоступен, парсинг приостановлен")
+                announced = True
+            self._check_timeout()
+            time.sleep(min(max(retry_in(self.current_url), 1), 10))
 
     def _total_pages(self) -> int:
         """Получает общее количество страниц"""
@@ -200,6 +247,7 @@ class ServerTaskIdExtractor:
         max_attempts = 3
         for attempt in range(max_attempts):
             try:
+                acquire(self.current_url)
                 if use_input_field:
                     # Навигация через поле ввода
                     select_page_btn = WebDriverWait(self.driver, self.timeout).until(
@@ -227,19 +275,28 @@ class ServerTaskIdExtractor:
                 time.sleep(3)
                 return True
 
+            except (ParsingCancelled, TimeoutError, PageTimeoutError):
+                raise
             except Exception as e:
+                if self.fail_fast:
+                    raise
                 if attempt == max_attempts - 1:
                     log.warning(f"Навигация на страницу {page} не удалась: {e}")
                     return False
 
                 log.warning(f"Попытка {attempt + 1} навигации не удалась, перезапуск...")
                 self._restart_driver()
+                acquire(self.current_url)
                 self.driver.get(self.current_url)  # Возвращаемся на исходную страницу
                 time.sleep(5)
 
     def _ids_on_page(self) -> Set[str]:
         """Извлечение ID задач с текущей страницы"""
-        ids: Set[str] = set()
+        return set(self._ordered_ids_on_page())
+
+    def _ordered_ids_on_page(self) -> List[str]:
+        """ID задач с текущей страницы в порядке их вывода"""
+        ids: List[str] = []
         max_attempts = 3
 
         for attempt in range(max_attempts):
@@ -269,15 +326,25 @@ class ServerTaskIdExtractor:
                         task_id = task.get_attribute("id")
                         if task_id and task_id.startswith('q'):
                             task_id = task_id[1:]
-                            if task_id:
-                                ids.add(task_id)
+                            if task_id and task_id not in ids:
+                                ids.append(task_id)
                     except Exception as e:
                         log.warning(f"Ошибка получения ID задачи: {e}")
                         continue
 
+                if self.capture_content:
+                    self._capture_content()
+
                 self.driver.switch_to.default_content()
+                self.network.collect(self.driver)
                 break
 
+            except (ParsingCancelled, TimeoutError, PageTimeoutError):
+                try:
+                    self.driver.switch_to.default_content()
+                except:
+                    pass
+                raise
             except Exception as e:
                 log.warning(f"Ошибка чтения задач на странице (попытка {attempt + 1}): {e}")
 
@@ -286,27 +353,42 @@ class ServerTaskIdExtractor:
                 except:
                     pass
 
+                if self.fail_fast:
+                    raise
                 if attempt == max_attempts - 1:
                     log.error("Исчерпаны попытки чтения страницы")
                     break
 
                 # Перезапуск при критических ошибках
                 self._restart_driver()
+                acquire(self.current_url)
                 self.driver.get(self.current_url)
                 time.sleep(5)
 
         log.info(f"Собрано ID на странице: {len(ids)}")
         return ids
 
+    def _capture_content(self):
+        """Сохраняет текст заданий текущей страницы (вызывается внутри iframe)"""
+        tasks = self.driver.execute_script(
+            "return Array.from(document.querySelectorAll(\"div[id^='q']\"))"
+            ".map(e => [e.id.slice(1), e.innerText]);"
+        )
+        for task_id, text in tasks or []:
+            if task_id:
+                self.content_hashes[task_id] = write_blob(text)
+
     def extract_ids_sync(self, url: str) -> Set[str]:
         """Основной метод извлечения ID с улучшенной обработкой ошибок"""
         self.start_time = time.time()
         self.current_url = url
 
         try:
+            self._wait_for_host()
             self.driver = self._init_driver()
             log.info(f"Начало серверного парсинга ID для {url}")
 
+            acquire(url)
             self.driver.get(url)
             time.sleep(5)
 
@@ -331,6 +413,7 @@ class ServerTaskIdExtractor:
                 max_retries = 3
                 retry_count = 0
                 page_success = False
+                self.page_start_time = time.time()
 
                 while retry_count < max_retries and not page_success:
                     try:
@@ -347,37 +430,41 @@ class ServerTaskIdExtractor:
                         if ids or p == total:
                             all_ids.update(ids)
                             page_success = True
+                            record_success(url)
                             log.info(f"Страница {p} обработана: {len(ids)} ID")
                         else:
                             raise Exception(f"Пустая страница {p}")
 
+                    except (ParsingCancelled, TimeoutError):
+                        raise
+                    except PageTimeoutError as e:
+                        # Срок страницы общий для всех попыток - пропускаем ее без повторов
+                        failed_pages.append(p)
+                        log.error(f"Страница {p} пропущена: {e}")
+                        break
                     except Exception as e:
                         retry_count += 1
+                        record_failure(url, e)
                         log.warning(f"Ошибка на странице {p}, попытка {retry_count}: {e}")
 
                         if retry_count < max_retries:
-                            time.sleep(INITIAL_RETRY_DELAY * retry_count)
+                            time.sleep(backoff_delay(retry_count))
+                            self._wait_for_host()
                         else:
                             failed_pages.append(p)
                             log.error(f"Страница {p} пропущена после {max_retries} попыток")
 
+            self.page_start_time = None
             if failed_pages:
                 log.warning(f"Пропущены страницы: {failed_pages}")
 
-            # Сохраняем результат
-            if os.environ.get('PARSING_PROCESS'):
-                timestamp = datetime.now().isoformat()
-                if url not in store["historical_ids"]:
-                    store["historical_ids"][url] = []
-                store["historical_ids"][url].append({
-                    "timestamp": timestamp,
-                    "ids": list(all_ids)
-                })
-                save_store(store)
-
             log.info(f"Серверный парсинг завершен для {url}: {len(all_ids)} ID")
+            log.info(f"Сетевой трафик парсинга: {self.network.summary()}")
             return all_ids
 
+        except ParsingCancelled:
+            log.info(f"Серверный парсинг {url} отменен")
+            raise
         except TimeoutError as e:
             log.error(f"Тайм-аут серверного парсинга {url}: {e}")
             return set()
@@ -386,6 +473,7 @@ class ServerTaskIdExtractor:
             return set()
         finally:
             if self.driver:
+                self.network.collect(self.driver)
                 try:
                     log.info("Закрытие серверного WebDriver")
                     self.driver.quit()
@@ -397,6 +485,69 @@ class ServerTaskIdExtractor:
             # Принудительная очистка
             self._kill_chrome_processes()
 
+    def probe_fingerprint(self, url: str, pick_pages) -> Dict:
+        """Загружает несколько страниц и возвращает количество заданий и хэши страниц
+
+        Ошибка навигации или чтения сразу прерывает проверку (fail_fast): перезапуск
+        Chrome из обычного парсинга завершил бы браузеры всех идущих парсингов.
+
+        pick_pages(total_pages) -> список номеров страниц для проверки. Первая и
+        последняя страницы дают точное количество заданий, как get_current_count.
+        """
+        self.start_time = time.time()
+        self.current_url = url
+        self.fail_fast = True
+        if not allow_request(url):
+            raise HostUnavailable(f"{host_of(url)} на паузе")
+        try:
+            self.driver = self._init_driver()
+            acquire(url)
+            self.driver.get(url)
+            time.sleep(3)
+
+            try:
+                btn = WebDriverWait(self.driver, self.timeout).until(
+                    EC.element_to_be_clickable((By.CLASS_NAME, "button-clear"))
+                )
+                acquire(url)
+                self.driver.execute_script("arguments[0].click();", btn)
+                time.sleep(2)
+            except Exception as e:
+                log.warning(f"Не удалось сбросить фильтры: {e}")
+
+            total = self._total_pages()
+            pages = sorted(set(pick_pages(total)) | {1, total})
+            page_ids = {}
+            for p in pages:
+                if p > 1 and not self._goto(p, use_input_field=True):
+                    raise Exception(f"Навигация на страницу {p} не удалась")
+                ids = self._ordered_ids_on_page()
+                if not ids:
+                    raise Exception(f"Пустая страница {p}")
+                page_ids[p] = ids
+
+            count = (total - 1) * len(page_ids[1]) + len(page_ids[total]) if total > 1 else len(page_ids[1])
+            record_success(url)
+            return {
+                "count": count,
+                "total_pages": total,
+                "pages": {str(p): hashlib.sha1(",".join(ids).encode("utf-8")).hexdigest()
+                          for p, ids in page_ids.items()},
+            }
+        except (ParsingCancelled, TimeoutError):
+            raise
+        except Exception as e:
+            record_failure(url, e)
+            raise
+        finally:
+            if self.driver:
+                try:
+                    self.driver.quit()
+                except Exception as e:
+                    log.warning(f"Ошибка при закрытии WebDriver: {e}")
+                finally:
+                    self.driver = None
+
 
 # Заменяем класс
 TaskIdExtractor = ServerTaskIdExtractor
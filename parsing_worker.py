@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Рабочий процесс парсинга - облегченный модуль для пула процессов
+
+Импортирует только парсер/selenium и хранилище, без telegram и обработчиков,
+чтобы воркеры forkserver стартовали быстро и не тянули лишнюю память.
+"""
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from parser import TaskIdExtractor, ParsingCancelled, PageTimeoutError
+from id_set import IdSet
+from id_snapshots import load_ids, write_snapshot
+from rate_limiter import acquire
+from host_health import record_success, record_failure, backoff_delay, is_open, host_of
+from batch_ids import BATCH_OPERATION, batch_urls
+from task_content import write_manifest, read_manifest, edited_ids
+from config import CHECKPOINT_INTERVAL_PAGES, MAX_CONCURRENT_PARSING, WORKER_MAX_TASKS, TASK_CONTENT_CAPTURE
+
+log = logging.getLogger("FIPI-Bot")
+
+
+def cancel_file_path(task_id: str) -> str:
+    """Файл-флаг отмены задачи (создается основным процессом, проверяется воркером)"""
+    return f"cancel_{task_id}.flag"
+
+
+def checkpoint_file_path(task_id: str) -> str:
+    """Файл контрольной точки задачи (последняя страница и собранные ID)"""
+    return f"checkpoint_{task_id}.json"
+
+
+def load_checkpoint(task_id: str) -> dict:
+    """Загружает контрольную точку задачи, если она есть"""
+    try:
+        with open(checkpoint_file_path(task_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(task_id: str, page: int, total: int, ids: set, failed_pages: list):
+    """Атомарно сохраняет контрольную точку задачи"""
+    path = checkpoint_file_path(task_id)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"page": page, "total": total, "ids": IdSet(ids).to_store(),
+                       "failed_pages": failed_pages}, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        log.warning(f"⚠️ Ошибка записи контрольной точки для {task_id}: {e}")
+
+
+def save_batch_journal(task_id: str, subjects: dict):
+    """Сохраняет результаты уже обработанных предметов пакета (контрольная точка пакета)"""
+    path = checkpoint_file_path(task_id)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"subjects": subjects}, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        log.warning(f"⚠️ Ошибка записи журнала пакета {task_id}: {e}")
+
+
+def remove_checkpoints(task_id: str):
+    """Удаляет контрольную точку задачи и контрольные точки предметов пакета"""
+    for path in [checkpoint_file_path(task_id)] + glob.glob(checkpoint_file_path(f"{task_id}_*")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def init_worker():
+    """Инициализация воркера пула (логирование не наследуется при forkserver)"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+    )
+    log.info(f"🔧 Воркер парсинга запущен (PID: {os.getpid()})")
+
+
+def create_worker_pool(max_workers: int = MAX_CONCURRENT_PARSING) -> ProcessPoolExecutor:
+    """Создает пул процессов на forkserver с предзагрузкой только парсера"""
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(["parsing_worker"])
+    kwargs = {}
+    if sys.version_info >= (3, 11):
+        kwargs["max_tasks_per_child"] = WORKER_MAX_TASKS
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=ctx,
+        initializer=init_worker,
+        **kwargs
+    )
+
+
+def pool_pids(pool) -> list:
+    """PID процессов пула (публичного списка у ProcessPoolExecutor нет)"""
+    if pool is None:
+        return []
+    try:
+        return list((pool._processes or {}).keys())
+    except Exception:
+        return []
+
+
+def parsing_worker_with_progress(url: str, operation: str, chat_id: str, task_id: str,
+                                 prev_ids: list = None):
+    """Рабочая функция для парсинга в отдельном процессе
+
+    prev_ids - предыдущий набор ID для сравнения: ссылка на снимок {"snapshot": хэш}
+    или сам набор (удаленные воркеры не имеют доступа к файлам бота).
+    Историю ID записывает сам бот по результату задачи.
+    """
+    try:
+        log.info(f"🚀 Начало парсинга в процессе для {url}: {operation} (Task: {task_id})")
+
+        os.environ['PARSING_PROCESS'] = '1'
+        os.environ['PARSING_CHAT_ID'] = chat_id
+        os.environ['PARSING_TASK_ID'] = task_id
+
+        progress_file = f"progress_{task_id}.txt"
+
+        def update_progress(message: str):
+            try:
+                with open(progress_file, "w", encoding="utf-8") as f:
+                    f.write(message)
+            except Exception as e:
+                log.warning(f"⚠️ Ошибка записи прогресса для {task_id}: {e}")
+
+        class ProgressExtractor(TaskIdExtractor):
+            def __init__(self, progress_callback, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.progress_callback = progress_callback
+                self.checkpoint_id = task_id
+                # Пакетный парсинг: браузер переживает предмет и используется дальше
+                self.keep_driver = False
+
+            def close_driver(self):
+                if self.driver:
+                    self.network.collect(self.driver)
+                    try:
+                        self.driver.quit()
+                    except:
+                        pass
+                    self.driver = None
+
+            def _reopen(self, url: str):
+                """Ждет доступности хоста и заново открывает страницу в новом браузере"""
+                self._wait_for_host()
+                self.driver = self._init_driver()
+                acquire(url)
+                self.driver.get(url)
+                time.sleep(5)
+
+            def extract_ids_sync(self, url: str):
+                self.progress_callback("🚀 Парсинг начался...")
+                self.start_time = time.time()
+                self.current_url = url
+
+                try:
+                    self._wait_for_host()
+                    if self.driver is None:
+                        self.driver = self._init_driver()
+                    log.info(f"📖 Начало парсинга ID для {url} (Task: {task_id})")
+
+                    acquire(url)
+                    self.driver.get(url)
+                    time.sleep(5)
+
+                    try:
+                        from selenium.webdriver.common.by import By
+                        from selenium.webdriver.support.ui import WebDriverWait
+                        from selenium.webdriver.support import expected_conditions as EC
+
+                        btn = WebDriverWait(self.driver, self.timeout).until(
+                            EC.element_to_be_clickable((By.CLASS_NAME, "button-clear"))
+                        )
+                        self.driver.execute_script("arguments[0].click();", btn)
+                        time.sleep(3)
+                        self.progress_callback("✅ Фильтры сброшены")
+                    except Exception as e:
+                        log.warning(f"⚠️ Не удалось сбросить фильтры для {task_id}: {e}")
+
+                    total = self._total_pages()
+                    self.progress_callback(f"📄 Найдено страниц: {total}")
+
+                    all_ids = set()
+                    failed_pages = []
+                    start_page = 1
+
+                    checkpoint = load_checkpoint(self.checkpoint_id)
+                    if checkpoint and checkpoint.get("total") == total:
+                        all_ids = IdSet.from_store(checkpoint["ids"]).to_set()
+                        failed_pages = checkpoint.get("failed_pages", [])
+                        start_page = checkpoint["page"] + 1
+                        self.progress_callback(f"♻️ Продолжение с страницы {start_page}/{total}")
+
+                    for p in range(start_page, total + 1):
+                        max_retries = 3
+                        retry_count = 0
+                        page_success = False
+                        self.page_start_time = time.time()
+
+                        while retry_count < max_retries and not page_success:
+                            try:
+                                self._check_timeout()
+
+                                if p > 1:
+                                    # После восстановления нужной кнопки в пейджере может не быть
+                                    use_input_field = retry_count > 0 or p == start_page
+                                    if not self._goto(p, use_input_field=use_input_field):
+                                        raise Exception("Навигация не удалась")
+
+                                self.progress_callback(f"📖 Страница {p}/{total}")
+
+                                ids = self._ids_on_page()
+
+                                if ids or p == total:
+                                    all_ids.update(ids)
+                                    page_success = True
+                                    record_success(url)
+                                    self.progress_callback(f"✅ Страница {p}/{total} - найдено {len(ids)} ID")
+                                else:
+                                    raise Exception(f"Пустая страница {p}")
+
+                            except (ParsingCancelled, TimeoutError):
+                                raise
+                            except PageTimeoutError as e:
+                                # Срок страницы общий для попыток и пауз - пропускаем ее без повторов
+                                failed_pages.append(p)
+                                self.progress_callback(f"⏰ Страница {p} пропущена: {e}")
+                                if self.driver is None:
+                                    self.page_start_time = None
+                                    self._reopen(url)
+                                break
+                            except Exception as e:
+                                retry_count += 1
+                                record_failure(url, e)
+                                self.progress_callback(f"⚠️ Ошибка на странице {p}, попытка {retry_count}")
+
+                                if retry_count < max_retries:
+                                    self.network.collect(self.driver)
+                                    try:
+                                        self.driver.quit()
+                                    except:
+                                        pass
+                                    self.driver = None
+
+                                    time.sleep(backoff_delay(retry_count))
+                                    if is_open(url):
+                                        self.progress_callback("🔌 Сайт ФИПИ недоступен, парсинг на паузе")
+                                    self._reopen(url)
+                                else:
+                                    failed_pages.append(p)
+                                    self.progress_callback(f"❌ Страница {p} пропущена")
+
+                        if p % CHECKPOINT_INTERVAL_PAGES == 0:
+                            save_checkpoint(self.checkpoint_id, p, total, all_ids, failed_pages)
+
+                    self.page_start_time = None
+                    if failed_pages:
+                        self.progress_callback(f"⚠️ Пропущены страницы: {failed_pages}")
+
+                    self.network.collect(self.driver)
+                    log.info(f"🌐 Сетевой трафик {task_id}: {self.network.summary()}")
+                    self.progress_callback(f"🎉 Парсинг завершен! Найдено {len(all_ids)} ID")
+                    return all_ids
+
+                except ParsingCancelled:
+                    self.progress_callback("⛔ Парсинг отменен")
+                    raise
+                except Exception as e:
+                    self.progress_callback(f"❌ Ошибка: {str(e)[:50]}...")
+                    raise e
+                finally:
+                    if not self.keep_driver:
+                        self.close_driver()
+
+        extractor = ProgressExtractor(update_progress, cancel_file=cancel_file_path(task_id))
+
+        if operation == "Создание файла ID":
+            ids = extractor.extract_ids_sync(url)
+            return {"status": "success", "result": IdSet(ids).to_store(), "error": None}
+        elif operation in ["Сравнение ID", "Автоматический парсинг"]:
+            # Тексты заданий пишутся в общий каталог - только при общей файловой системе
+            shared_fs = isinstance(prev_ids, dict) and "snapshot" in prev_ids
+            extractor.capture_content = TASK_CONTENT_CAPTURE and shared_fs
+            current_ids = IdSet(extractor.extract_ids_sync(url))
+            if prev_ids is None:
+                from database import ensure_store
+                process_store = ensure_store()
+                prev_ids = process_store["last_ids"].get(url, [])
+            added, removed = current_ids.changes_since(load_ids(prev_ids))
+            result = {
+                "added": added.to_store(),
+                "removed": removed.to_store(),
+                "count": len(current_ids)
+            }
+            if isinstance(prev_ids, dict) and "snapshot" in prev_ids:
+                # Общая файловая система: возвращаем только разницу и ссылку на новый снимок
+                result["base"] = prev_ids["snapshot"]
+                result["snapshot"] = write_snapshot(current_ids)
+                if extractor.capture_content and extractor.content_hashes:
+                    result["content"] = write_manifest(extractor.content_hashes)
+                    try:
+                        if prev_ids.get("content"):
+                            result["edited"] = edited_ids(read_manifest(prev_ids["content"]),
+                                                          extractor.content_hashes).to_store()
+                    except (OSError, ValueError) as e:
+                        log.warning(f"⚠️ Предыдущий манифест содержимого недоступен: {e}")
+            else:
+                result["current_ids"] = current_ids.to_store()
+            return {"status": "success", "result": result, "error": None}
+        elif operation == BATCH_OPERATION:
+            result = crawl_batch(extractor, batch_urls(url), update_progress, task_id)
+            return {"status": "success", "result": result, "error": None}
+        else:
+            return {"status": "error", "result": None, "error": f"Неизвестная операция: {operation}"}
+
+    except ParsingCancelled:
+        log.info(f"⛔ Парсинг {url} отменен (Task: {task_id})")
+        return {"status": "cancelled", "result": None, "error": "Парсинг отменен"}
+    except Exception as e:
+        try:
+            with open(f"progress_{task_id}.txt", "w", encoding="utf-8") as f:
+                f.write(f"❌ Ошибка: {str(e)[:100]}")
+        except:
+            pass
+        log.error(f"❌ Ошибка парсинга в процессе для {url} (Task: {task_id}): {e}", exc_info=True)
+        return {"status": "error", "result": None, "error": str(e)}
+    finally:
+        for env_var in ['PARSING_PROCESS', 'PARSING_CHAT_ID', 'PARSING_TASK_ID']:
+            if env_var in os.environ:
+                del os.environ[env_var]
+
+        for tmp_file in (f"progress_{task_id}.txt", cancel_file_path(task_id)):
+            try:
+                os.remove(tmp_file)
+            except:
+                pass
+
+
+def crawl_batch(extractor, urls: list, update_progress, task_id: str) -> dict:
+    """Обходит предметы по очереди одним браузером на хост
+
+    Предметы группируются по хосту: браузер запускается один раз и закрывается
+    при смене хоста. Ошибка одного предмета не прерывает остальные.
+    Готовые предметы записываются в журнал пакета (checkpoint_<task_id>.json):
+    продолженная после перезапуска задача их не обходит повторно.
+    Возвращает {"subjects": {url: IdSet.to_store()}, "failed": {url: ошибка}}.
+    """
+    from utils import subj_by_url
+    journal = load_checkpoint(task_id) or {}
+    subjects, failed = dict(journal.get("subjects", {})), {}
+    ordered = sorted(urls, key=host_of)
+    extractor.keep_driver = True
+    try:
+        for i, url in enumerate(ordered, 1):
+            prefix = f"📦 {i}/{len(ordered)} {subj_by_url(url)}"
+            if url in subjects:
+                update_progress(f"{prefix}\n♻️ Уже обработан до перезапуска")
+                continue
+            if i > 1 and host_of(url) != host_of(ordered[i - 2]):
+                extractor.close_driver()
+            extractor.progress_callback = lambda message, prefix=prefix: update_progress(f"{prefix}\n{message}")
+            extractor.checkpoint_id = f"{task_id}_{i}"
+            try:
+                subjects[url] = IdSet(extractor.extract_ids_sync(url)).to_store()
+                save_batch_journal(task_id, subjects)
+            except ParsingCancelled:
+                raise
+            except Exception as e:
+                log.warning(f"⚠️ Пакетный парсинг {task_id}: {url} не обработан: {e}")
+                failed[url] = str(e)[:200]
+                # Браузер после ошибки мог остаться в неизвестном состоянии
+                extractor.close_driver()
+            try:
+                os.remove(checkpoint_file_path(extractor.checkpoint_id))
+            except OSError:
+                pass
+    finally:
+        extractor.keep_driver = False
+        extractor.close_driver()
+    update_progress(f"🎉 Обработано предметов: {len(subjects)}/{len(ordered)}")
+    return {"subjects": subjects, "failed": failed}
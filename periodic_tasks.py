@@ -3,19 +3,29 @@
 Периодические задачи бота - Автоматический парсинг при изменениях
 """
 import os
-import asyncio
 import logging
+from collections import Counter
 from datetime import datetime, timedelta
 from telegram.ext import ContextTypes
 from parser import TaskIdExtractor
-from database import store, save_store, save_parsing_result
-from utils import subj_by_url, get_current_count, split_message
+from database import store, save_store, save_parsing_result, get_recent_parsing
+from utils import subj_by_url, split_message
+from count_cache import refresh_count, get_cached_count
+from fingerprint import run_probe, update_fingerprint, probe_due
+from host_health import is_open, retry_in, host_of
+from config import FINGERPRINT_PROBE_ENABLED, PREWARM_TOP_SUBJECTS, HISTORY_RETENTION_DAYS
 from keyboards import kb_main_reply
+from digest import queue_for_digest, count_event, ids_event, no_ids_event
+from channels import direct_subscribers, publish, chat_ref
 
 log = logging.getLogger("FIPI-Bot")
 
 # Глобальная переменная для отслеживания активных парсингов
 active_auto_parsing = set()
+# Автопарсинги, запущенные по отпечатку: без изменений ID пользователей не беспокоим
+fingerprint_parsing = set()
+# Ночной прогрев кэша: сообщаем только о найденных изменениях ID
+prewarm_parsing = set()
 
 async def periodic_check(context: ContextTypes.DEFAULT_TYPE):
     """Периодическая проверка изменений каждую минуту"""
@@ -38,17 +48,21 @@ async def periodic_check(context: ContextTypes.DEFAULT_TYPE):
 async def check_url_changes(context: ContextTypes.DEFAULT_TYPE, url: str):
     """Проверяет изменения для конкретного URL"""
     subject_name = subj_by_url(url)
+    if is_open(url):
+        log.info(f"🔌 {host_of(url)} на паузе еще {retry_in(url):.0f} сек, проверка {subject_name} пропущена")
+        return
     try:
         log.info(f"📊 Проверяю количество заданий для {subject_name}")
-        try:
-            current_count = await asyncio.to_thread(get_current_count, url)
-        except AttributeError:
-            loop = asyncio.get_event_loop()
-            current_count = await loop.run_in_executor(None, get_current_count, url)
+        probe = None
+        if FINGERPRINT_PROBE_ENABLED and probe_due(url):
+            # Одна загрузка браузера дает и количество, и отпечаток страниц
+            probe = await run_probe(url)
+        current_count = probe["count"] if probe else await refresh_count(url)
         if current_count is None:
             log.warning(f"⚠️ Не удалось получить количество для {subject_name}")
             return
         previous_count = store["last_counts"].get(url)
+        changed_pages = update_fingerprint(url, probe) if probe else []
         if previous_count is None:
             log.info(f"📝 Первая проверка {subject_name}: {current_count} заданий")
             store["last_counts"][url] = current_count
@@ -65,6 +79,19 @@ async def check_url_changes(context: ContextTypes.DEFAULT_TYPE, url: str):
                 await start_automatic_parsing(context, url, current_count)
             finally:
                 active_auto_parsing.discard(url)
+        elif changed_pages:
+            log.info(f"🚨 Отпечаток {subject_name} изменился (страницы {changed_pages}) "
+                     f"при том же количестве {current_count}")
+            if url in active_auto_parsing:
+                log.info(f"⏳ Парсинг для {subject_name} уже активен, пропускаю")
+                return
+            active_auto_parsing.add(url)
+            fingerprint_parsing.add(url)
+            try:
+                await start_automatic_parsing(context, url, current_count,
+                                              on_finish=lambda: fingerprint_parsing.discard(url))
+            finally:
+                active_auto_parsing.discard(url)
         else:
             log.debug(f"📊 {subject_name}: количество не изменилось ({current_count})")
     except Exception as e:
@@ -74,12 +101,7 @@ async def notify_quantity_change(context: ContextTypes.DEFAULT_TYPE, url: str,
                                  old_count: int, new_count: int):
     """Уведомляет пользователей об изменении количества заданий"""
     subject_name = subj_by_url(url)
-    subscribers = []
-    for chat_id, urls in store["subscriptions"].items():
-        if url in urls:
-            subscribers.append(chat_id)
-    if not subscribers:
-        return
+    subscribers = direct_subscribers(url)
     change_type = "📈 Увеличилось" if new_count > old_count else "📉 Уменьшилось"
     difference = abs(new_count - old_count)
     message = (f"🔔 Автоматическое обнаружение изменений!\n\n"
@@ -87,6 +109,10 @@ async def notify_quantity_change(context: ContextTypes.DEFAULT_TYPE, url: str,
                f"{change_type} на {difference}\n"
                f"📊 Было: {old_count} → Стало: {new_count}\n\n"
                f"🤖 Автоматически запускаю парсинг для поиска изменений...")
+    await publish(context, url, message)
+    subscribers = queue_for_digest(subscribers, count_event(url, old_count, new_count))
+    if not subscribers:
+        return
     log.info(f"📢 Отправка уведомлений {len(subscribers)} подписчикам")
     for chat_id in subscribers:
         try:
@@ -98,8 +124,12 @@ async def notify_quantity_change(context: ContextTypes.DEFAULT_TYPE, url: str,
         except Exception as e:
             log.error(f"❌ Ошибка отправки уведомления пользователю {chat_id}: {e}")
 
-async def start_automatic_parsing(context: ContextTypes.DEFAULT_TYPE, url: str, current_count: int):
-    """Запускает автоматический парсинг при изменении количества"""
+async def start_automatic_parsing(context: ContextTypes.DEFAULT_TYPE, url: str, current_count: int,
+                                  on_finish=None):
+    """Запускает автоматический парсинг при изменении количества
+
+    on_finish() вызывается после завершения задачи при любом исходе.
+    """
     from queue_manager import queue_parsing_task
     subject_name = subj_by_url(url)
     log.info(f"🚀 Запуск автоматического парсинга для {subject_name}")
@@ -117,48 +147,69 @@ async def start_automatic_parsing(context: ContextTypes.DEFAULT_TYPE, url: str,
             auto_query, fake_context, "cmp_0",
             "Автоматический парсинг",
             lambda q, c, r, u: auto_parsing_callback(q, c, r, u, context),
-            is_auto=True
+            is_auto=True, on_finish=on_finish
         )
     except Exception as e:
         log.error(f"❌ Ошибка запуска автоматического парсинга для {subject_name}: {e}")
+        if on_finish:
+            on_finish()
 
 async def auto_parsing_callback(query, context_unused, result, url, bot_context):
     """Callback для автоматического парсинга"""
     try:
-        current_ids, added, removed = result
+        current_ids, added, removed, edited = result
         timestamp = datetime.now().isoformat()
         current_count = len(current_ids)
         store["last_counts"][url] = current_count
         save_store(store)
-        if added or removed:
-            await notify_id_changes(bot_context, url, added, removed, len(current_ids))
+        by_fingerprint = url in fingerprint_parsing
+        by_prewarm = url in prewarm_parsing
+        if added or removed or edited:
+            await notify_id_changes(bot_context, url, added, removed, len(current_ids), edited)
+        elif by_fingerprint:
+            log.info(f"ℹ️ {subj_by_url(url)}: отпечаток изменился, но состав ID прежний")
+        elif by_prewarm:
+            log.info(f"🔥 {subj_by_url(url)}: кэш прогрет, изменений ID нет")
         else:
             await notify_no_id_changes(bot_context, url, len(current_ids))
     except Exception as e:
         log.error(f"❌ Ошибка в callback автопарсинга для {url}: {e}")
 
+def register_auto_parsing_resume():
+    """Регистрирует колбэк автопарсинга для задач, продолженных после перезапуска"""
+    from queue_manager import register_resume_callback
+    register_resume_callback(
+        "Автоматический парсинг",
+        lambda q, c, r, u: auto_parsing_callback(q, c, r, u, c)
+    )
+
+register_auto_parsing_resume()
+
 async def notify_id_changes(context: ContextTypes.DEFAULT_TYPE, url: str,
-                           added: set, removed: set, total_count: int):
-    """Уведомляет о найденных изменениях ID"""
+                           added: set, removed: set, total_count: int, edited=()):
+    """Уведомляет о найденных изменениях ID (edited - задания с измененным текстом)"""
     subject_name = subj_by_url(url)
     timestamp = datetime.now().isoformat()
-    subscribers = []
-    for chat_id, urls in store["subscriptions"].items():
-        if url in urls:
-            subscribers.append(chat_id)
-    if not subscribers:
-        return
+    subscribers = direct_subscribers(url)
     change_parts = []
     if added:
         change_parts.append(f"➕ Добавлено: {len(added)} ID")
     if removed:
         change_parts.append(f"➖ Удалено: {len(removed)} ID")
+    if edited:
+        change_parts.append(f"✏️ Изменено: {len(edited)} заданий")
     change_text = "\n".join(change_parts)
     main_message = (f"✅ Автоматический парсинг завершен!\n\n"
                     f"📚 {subject_name}\n"
                     f"🆔 Всего ID: {total_count}\n\n"
                     f"🔍 НАЙДЕНЫ ИЗМЕНЕНИЯ:\n{change_text}\n\n"
                     f"📄 Подробности в файле ↓")
+    channel = await publish(context, url, main_message)
+    if channel:
+        await send_auto_changes_file(context, channel, url, added, removed, timestamp, edited)
+    subscribers = queue_for_digest(subscribers, ids_event(url, added, removed, total_count, edited))
+    if not subscribers:
+        return
     log.info(f"📊 Отправка результатов изменений {len(subscribers)} подписчикам")
     for chat_id in subscribers:
         try:
@@ -169,23 +220,22 @@ async def notify_id_changes(context: ContextTypes.DEFAULT_TYPE, url: str,
                     text=msg,
                     reply_markup=kb_main_reply()
                 )
-            await send_auto_changes_file(context, chat_id, url, added, removed, timestamp)
+            await send_auto_changes_file(context, chat_id, url, added, removed, timestamp, edited)
         except Exception as e:
             log.error(f"❌ Ошибка отправки результатов пользователю {chat_id}: {e}")
 
 async def notify_no_id_changes(context: ContextTypes.DEFAULT_TYPE, url: str, total_count: int):
     """Уведомляет об отсутствии изменений ID"""
     subject_name = subj_by_url(url)
-    subscribers = []
-    for chat_id, urls in store["subscriptions"].items():
-        if url in urls:
-            subscribers.append(chat_id)
-    if not subscribers:
-        return
+    subscribers = direct_subscribers(url)
     message = (f"✅ Автоматический парсинг завершен!\n\n"
                f"📚 {subject_name}\n"
                f"🆔 Всего ID: {total_count}\n\n"
                f"ℹ️ Количество заданий изменилось, но состав ID остался прежним")
+    await publish(context, url, message)
+    subscribers = queue_for_digest(subscribers, no_ids_event(url, total_count))
+    if not subscribers:
+        return
     for chat_id in subscribers:
         try:
             await context.bot.send_message(
@@ -197,7 +247,7 @@ async def notify_no_id_changes(context: ContextTypes.DEFAULT_TYPE, url: str, tot
             log.error(f"❌ Ошибка отправки уведомления {chat_id}: {e}")
 
 async def send_auto_changes_file(context: ContextTypes.DEFAULT_TYPE, chat_id: str,
-                                url: str, added: set, removed: set, timestamp: str):
+                                url: str, added: set, removed: set, timestamp: str, edited=()):
     """Создает и отправляет файл с изменениями ID"""
     try:
         subject_name = subj_by_url(url)
@@ -220,13 +270,21 @@ async def send_auto_changes_file(context: ContextTypes.DEFAULT_TYPE, chat_id: st
                 for task_id in sorted(removed):
                     f.write(f"{task_id}\n")
                 f.write("\n")
+            if edited:
+                f.write(f"✏️ ИЗМЕНЕН ТЕКСТ ({len(edited)}):\n")
+                f.write("-" * 30 + "\n")
+                for task_id in sorted(edited):
+                    f.write(f"{task_id}\n")
+                f.write("\n")
             f.write(f"📊 СТАТИСТИКА:\n")
             f.write(f"Добавлено: {len(added)} ID\n")
             f.write(f"Удалено: {len(removed)} ID\n")
+            if edited:
+                f.write(f"Изменено: {len(edited)} заданий\n")
             f.write(f"Общее изменение: {len(added) - len(removed):+d} ID\n")
         with open(filename, "rb") as f:
             await context.bot.send_document(
-                chat_id=int(chat_id),
+                chat_id=chat_ref(chat_id),
                 document=f,
                 filename=filename,
                 caption=f"🤖 Автоматическое обнаружение изменений\n📚 {subject_name}"
@@ -241,24 +299,34 @@ async def send_auto_changes_file(context: ContextTypes.DEFAULT_TYPE, chat_id: st
 async def cleanup_old_data():
     """Очищает устаревшие данные"""
     try:
-        cutoff_date = datetime.now() - timedelta(days=30)
+        cutoff_date = datetime.now() - timedelta(days=HISTORY_RETENTION_DAYS)
         cleaned_count = 0
         for url in list(store.get("historical_ids", {}).keys()):
             history = store["historical_ids"][url]
             if history:
-                # Сортируем по дате (новые сверху)
-                sorted_history = sorted(history, key=lambda x: datetime.fromisoformat(x["timestamp"]), reverse=True)
-                # Сохраняем последний (самый свежий)
-                filtered_history = [sorted_history[0]]
-                # Добавляем остальные, если не старше cutoff
-                for record in sorted_history[1:]:
-                    if datetime.fromisoformat(record["timestamp"]) > cutoff_date:
-                        filtered_history.append(record)
-                if len(filtered_history) != len(history):
+                # Сортируем по дате (старые сначала - так историю читает id_history)
+                sorted_history = sorted(history, key=lambda x: datetime.fromisoformat(x["timestamp"]))
+                older = [r for r in sorted_history if datetime.fromisoformat(r["timestamp"]) <= cutoff_date]
+                # Последняя запись до cutoff - состав на момент cutoff, ее сохраняем
+                filtered_history = older[-1:] + sorted_history[len(older):]
+                if filtered_history != history:
                     store["historical_ids"][url] = filtered_history
                     cleaned_count += len(history) - len(filtered_history)
-        from database import clean_old_parsing_cache
+        from database import clean_old_parsing_cache, clean_finished_jobs
         clean_old_parsing_cache()
+        clean_finished_jobs()
+        from id_snapshots import clean_snapshots
+        referenced = {ref["snapshot"] for ref in store.get("last_ids", {}).values()
+                      if isinstance(ref, dict) and "snapshot" in ref}
+        removed_snapshots = clean_snapshots(referenced)
+        if removed_snapshots:
+            log.info(f"🧹 Удалено неиспользуемых снимков ID: {removed_snapshots}")
+        from task_content import clean_content
+        manifests = {ref["content"] for ref in store.get("last_ids", {}).values()
+                     if isinstance(ref, dict) and "content" in ref}
+        removed_content = clean_content(manifests)
+        if removed_content:
+            log.info(f"🧹 Удалено устаревших текстов заданий: {removed_content}")
         empty_subscriptions = []
         for chat_id, urls in store.get("subscriptions", {}).items():
             if not urls:
@@ -272,6 +340,37 @@ async def cleanup_old_data():
     except Exception as e:
         log.error(f"❌ Ошибка очистки данных: {e}")
 
+def top_subscribed_urls(limit: int = PREWARM_TOP_SUBJECTS) -> list:
+    """URL предметов с наибольшим числом подписчиков"""
+    subscribers = Counter(url for urls in store["subscriptions"].values() for url in urls)
+    return [url for url, _ in subscribers.most_common(limit)]
+
+async def nightly_prewarm(context: ContextTypes.DEFAULT_TYPE):
+    """Ночной парсинг популярных предметов: днем файл ID отдается из кэша
+
+    Запускается как автопарсинг: обновляет last_ids и кэш результатов, а если
+    ночью нашлись изменения ID, подписчики получают обычное уведомление.
+    """
+    urls = top_subscribed_urls()
+    if not urls:
+        log.info("📭 Прогрев кэша: нет подписок")
+        return
+    log.info(f"🔥 Ночной прогрев кэша для {len(urls)} предметов")
+    for url in urls:
+        subject_name = subj_by_url(url)
+        if is_open(url):
+            log.info(f"🔌 {host_of(url)} на паузе, прогрев {subject_name} пропущен")
+            continue
+        if get_recent_parsing(url, "Создание файла ID", current_count=get_cached_count(url)[0]):
+            log.info(f"📁 {subject_name}: кэш еще актуален, прогрев не нужен")
+            continue
+        if url in active_auto_parsing or url in prewarm_parsing:
+            log.info(f"⏳ Парсинг для {subject_name} уже активен, пропускаю")
+            continue
+        prewarm_parsing.add(url)
+        await start_automatic_parsing(context, url, store["last_counts"].get(url),
+                                      on_finish=lambda u=url: prewarm_parsing.discard(u))
+
 async def daily_cleanup(context: ContextTypes.DEFAULT_TYPE):
     """Ежедневная очистка устаревших данных"""
     log.info("🧹 Запуск ежедневной очистки данных")
@@ -280,6 +379,7 @@ async def daily_cleanup(context: ContextTypes.DEFAULT_TYPE):
         temp_files_removed = 0
         for filename in os.listdir("."):
             if (filename.startswith("progress_") or
+                filename.startswith("cancel_") or
                 filename.startswith("auto_changes_") or
                 filename.startswith("cached_ids_") or
                 filename.startswith("ids_") or
@@ -299,6 +399,6 @@ async def daily_cleanup(context: ContextTypes.DEFAULT_TYPE):
         log.info(f" 👥 Пользователей: {total_users}")
         log.info(f" 📚 Подписок: {total_subscriptions}")
         log.info(f" 🗂️ URLs в истории: {len(store.get('historical_ids', {}))}")
-        log.info(f" 💾 Размер кэша: {len(store.get('recent_parsing', {}))}")
+        log.info(f" 💾 Размер кэша: {len(store.get('parsing_cache', {}))}")
     except Exception as e:
         log.error(f"❌ Ошибка ежедневной очистки: {e}")
@@ -6,202 +6,94 @@ import asyncio
 import logging
 import os
 import time
-import psutil
-from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from telegram import CallbackQuery
 from telegram.ext import ContextTypes
-from typing import Dict
-
-from parser import TaskIdExtractor
-from database import store, save_store
+from telegram.error import RetryAfter
+from typing import Callable, Dict
+
+from parsing_worker import (parsing_worker_with_progress, create_worker_pool, cancel_file_path,
+                            remove_checkpoints, pool_pids)
+from database import store, save_store, journal_job, get_unfinished_jobs, save_parsing_result
+from id_set import IdSet
+from id_snapshots import load_ids, read_snapshot, snapshot_ref
+from host_health import get_hosts_status
+from batch_ids import BATCH_OPERATION, batch_urls
+from rate_limiter import get_rate_limit_stats
 from keyboards import kb_main_reply
+from system_metrics import get_snapshot, set_worker_pids_provider
+from resource_manager import check_resources
+from ui_updater import progress_updater
+from crawler_client import (run_remote_job, cancel_remote_job, get_service_status,
+                            run_distributed_job, cancel_distributed_job, get_distributed_status)
 from config import (PARSING_TIMEOUT, MAX_CONCURRENT_PARSING, MAX_CONCURRENT_AUTO_PARSING,
-                    MEMORY_LIMIT_PERCENT, CPU_LIMIT_PERCENT)
+                    WORKER_MAX_TASKS, WORKER_MAX_RSS_MB, RESOURCE_WAIT_INTERVAL,
+                    CRAWLER_MODE)
 
 log = logging.getLogger("FIPI-Bot")
 
 # Глобальные переменные
 executor = None
+# Старые пулы после пересоздания: доделывают свои задачи, затем завершаются
+retiring_executors: list = []
+# Слоты воркеров на оба пула сразу: при пересоздании новый пул получает только
+# освободившиеся слоты, и браузеров не становится вдвое больше
+worker_slots = asyncio.Semaphore(MAX_CONCURRENT_PARSING)
 active_tasks: Dict[str, Dict] = {}
 running_futures: Dict[str, asyncio.Future] = {}
+# Колбэки для задач, восстановленных после перезапуска (operation -> callback)
+resume_callbacks: Dict[str, Callable] = {}
 
 
-def parsing_worker_with_progress(url: str, operation: str, chat_id: str, task_id: str):
-    """Рабочая функция для парсинга в отдельном процессе"""
-    try:
-        log.info(f"🚀 Начало парсинга в процессе для {url}: {operation} (Task: {task_id})")
-
-        os.environ['PARSING_PROCESS'] = '1'
-        os.environ['PARSING_CHAT_ID'] = chat_id
-        os.environ['PARSING_TASK_ID'] = task_id
-
-        progress_file = f"progress_{task_id}.txt"
-
-        def update_progress(message: str):
-            try:
-                with open(progress_file, "w", encoding="utf-8") as f:
-                    f.write(message)
-            except Exception as e:
-                log.warning(f"⚠️ Ошибка записи прогресса для {task_id}: {e}")
-
-        class ProgressExtractor(TaskIdExtractor):
-            def __init__(self, progress_callback, *args, **kwargs):
-                super().__init__(*args, **kwargs)
-                self.progress_callback = progress_callback
-
-            def extract_ids_sync(self, url: str):
-                self.progress_callback("🚀 Парсинг начался...")
-                self.start_time = time.time()
-
-                try:
-                    self.driver = self._init_driver()
-                    log.info(f"📖 Начало парсинга ID для {url} (Task: {task_id})")
-
-                    self.driver.get(url)
-                    time.sleep(5)
-
-                    try:
-                        from selenium.webdriver.common.by import By
-                        from selenium.webdriver.support.ui import WebDriverWait
-                        from selenium.webdriver.support import expected_conditions as EC
-
-                        btn = WebDriverWait(self.driver, self.timeout).until(
-                            EC.element_to_be_clickable((By.CLASS_NAME, "button-clear"))
-                        )
-                        self.driver.execute_script("arguments[0].click();", btn)
-                        time.sleep(3)
-                        self.progress_callback("✅ Фильтры сброшены")
-                    except Exception as e:
-                        log.warning(f"⚠️ Не удалось сбросить фильтры для {task_id}: {e}")
-
-                    total = self._total_pages()
-                    self.progress_callback(f"📄 Найдено страниц: {total}")
-
-                    all_ids = set()
-                    failed_pages = []
-
-                    for p in range(1, total + 1):
-                        max_retries = 3
-                        retry_count = 0
-                        page_success = False
-
-                        while retry_count < max_retries and not page_success:
-                            try:
-                                self._check_timeout()
-
-                                if p > 1:
-                                    use_input_field = retry_count > 0
-                                    if not self._goto(p, use_input_field=use_input_field):
-                                        raise Exception("Навигация не удалась")
-
-                                self.progress_callback(f"📖 Страница {p}/{total}")
-
-                                ids = self._ids_on_page()
-
-                                if ids or p == total:
-                                    all_ids.update(ids)
-                                    page_success = True
-                                    self.progress_callback(f"✅ Страница {p}/{total} - найдено {len(ids)} ID")
-                                else:
-                                    raise Exception(f"Пустая страница {p}")
-
-                            except Exception as e:
-                                retry_count += 1
-                                self.progress_callback(f"⚠️ Ошибка на странице {p}, попытка {retry_count}")
-
-                                if retry_count < max_retries:
-                                    try:
-                                        self.driver.quit()
-                                    except:
-                                        pass
-
-                                    time.sleep(5 * retry_count)
-                                    self.driver = self._init_driver()
-                                    self.driver.get(url)
-                                    time.sleep(5)
-                                else:
-                                    failed_pages.append(p)
-                                    self.progress_callback(f"❌ Страница {p} пропущена")
-
-                    if failed_pages:
-                        self.progress_callback(f"⚠️ Пропущены страницы: {failed_pages}")
-
-                    if os.environ.get('PARSING_PROCESS'):
-                        timestamp = datetime.now().isoformat()
-                        from database import ensure_store
-                        process_store = ensure_store()
-                        if url not in process_store["historical_ids"]:
-                            process_store["historical_ids"][url] = []
-                        process_store["historical_ids"][url].append({
-                            "timestamp": timestamp,
-                            "ids": list(all_ids)
-                        })
-                        save_store(process_store)
-
-                    self.progress_callback(f"🎉 Парсинг завершен! Найдено {len(all_ids)} ID")
-                    return all_ids
-
-                except Exception as e:
-                    self.progress_callback(f"❌ Ошибка: {str(e)[:50]}...")
-                    raise e
-                finally:
-                    if self.driver:
-                        try:
-                            self.driver.quit()
-                        except:
-                            pass
-                        self.driver = None
-
-        extractor = ProgressExtractor(update_progress)
+def get_worker_pids() -> list:
+    """PID воркеров текущего и завершающихся пулов"""
+    pids = pool_pids(executor)
+    for pool in retiring_executors:
+        pids.extend(pool_pids(pool))
+    return pids
 
-        if operation == "Создание файла ID":
-            ids = extractor.extract_ids_sync(url)
-            return {"status": "success", "result": list(ids), "error": None}
-        elif operation in ["Сравнение ID", "Автоматический парсинг"]:
-            current_ids = extractor.extract_ids_sync(url)
-            from database import ensure_store
-            process_store = ensure_store()
-            prev_ids = set(process_store["last_ids"].get(url, []))
-            added = current_ids - prev_ids
-            removed = prev_ids - current_ids
-            return {
-                "status": "success",
-                "result": {
-                    "current_ids": list(current_ids),
-                    "added": list(added),
-                    "removed": list(removed)
-                },
-                "error": None
-            }
-        else:
-            return {"status": "error", "result": None, "error": f"Неизвестная операция: {operation}"}
 
-    except Exception as e:
-        try:
-            with open(f"progress_{task_id}.txt", "w", encoding="utf-8") as f:
-                f.write(f"❌ Ошибка: {str(e)[:100]}")
-        except:
-            pass
-        log.error(f"❌ Ошибка парсинга в процессе для {url} (Task: {task_id}): {e}", exc_info=True)
-        return {"status": "error", "result": None, "error": str(e)}
-    finally:
-        for env_var in ['PARSING_PROCESS', 'PARSING_CHAT_ID', 'PARSING_TASK_ID']:
-            if env_var in os.environ:
-                del os.environ[env_var]
+async def init_executor():
+    """Инициализация пула процессов"""
+    global executor
+    if executor is None:
+        executor = create_worker_pool()
+        set_worker_pids_provider(get_worker_pids)
+        log.info(f"🔧 Инициализирован пул процессов: {MAX_CONCURRENT_PARSING} workers "
+                 f"(перезапуск после {WORKER_MAX_TASKS} задач или {WORKER_MAX_RSS_MB} MB)")
 
-        try:
-            os.remove(f"progress_{task_id}.txt")
-        except:
-            pass
+
+async def retire_executor(pool):
+    """Дожидается завершения задач старого пула (до этого он учитывается в метриках)"""
+    try:
+        await asyncio.to_thread(pool.shutdown, wait=True)
+        log.info("♻️ Старый пул процессов завершен")
+    finally:
+        retiring_executors.remove(pool)
 
 
-async def init_executor():
-    """Инициализация пула процессов"""
+async def recycle_executor():
+    """Пересоздает пул: новые задачи идут в свежие воркеры, старые доделывают текущие"""
     global executor
+    old_executor = executor
+    executor = create_worker_pool()
+    if old_executor:
+        retiring_executors.append(old_executor)
+        asyncio.create_task(retire_executor(old_executor))
+    log.info("♻️ Пул процессов пересоздан")
+
+
+async def check_worker_memory():
+    """Пересоздает пул, если какой-либо воркер текущего пула превысил лимит памяти"""
     if executor is None:
-        executor = ProcessPoolExecutor(max_workers=MAX_CONCURRENT_PARSING)
-        log.info(f"🔧 Инициализирован пул процессов: {MAX_CONCURRENT_PARSING} workers")
+        return
+    current = set(pool_pids(executor))
+    workers = get_snapshot().get("worker_processes", {})
+    bloated = {pid: rss for pid, rss in workers.items() if pid in current and rss > WORKER_MAX_RSS_MB}
+    if bloated:
+        log.warning(f"⚠️ Воркеры превысили {WORKER_MAX_RSS_MB} MB: "
+                    + ", ".join(f"{pid}={rss:.0f} MB" for pid, rss in bloated.items()))
+        await recycle_executor()
 
 
 async def shutdown_executor():
@@ -209,13 +101,160 @@ async def shutdown_executor():
     global executor
     if executor:
         log.info("🔧 Завершение пула процессов")
-        executor.shutdown(wait=True, cancel_futures=True)
+        interrupted = cancel_all_tasks(interrupt=True)
+        if interrupted:
+            log.info(f"⏸️ Прервано задач перед остановкой (будут продолжены после запуска): {interrupted}")
+        # Воркеры увидят флаг отмены на следующей странице - ждем их в отдельном потоке
+        old_executor = executor
         executor = None
+        await asyncio.to_thread(old_executor.shutdown, wait=True, cancel_futures=True)
+        for pool in list(retiring_executors):
+            await asyncio.to_thread(pool.shutdown, wait=True)
+
+
+def cancel_task(task_id: str, interrupt: bool = False) -> bool:
+    """Запрашивает отмену задачи: воркер остановится на следующей странице
+
+    При interrupt=True задача остается в журнале и будет продолжена после перезапуска.
+    """
+    task_info = active_tasks.get(task_id)
+    if not task_info:
+        return False
+
+    task_info["status"] = "interrupted" if interrupt else "cancelling"
+    if CRAWLER_MODE == "service":
+        # Сервис переживает перезапуск бота - прерывать его задачи не нужно
+        if not interrupt:
+            asyncio.create_task(cancel_remote_job(task_id))
+    elif CRAWLER_MODE == "distributed":
+        # Задача в общей очереди продолжится на воркере и после перезапуска бота
+        if not interrupt:
+            asyncio.create_task(cancel_distributed_job(task_id))
+    else:
+        try:
+            with open(cancel_file_path(task_id), "w", encoding="utf-8") as f:
+                f.write(datetime.now().isoformat())
+        except Exception as e:
+            log.warning(f"⚠️ Не удалось создать флаг отмены для {task_id}: {e}")
+
+    future = running_futures.get(task_id)
+    if future and not future.done():
+        future.cancel()
+
+    log.info(f"⛔ Запрошена отмена задачи {task_id}")
+    return True
+
+
+def cancel_user_tasks(chat_id: str) -> int:
+    """Отменяет все пользовательские задачи чата"""
+    task_ids = [tid for tid, t in active_tasks.items()
+                if t.get("chat_id") == chat_id and not t.get("is_auto", False)]
+    return sum(1 for tid in task_ids if cancel_task(tid))
+
+
+def cancel_all_tasks(interrupt: bool = False) -> int:
+    """Отменяет все активные задачи (для администратора и остановки бота)"""
+    return sum(1 for tid in list(active_tasks.keys()) if cancel_task(tid, interrupt=interrupt))
+
+
+def record_history(url: str, ids: IdSet):
+    """Записывает набор ID в историю; новая запись - только при изменении состава
+
+    Историю ведет бот: у воркеров своя копия хранилища, их запись затиралась бы.
+    """
+    now = datetime.now().isoformat()
+    history = store.setdefault("historical_ids", {}).setdefault(url, [])
+    if history and IdSet.from_store(history[-1]["ids"]) == ids:
+        history[-1]["checked"] = now
+    else:
+        history.append({"timestamp": now, "checked": now, "ids": ids.to_store()})
+    save_store(store)
+
+
+def previous_ids_ref(url: str) -> dict:
+    """Ссылка на снимок последнего набора ID (старые записи переводятся в снимки)"""
+    value = store["last_ids"].get(url, [])
+    if not (isinstance(value, dict) and "snapshot" in value):
+        value = snapshot_ref(IdSet.from_store(value))
+        store["last_ids"][url] = value
+        save_store(store)
+    return value
+
+
+def apply_ids_delta(url: str, result: dict) -> IdSet:
+    """Восстанавливает текущий набор ID из ответа воркера и запоминает его в last_ids"""
+    if "snapshot" in result:
+        previous = read_snapshot(result["base"])
+        current_ids = (previous - IdSet.from_store(result["removed"])) | IdSet.from_store(result["added"])
+        if len(current_ids) != result["count"]:
+            log.warning(f"⚠️ Разница ID для {url} не сошлась, читаю снимок целиком")
+            current_ids = read_snapshot(result["snapshot"])
+        store["last_ids"][url] = {"snapshot": result["snapshot"], "n": len(current_ids)}
+        if "content" in result:
+            store["last_ids"][url]["content"] = result["content"]
+    else:
+        current_ids = IdSet.from_store(result["current_ids"])
+        store["last_ids"][url] = snapshot_ref(current_ids)
+    save_store(store)
+    return current_ids
+
+
+async def wait_for_resources(task_id: str, query, chat_id: str, is_auto: bool) -> bool:
+    """Держит задачу в очереди, пока сервер перегружен (браузеры запускаются на этой машине)
+
+    False - задачу отменили или прервали во время ожидания.
+    """
+    announced = False
+    while not check_resources():
+        if active_tasks.get(task_id, {}).get("status") in ("cancelling", "interrupted"):
+            return False
+        if not announced:
+            log.info(f"⏳ Задача {task_id} ждет освобождения ресурсов сервера")
+            if query and not is_auto:
+                progress_updater.schedule(query, chat_id, "⏳ Сервер перегружен, парсинг начнется "
+                                                          "автоматически\n⛔ Отмена: /cancel")
+            announced = True
+        await asyncio.sleep(RESOURCE_WAIT_INTERVAL)
+    return active_tasks.get(task_id, {}).get("status") not in ("cancelling", "interrupted")
+
+
+async def acquire_worker_slot(task_id: str) -> bool:
+    """Ждет свободный слот воркера; False - задачу отменили или прервали во время ожидания"""
+    while True:
+        if active_tasks.get(task_id, {}).get("status") in ("cancelling", "interrupted"):
+            return False
+        try:
+            await asyncio.wait_for(worker_slots.acquire(), timeout=RESOURCE_WAIT_INTERVAL)
+            return True
+        except asyncio.TimeoutError:
+            continue
+
+
+def submit_to_pool(loop, *args) -> asyncio.Future:
+    """Отправляет задачу в пул; слот освобождается, когда процесс действительно закончил
+
+    (отмена asyncio-обертки не останавливает уже запущенного воркера)
+    """
+    try:
+        pool_future = executor.submit(*args)
+    except Exception:
+        worker_slots.release()
+        raise
+
+    def release_slot(_):
+        try:
+            loop.call_soon_threadsafe(worker_slots.release)
+        except RuntimeError:
+            pass  # Цикл событий уже закрыт (остановка бота)
+
+    pool_future.add_done_callback(release_slot)
+    return asyncio.wrap_future(pool_future, loop=loop)
 
 
 async def start_parsing_background_task(task_id: str, chat_id: str, query, url: str,
-                                        operation: str, callback, is_auto: bool):
+                                        operation: str, callback, is_auto: bool, on_finish=None):
     """ФОНОВАЯ задача парсинга - НЕ БЛОКИРУЕТ EVENT LOOP"""
+    final_status = None
     try:
         task_info = {
             "task_id": task_id,
@@ -228,6 +267,8 @@ async def start_parsing_background_task(task_id: str, chat_id: str, query, url:
         }
 
         active_tasks[task_id] = task_info
+        journal_job(task_id, status="running", url=url, operation=operation,
+                    chat_id=chat_id, is_auto=is_auto)
 
         log.info(f"🚀 ФОНОВЫЙ ЗАПУСК {task_id}: {operation} для {url}")
         log.info(f"   👤 Chat ID: {chat_id}, Auto: {is_auto}")
@@ -235,23 +276,62 @@ async def start_parsing_background_task(task_id: str, chat_id: str, query, url:
 
         if query and not is_auto:
             from utils import subj_by_url
-            await query.edit_message_text(
+            progress_updater.schedule(
+                query, chat_id,
                 f"🚀 Парсинг запущен!\n"
                 f"📚 {subj_by_url(url)}\n"
                 f"⚡ Активных задач: {len(active_tasks)}\n"
-                f"🆔 ID: {task_id[:8]}"
+                f"🆔 ID: {task_id[:8]}\n"
+                f"⛔ Отмена: /cancel"
             )
 
-        # Запускаем в отдельном процессе
-        loop = asyncio.get_event_loop()
-        future = loop.run_in_executor(
-            executor,
-            parsing_worker_with_progress,
-            url,
-            operation,
-            chat_id,
-            task_id
-        )
+        if CRAWLER_MODE != "distributed" and not await wait_for_resources(task_id, query, chat_id, is_auto):
+            # Отменена или прервана, пока ждала ресурсов
+            if active_tasks.get(task_id, {}).get("status") == "cancelling":
+                final_status = "cancelled"
+                await handle_parsing_cancelled(task_id, query, url, is_auto)
+            return
+
+        if CRAWLER_MODE == "service":
+            # Запускаем в отдельном сервисе парсинга
+            def store_progress(text: str):
+                if task_id in active_tasks:
+                    active_tasks[task_id]["progress"] = text
+
+            prev_ids = previous_ids_ref(url) if operation in ["Сравнение ID", "Автоматический парсинг"] else None
+            future = asyncio.ensure_future(
+                run_remote_job(task_id, url, operation, chat_id, store_progress, prev_ids)
+            )
+        elif CRAWLER_MODE == "distributed":
+            # Отдаем задачу удаленным воркерам через общую очередь
+            def store_progress(text: str):
+                if task_id in active_tasks:
+                    active_tasks[task_id]["progress"] = text
+
+            prev_ids = None
+            if operation in ["Сравнение ID", "Автоматический парсинг"]:
+                prev_ids = load_ids(store["last_ids"].get(url, [])).to_store()
+            future = asyncio.ensure_future(
+                run_distributed_job(task_id, url, operation, chat_id, prev_ids, store_progress)
+            )
+        else:
+            # Запускаем в отдельном процессе
+            if not await acquire_worker_slot(task_id):
+                if active_tasks.get(task_id, {}).get("status") == "cancelling":
+                    final_status = "cancelled"
+                    await handle_parsing_cancelled(task_id, query, url, is_auto)
+                return
+            loop = asyncio.get_event_loop()
+            prev_ids = previous_ids_ref(url) if operation in ["Сравнение ID", "Автоматический парсинг"] else None
+            future = submit_to_pool(
+                loop,
+                parsing_worker_with_progress,
+                url,
+                operation,
+                chat_id,
+                task_id,
+                prev_ids
+            )
 
         running_futures[task_id] = future
 
@@ -259,25 +339,60 @@ async def start_parsing_background_task(task_id: str, chat_id: str, query, url:
         asyncio.create_task(monitor_parsing_progress(task_id, query, url, is_auto))
 
         # Ждем результат БЕЗ БЛОКИРОВКИ основного потока
+        # Пакетная задача обходит предметы по очереди, у каждого свой лимит времени
+        job_timeout = PARSING_TIMEOUT * (len(batch_urls(url)) if operation == BATCH_OPERATION else 1)
         try:
-            result_dict = await future
+            result_dict = await asyncio.wait_for(future, timeout=job_timeout + 60)
+        except asyncio.TimeoutError:
+            log.error(f"⏰ Задача {task_id} превысила таймаут {job_timeout} сек")
+            cancel_task(task_id)
+            final_status = "failed"
+            await handle_parsing_error(task_id, "Превышено время парсинга", query, operation, is_auto)
+            return
+        except asyncio.CancelledError:
+            status = active_tasks.get(task_id, {}).get("status")
+            if status == "interrupted":
+                log.info(f"⏸️ Задача {task_id} прервана, будет продолжена после перезапуска")
+                return
+            if status != "cancelling":
+                raise
+            final_status = "cancelled"
+            await handle_parsing_cancelled(task_id, query, url, is_auto)
+            return
         except Exception as e:
+            final_status = "failed"
             log.error(f"⏰ Ошибка выполнения задачи {task_id}: {e}")
             if query and not is_auto:
+                await progress_updater.drop(query)
                 await query.edit_message_text("❌ Ошибка выполнения парсинга")
             return
 
         if result_dict and result_dict.get("status") == "success":
+            final_status = "done"
             await handle_parsing_success(task_id, result_dict, query, url, operation, callback, is_auto)
+        elif result_dict and result_dict.get("status") == "cancelled":
+            if active_tasks.get(task_id, {}).get("status") == "interrupted":
+                return
+            final_status = "cancelled"
+            await handle_parsing_cancelled(task_id, query, url, is_auto)
         else:
+            final_status = "failed"
             error = result_dict.get("error", "Неизвестная ошибка") if result_dict else "Пустой результат"
             await handle_parsing_error(task_id, error, query, operation, is_auto)
 
     except Exception as e:
+        final_status = "failed"
         log.error(f"❌ Ошибка фоновой задачи {task_id}: {e}")
         await handle_parsing_error(task_id, str(e), query, operation, is_auto)
     finally:
+        # Фиксируем итог в журнале (прерванные задачи остаются незавершенными)
+        if final_status:
+            journal_job(task_id, status=final_status)
+            remove_checkpoints(task_id)
+
         # Очищаем задачу
+        if query and not is_auto:
+            await progress_updater.drop(query)
         if task_id in active_tasks:
             del active_tasks[task_id]
         if task_id in running_futures:
@@ -290,31 +405,35 @@ async def start_parsing_background_task(task_id: str, chat_id: str, query, url:
         except:
             pass
 
+        if on_finish:
+            on_finish()
+
         log.info(f"✅ Фоновая задача {task_id} завершена и очищена")
 
 
 async def monitor_parsing_progress(task_id: str, query, url: str, is_auto: bool):
-    """Отслеживает прогресс парсинга БЕЗ БЛОКИРОВКИ"""
+    """Отслеживает прогресс парсинга БЕЗ БЛОКИРОВКИ (правки идут через общий планировщик)"""
     progress_file = f"progress_{task_id}.txt"
     last_progress = ""
 
     while task_id in running_futures and not running_futures[task_id].done():
         try:
-            if os.path.exists(progress_file):
+            current_progress = active_tasks.get(task_id, {}).get("progress")
+            if current_progress is None and os.path.exists(progress_file):
                 with open(progress_file, "r", encoding="utf-8") as f:
                     current_progress = f.read().strip()
 
+            if current_progress is not None:
                 if current_progress and current_progress != last_progress and query and not is_auto:
-                    try:
-                        from utils import subj_by_url
-                        await query.edit_message_text(
-                            f"🚀 Парсинг в процессе\n"
-                            f"📚 {subj_by_url(url)}\n"
-                            f"📊 {current_progress}\n"
-                            f"🆔 ID: {task_id[:8]}"
-                        )
-                    except Exception as e:
-                        log.warning(f"⚠️ Ошибка обновления прогресса: {e}")
+                    from utils import subj_by_url
+                    progress_updater.schedule(
+                        query, str(query.from_user.id),
+                        f"🚀 Парсинг в процессе\n"
+                        f"📚 {subj_by_url(url)}\n"
+                        f"📊 {current_progress}\n"
+                        f"🆔 ID: {task_id[:8]}\n"
+                        f"⛔ Отмена: /cancel"
+                    )
                 last_progress = current_progress
         except Exception as e:
             log.warning(f"⚠️ Ошибка чтения прогресса для {task_id}: {e}")
@@ -325,22 +444,37 @@ async def monitor_parsing_progress(task_id: str, query, url: str, is_auto: bool)
 async def handle_parsing_success(task_id: str, result_dict: dict, query, url: str,
                                  operation: str, callback, is_auto: bool):
     """Обрабатывает успешный результат парсинга"""
+    if query and not is_auto:
+        await progress_updater.drop(query)
     try:
         result = result_dict["result"]
 
+        # Результаты приходят в компактном виде IdSet.to_store()
         if operation == "Создание файла ID":
-            from database import save_parsing_result
-            save_parsing_result(url, operation, result, task_id)
-            final_result = set(result)
+            final_result = IdSet.from_store(result)
+            record_history(url, final_result)
+            # Количество, которое видел этот проход: неполный набор ID не сочтется актуальным
+            save_parsing_result(url, operation, final_result, task_id, count=len(final_result))
         elif operation in ["Сравнение ID", "Автоматический парсинг"]:
-            current_ids = set(result["current_ids"])
-            added = set(result["added"])
-            removed = set(result["removed"])
-
-            store["last_ids"][url] = list(current_ids)
-            save_store(store)
-
-            final_result = (current_ids, added, removed)
+            # Воркер возвращает только разницу с предыдущим снимком
+            current_ids = apply_ids_delta(url, result)
+            added = IdSet.from_store(result["added"])
+            removed = IdSet.from_store(result["removed"])
+            edited = IdSet.from_store(result.get("edited", []))
+            record_history(url, current_ids)
+            # Свежий набор ID годится и для кнопки "🆔 Файл всех ID"
+            save_parsing_result(url, "Создание файла ID", current_ids, task_id,
+                                count=result.get("count", len(current_ids)))
+
+            final_result = (current_ids, added, removed, edited)
+        elif operation == BATCH_OPERATION:
+            subjects = {}
+            for subject_url, ids in result["subjects"].items():
+                subjects[subject_url] = IdSet.from_store(ids)
+                record_history(subject_url, subjects[subject_url])
+                save_parsing_result(subject_url, "Создание файла ID", subjects[subject_url], task_id,
+                                    count=len(subjects[subject_url]))
+            final_result = {"subjects": subjects, "failed": result["failed"]}
         else:
             final_result = result
 
@@ -353,11 +487,29 @@ async def handle_parsing_success(task_id: str, result_dict: dict, query, url: st
         log.error(f"❌ Ошибка обработки успешного результата {task_id}: {e}")
 
 
+async def handle_parsing_cancelled(task_id: str, query, url: str, is_auto: bool):
+    """Сообщает об отмене парсинга"""
+    log.info(f"⛔ Задача {task_id} отменена")
+
+    if query and not is_auto:
+        await progress_updater.drop(query)
+        try:
+            from utils import subj_by_url
+            await query.edit_message_text(
+                f"⛔ Парсинг отменен\n"
+                f"📚 {subj_by_url(url)}\n"
+                f"🆔 ID: {task_id[:8]}"
+            )
+        except Exception as e:
+            log.warning(f"⚠️ Ошибка отправки сообщения об отмене: {e}")
+
+
 async def handle_parsing_error(task_id: str, error: str, query, operation: str, is_auto: bool):
     """Обрабатывает ошибку парсинга"""
     log.error(f"❌ Задача {task_id} завершилась с ошибкой: {error}")
 
     if query and not is_auto:
+        await progress_updater.drop(query)
         error_msg = error[:100] + "..." if len(error) > 100 else error
         try:
             await query.edit_message_text(
@@ -371,13 +523,18 @@ async def handle_parsing_error(task_id: str, error: str, query, operation: str,
 
 
 async def queue_parsing_task(query, context: ContextTypes.DEFAULT_TYPE, data: str,
-                             operation: str, callback, is_auto: bool = False):
-    """Запускает парсинг как ФОНОВУЮ ЗАДАЧУ - НЕ БЛОКИРУЕТ БОТ"""
+                             operation: str, callback, is_auto: bool = False, on_finish=None):
+    """Запускает парсинг как ФОНОВУЮ ЗАДАЧУ - НЕ БЛОКИРУЕТ БОТ
+
+    on_finish() вызывается после завершения задачи при любом исходе.
+    """
     idx = data.split("_", 1)[1]
     url_map = context.user_data.get(f"{data.split('_')[0]}_map", {})
     url = url_map.get(idx)
 
     if not url:
+        if on_finish:
+            on_finish()
         await query.edit_message_text("❌ Сессия устарела. Начните заново.")
         return
 
@@ -388,19 +545,24 @@ async def queue_parsing_task(query, context: ContextTypes.DEFAULT_TYPE, data: st
     log.info(f"   Chat ID: {chat_id}, URL: {url}")
     log.info(f"   Operation: {operation}, Auto: {is_auto}")
 
+    journal_job(task_id, status="queued", url=url, operation=operation, chat_id=chat_id,
+                is_auto=is_auto, submitted_at=datetime.now().isoformat())
+
     # Уведомляем о запуске
     if query and not is_auto:
         from utils import subj_by_url
-        await query.edit_message_text(
+        progress_updater.schedule(
+            query, chat_id,
             f"🚀 Запуск парсинга...\n"
             f"📚 {subj_by_url(url)}\n"
             f"🆔 ID: {task_id[:8]}\n\n"
-            f"🔄 Используйте другие функции"
+            f"🔄 Используйте другие функции\n"
+            f"⛔ Отмена: /cancel"
         )
 
     # Запускаем как фоновую задачу - НЕ БЛОКИРУЕТ
     asyncio.create_task(start_parsing_background_task(
-        task_id, chat_id, query, url, operation, callback, is_auto
+        task_id, chat_id, query, url, operation, callback, is_auto, on_finish
     ))
 
 
@@ -409,21 +571,128 @@ async def get_queue_status() -> str:
     total_active = len(active_tasks)
     user_tasks = len([t for t in active_tasks.values() if not t.get("is_auto", False)])
     auto_tasks = len([t for t in active_tasks.values() if t.get("is_auto", False)])
+    metrics = get_snapshot()
+
+    status = (f"📊 Статус фоновых задач:\n"
+              f"⚡ Всего активных: {total_active}\n"
+              f"👤 Пользовательских: {user_tasks}\n"
+              f"🤖 Автоматических: {auto_tasks}\n"
+              f"💾 Память: {metrics['memory_percent']:.1f}%\n"
+              f"🖥️ CPU: {metrics['cpu_percent']:.1f}%\n"
+              f"🌐 Chrome: {metrics['chrome_count']} проц., {metrics['chrome_rss_mb']:.0f} MB\n"
+              f"🔧 Воркеры: {len(metrics['worker_processes'])} проц., {metrics['worker_rss_mb']:.0f} MB"
+              )
+
+    if CRAWLER_MODE == "service":
+        service = await get_service_status()
+        if service:
+            status += (f"\n🛰️ Сервис парсинга: выполняется {service['running']}, "
+                       f"в очереди {service['queued']}, воркеры {service['worker_rss_mb']:.0f} MB")
+        else:
+            status += "\n🛰️ Сервис парсинга недоступен"
+    elif CRAWLER_MODE == "distributed":
+        queue = await get_distributed_status()
+        if queue:
+            status += (f"\n🛰️ Общая очередь: в очереди {queue['queued']}, "
+                       f"выполняется {queue['running']}, воркеров {queue['workers']}")
+        else:
+            status += "\n🛰️ Общая очередь недоступна"
 
-    return (f"📊 Статус фоновых задач:\n"
-            f"⚡ Всего активных: {total_active}\n"
-            f"👤 Пользовательских: {user_tasks}\n"
-            f"🤖 Автоматических: {auto_tasks}\n"
-            f"💾 Память: {psutil.virtual_memory().percent:.1f}%\n"
-            f"🖥️ CPU: {psutil.cpu_percent():.1f}%"
-            )
+    now = time.time()
+    paused = {host: entry for host, entry in get_hosts_status().items() if entry["state"] != "closed"}
+    for host, entry in paused.items():
+        wait = max(0, entry["retry_at"] - now)
+        status += (f"\n🔌 {host}: недоступен, повтор через {wait:.0f} сек"
+                   if wait else f"\n🔌 {host}: проверяется доступность")
+    if not paused:
+        status += "\n🔌 Сайты ФИПИ доступны"
+
+    for host, stats in get_rate_limit_stats().items():
+        status += (f"\n🚦 {host}: {stats['requests']} загрузок, ожидание очереди "
+                   f"в среднем {stats['wait_avg']:.1f} сек, макс. {stats['wait_max']:.1f} сек")
+
+    return status
+
+
+def register_resume_callback(operation: str, callback: Callable):
+    """Регистрирует колбэк результата для задач, восстанавливаемых после перезапуска"""
+    resume_callbacks[operation] = callback
+
+
+class ResumedMessage:
+    """Отправляет ответы в чат напрямую через бота (исходного сообщения уже нет)"""
+
+    def __init__(self, bot, chat_id: str):
+        self.bot = bot
+        self.chat_id = int(chat_id)
+
+    async def reply_text(self, text, reply_markup=None):
+        return await self.bot.send_message(chat_id=self.chat_id, text=text, reply_markup=reply_markup)
 
+    async def reply_document(self, document, filename=None, caption=None):
+        return await self.bot.send_document(chat_id=self.chat_id, document=document,
+                                            filename=filename, caption=caption)
 
-async def process_queue_manager():
-    """Менеджер фоновых задач - только очистка"""
-    await init_executor()
+
+class ResumedQuery:
+    """Заменяет query для задач, восстановленных после перезапуска"""
+
+    def __init__(self, bot, chat_id: str):
+        self.message = ResumedMessage(bot, chat_id)
+        self.from_user = type('User', (), {'id': int(chat_id)})()
+        self.status_message = None
+
+    async def edit_message_text(self, text, reply_markup=None, raise_on_flood=False):
+        if self.status_message is None:
+            self.status_message = await self.message.reply_text(text)
+            return
+        try:
+            await self.status_message.edit_text(text)
+        except RetryAfter as e:
+            if raise_on_flood:
+                raise
+            log.warning(f"⚠️ Flood limit при редактировании сообщения: {e}")
+        except Exception as e:
+            log.warning(f"⚠️ Ошибка редактирования сообщения: {e}")
+
+
+async def resume_pending_jobs(bot_context):
+    """Перезапускает задачи из журнала, не завершенные до остановки бота"""
+    jobs = get_unfinished_jobs()
+    if not jobs:
+        return
+
+    log.info(f"♻️ Восстановление незавершенных задач: {len(jobs)}")
+    for job in jobs:
+        task_id = job["task_id"]
+        operation = job.get("operation")
+        callback = resume_callbacks.get(operation)
+        if not job.get("url") or callback is None:
+            log.warning(f"⚠️ Невозможно восстановить задачу {task_id}: {operation}")
+            journal_job(task_id, status="failed")
+            continue
+
+        is_auto = job.get("is_auto", False)
+        query = None if is_auto else ResumedQuery(bot_context.bot, job["chat_id"])
+        asyncio.create_task(start_parsing_background_task(
+            task_id, job["chat_id"], query, job["url"], operation,
+            lambda q, c, r, u, cb=callback: cb(q, bot_context, r, u), is_auto
+        ))
+
+
+async def process_queue_manager(bot_context=None):
+    """Менеджер фоновых задач - очистка и восстановление после перезапуска"""
+    if CRAWLER_MODE == "service":
+        log.info("🛰️ Парсинг выполняется в отдельном сервисе")
+    elif CRAWLER_MODE == "distributed":
+        log.info("🛰️ Парсинг выполняется удаленными воркерами через общую очередь")
+    else:
+        await init_executor()
     log.info("🚀 Менеджер фоновых задач запущен - БОТ НЕ БЛОКИРУЕТСЯ!")
 
+    if bot_context is not None:
+        await resume_pending_jobs(bot_context)
+
     # Просто очищаем завершенные задачи
     while True:
         try:
@@ -435,6 +704,8 @@ async def process_queue_manager():
                     log.info(f"🧹 Очищена завершенная задача: {task_id}")
                     del active_tasks[task_id]
 
+            await check_worker_memory()
+
             await asyncio.sleep(10)
         except Exception as e:
             log.error(f"❌ Ошибка в менеджере: {e}")
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Общий ограничитель частоты загрузок страниц ФИПИ (token bucket по хостам)
+
+Бот, воркеры пула и сервис парсинга берут жетон перед каждой загрузкой или
+переходом по страницам. Ведро хранится в файле под блокировкой, поэтому лимит
+общий для всех процессов. Жетон резервируется сразу (ведро может уйти в минус),
+а ожидание идет вне блокировки - запросы обслуживаются по очереди.
+"""
+import logging
+import time
+
+from shared_state import locked_json, read_json
+from host_health import host_of
+from config import RATE_LIMIT_STATE_FILE, RATE_LIMITS, RATE_LIMIT_DEFAULT
+
+log = logging.getLogger("FIPI-Bot")
+
+# Ожидания дольше этого попадают в лог
+SLOW_WAIT_LOG_SECONDS = 10
+
+
+def _limits(host: str):
+    """(запросов в секунду, размер пачки) для хоста"""
+    return RATE_LIMITS.get(host, RATE_LIMIT_DEFAULT)
+
+
+def reserve(url: str) -> float:
+    """Резервирует жетон и возвращает, сколько секунд нужно подождать"""
+    host = host_of(url)
+    rate, burst = _limits(host)
+    now = time.time()
+    with locked_json(RATE_LIMIT_STATE_FILE) as state:
+        bucket = state.setdefault(host, {"tokens": float(burst), "updated": now,
+                                         "requests": 0, "wait_total": 0.0, "wait_max": 0.0})
+        bucket["tokens"] = min(float(burst), bucket["tokens"] + (now - bucket["updated"]) * rate)
+        bucket["updated"] = now
+        bucket["tokens"] -= 1
+        wait = -bucket["tokens"] / rate if bucket["tokens"] < 0 else 0.0
+        bucket["requests"] += 1
+        bucket["wait_total"] += wait
+        bucket["wait_max"] = max(bucket["wait_max"], wait)
+    return wait
+
+
+def acquire(url: str) -> float:
+    """Ждет своей очереди на загрузку страницы хоста; возвращает время ожидания"""
+    wait = reserve(url)
+    if wait > 0:
+        if wait >= SLOW_WAIT_LOG_SECONDS:
+            log.info(f"🚦 {host_of(url)}: ожидание очереди запросов {wait:.1f} сек")
+        time.sleep(wait)
+    return wait
+
+
+def get_rate_limit_stats() -> dict:
+    """Статистика по хостам: запросы, среднее и максимальное ожидание"""
+    stats = {}
+    for host, bucket in read_json(RATE_LIMIT_STATE_FILE).items():
+        requests = bucket.get("requests", 0)
+        stats[host] = {
+            "requests": requests,
+            "wait_avg": bucket.get("wait_total", 0.0) / requests if requests else 0.0,
+            "wait_max": bucket.get("wait_max", 0.0),
+        }
+    return stats
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Индекс расписания и рассылка ежедневных напоминаний
+
+Расписание статично (config.py), поэтому индексы "дата -> экзамены" и
+"предмет -> экзамены по дате" строятся один раз при импорте. Индекс
+"предмет -> подписчики" строится из хранилища и сбрасывается при изменении
+подписок. Напоминания собираются в одно сообщение на пользователя и
+отправляются параллельно с общим ограничением частоты.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Set, Tuple
+
+from telegram.error import RetryAfter
+
+from database import store
+from config import (EXAMS_LIST, STATGRAD_OGE_LIST, ALL_EXAMS_LIST, REMINDER_DAYS,
+                    REMINDER_SEND_RATE, REMINDER_SEND_CONCURRENCY)
+
+log = logging.getLogger("FIPI-Bot")
+
+# Вид напоминания -> (расписание, раздел хранилища с подписками)
+REMINDER_KINDS = {
+    "ege": (EXAMS_LIST, "reminder_subscriptions"),
+    "statgrad": (STATGRAD_OGE_LIST, "statgrad_subscriptions"),
+}
+
+
+def _build_date_index() -> Dict[date, List[Tuple[str, dict]]]:
+    index = defaultdict(list)
+    for kind, (exams, _) in REMINDER_KINDS.items():
+        for exam in exams:
+            index[exam["date"]].append((kind, exam))
+    return dict(index)
+
+
+def _build_subject_index() -> Dict[str, List[dict]]:
+    index = defaultdict(list)
+    for exam in sorted(ALL_EXAMS_LIST, key=lambda e: e["date"]):
+        index[exam["subject"]].append(exam)
+    return dict(index)
+
+
+EXAMS_BY_DATE = _build_date_index()
+EXAMS_BY_SUBJECT = _build_subject_index()
+
+# Вид напоминания -> предмет -> chat_id (None - нужно перестроить)
+_subscriber_index: Dict[str, Dict[str, Set[str]]] = None
+
+
+def invalidate_subscribers():
+    """Сбрасывает индекс подписчиков (вызывается при изменении подписок)"""
+    global _subscriber_index
+    _subscriber_index = None
+
+
+def subscribers_for(kind: str, subject: str) -> Set[str]:
+    global _subscriber_index
+    if _subscriber_index is None:
+        _subscriber_index = {}
+        for name, (_, store_key) in REMINDER_KINDS.items():
+            by_subject = defaultdict(set)
+            for chat_id, subjects in store.get(store_key, {}).items():
+                for subj in subjects:
+                    by_subject[subj].add(chat_id)
+            _subscriber_index[name] = dict(by_subject)
+    return _subscriber_index[kind].get(subject, set())
+
+
+def exams_for_subject(subject: str) -> List[dict]:
+    """Экзамены предмета, отсортированные по дате"""
+    return EXAMS_BY_SUBJECT.get(subject, [])
+
+
+def reminder_line(kind: str, exam: dict, days_until: int) -> str:
+    if kind == "statgrad":
+        return f"🎯 Статград через {days_until} день(дня)!\n📚 {exam['title']}"
+    return f"🔔 Через {days_until} день(дня) состоится:\n{exam['title']}"
+
+
+def build_daily_reminders(today: date) -> Dict[str, List[str]]:
+    """chat_id -> строки напоминаний на сегодня (по всем экзаменам и видам)"""
+    per_chat = defaultdict(list)
+    for days_until in sorted(REMINDER_DAYS):
+        for kind, exam in EXAMS_BY_DATE.get(today + timedelta(days=days_until), []):
+            line = reminder_line(kind, exam, days_until)
+            for chat_id in subscribers_for(kind, exam["subject"]):
+                per_chat[chat_id].append(line)
+    return dict(per_chat)
+
+
+async def send_many(bot, messages: Dict[str, str], rate: float = REMINDER_SEND_RATE,
+                    concurrency: int = REMINDER_SEND_CONCURRENCY) -> int:
+    """Отправляет сообщения параллельно, не чаще rate в секунду; возвращает число доставленных"""
+    semaphore = asyncio.Semaphore(concurrency)
+    lock = asyncio.Lock()
+    next_slot = [time.monotonic()]
+
+    async def wait_slot():
+        async with lock:
+            now = time.monotonic()
+            slot = max(now, next_slot[0])
+            next_slot[0] = slot + 1 / rate
+        await asyncio.sleep(slot - now)
+
+    async def send_one(chat_id: str, text: str) -> bool:
+        async with semaphore:
+            for attempt in range(2):
+                await wait_slot()
+                try:
+                    await bot.send_message(chat_id=int(chat_id), text=text)
+                    return True
+                except RetryAfter as e:
+                    log.warning(f"⏳ Flood limit при рассылке, пауза {e.retry_after} сек")
+                    await asyncio.sleep(e.retry_after)
+                except Exception as e:
+                    log.error(f"Ошибка отправки напоминания пользователю {chat_id}: {e}")
+                    return False
+            return False
+
+    results = await asyncio.gather(*(send_one(c, t) for c, t in messages.items()))
+    return sum(results)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Удаленный воркер парсинга - берет задачи из общей очереди и возвращает результаты
+
+Запуск на любом сервере с Chrome и доступом к очереди: python remote_worker.py
+"""
+import logging
+import os
+import socket
+import time
+
+from parsing_worker import parsing_worker_with_progress, create_worker_pool, cancel_file_path, remove_checkpoints
+from job_queue import create_job_queue
+from config import REMOTE_WORKER_SLOTS, JOB_POLL_INTERVAL
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+)
+
+log = logging.getLogger("FIPI-Worker")
+
+
+def read_progress(task_id: str) -> str:
+    """Читает файл прогресса, который пишет процесс парсинга"""
+    try:
+        with open(f"progress_{task_id}.txt", "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def request_cancel(task_id: str):
+    """Останавливает локальный парсинг на следующей странице"""
+    try:
+        with open(cancel_file_path(task_id), "w", encoding="utf-8") as f:
+            f.write(str(time.time()))
+    except OSError as e:
+        log.warning(f"⚠️ Не удалось создать флаг отмены для {task_id}: {e}")
+
+
+def main():
+    queue = create_job_queue()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    pool = create_worker_pool(max_workers=REMOTE_WORKER_SLOTS)
+    running = {}
+    # Задачи, аренду которых забрали: парсинг останавливается, результат не отправляется
+    lost = {}
+
+    log.info(f"🛰️ Удаленный воркер {worker_id} запущен ({REMOTE_WORKER_SLOTS} слотов)")
+
+    try:
+        while True:
+            queue.requeue_expired()
+
+            for task_id, future in list(lost.items()):
+                if future.done():
+                    del lost[task_id]
+                    remove_checkpoints(task_id)
+                    log.info(f"🗑️ Результат задачи {task_id} отброшен: аренда у другого воркера")
+
+            # Результаты и heartbeat для выполняющихся задач
+            for task_id, future in list(running.items()):
+                if future.done():
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"status": "error", "result": None, "error": str(e)}
+                    del running[task_id]
+                    remove_checkpoints(task_id)
+                    if queue.complete(task_id, worker_id, result):
+                        log.info(f"✅ Задача {task_id} завершена: {result.get('status')}")
+                    else:
+                        log.warning(f"⚠️ Результат задачи {task_id} не принят: аренда потеряна")
+                elif not queue.heartbeat(task_id, worker_id, read_progress(task_id)):
+                    # Аренда потеряна - задачу уже выполняет другой воркер
+                    log.warning(f"♻️ Аренда задачи {task_id} потеряна, парсинг останавливается")
+                    request_cancel(task_id)
+                    lost[task_id] = running.pop(task_id)
+                elif queue.is_cancelled(task_id):
+                    request_cancel(task_id)
+
+            # Новые задачи в свободные слоты. Пока брошенные задачи останавливаются, новые
+            # не берем: та же задача могла бы вернуться сюда, а старый запуск удалит ее файлы
+            while not lost and len(running) < REMOTE_WORKER_SLOTS:
+                job = queue.lease(worker_id)
+                if not job:
+                    break
+                log.info(f"🚀 Взята задача {job['task_id']}: {job['operation']} для {job['url']}")
+                running[job["task_id"]] = pool.submit(
+                    parsing_worker_with_progress,
+                    job["url"], job["operation"], job.get("chat_id", ""), job["task_id"],
+                    job.get("prev_ids")
+                )
+
+            time.sleep(JOB_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        log.info("⏹️ Остановка воркера")
+    finally:
+        for task_id in list(running) + list(lost):
+            request_cancel(task_id)
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    main()
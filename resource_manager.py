@@ -6,7 +6,8 @@ import logging
 import psutil
 import signal
 import os
-from config import MAX_WEBDRIVERS
+from config import MAX_WEBDRIVERS, MEMORY_LIMIT_PERCENT, CPU_LIMIT_PERCENT, METRICS_SAMPLE_INTERVAL
+from system_metrics import get_snapshot, snapshot_age, sample_metrics
 
 log = logging.getLogger("FIPI-Bot")
 
@@ -66,16 +67,20 @@ def kill_zombie_processes():
 
 
 def check_resources() -> bool:
-    """Проверяет, достаточно ли ресурсов для запуска нового WebDriver."""
+    """Проверяет, достаточно ли ресурсов для запуска нового парсинга (по снимку метрик).
+
+    Chrome здесь не убивается: процессы принадлежат уже идущим парсингам.
+    """
     global active_webdrivers
     try:
+        metrics = get_snapshot()
+        if snapshot_age() > 3 * METRICS_SAMPLE_INTERVAL:
+            # Фоновый сборщик не работает - снимаем метрики сами
+            metrics = sample_metrics()
+
         # Проверяем память
-        mem = psutil.virtual_memory()
-        if mem.percent > 90:
-            log.warning(f"Недостаточно памяти: использование {mem.percent}%")
-            # Пытаемся очистить ресурсы
-            kill_chrome_processes()
-            kill_zombie_processes()
+        if metrics["memory_percent"] > MEMORY_LIMIT_PERCENT:
+            log.warning(f"Недостаточно памяти: использование {metrics['memory_percent']}%")
             return False
 
         # Проверяем лимит WebDriver'ов
@@ -84,15 +89,13 @@ def check_resources() -> bool:
             return False
 
         # Проверяем CPU
-        cpu_percent = psutil.cpu_percent(interval=1)
-        if cpu_percent > 90:
-            log.warning(f"Недостаточно CPU: использование {cpu_percent}%")
+        if metrics["cpu_percent"] > CPU_LIMIT_PERCENT:
+            log.warning(f"Недостаточно CPU: использование {metrics['cpu_percent']}%")
             return False
 
         # Проверяем дисковое пространство
-        disk = psutil.disk_usage('/')
-        if disk.percent > 95:
-            log.warning(f"Недостаточно места на диске: использование {disk.percent}%")
+        if metrics["disk_percent"] > 95:
+            log.warning(f"Недостаточно места на диске: использование {metrics['disk_percent']}%")
             return False
 
         return True
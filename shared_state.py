@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Небольшие JSON-состояния, общие для бота и процессов парсинга
+
+Файл блокируется через flock на время чтения-изменения-записи, поэтому
+одновременные обновления из разных процессов не теряются.
+"""
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def locked_json(path: str):
+    """Открывает JSON-файл под эксклюзивной блокировкой и сохраняет изменения при выходе"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, "r+", encoding="utf-8") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            try:
+                data = json.load(f)
+            except ValueError:
+                data = {}
+            yield data
+            f.seek(0)
+            f.truncate()
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_json(path: str) -> dict:
+    """Читает состояние без блокировки (для отображения статуса)"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
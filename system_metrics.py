@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновый сбор системных метрик - CPU, память, диск и процессы Chrome
+"""
+import asyncio
+import logging
+import time
+import psutil
+from typing import Dict
+
+from config import METRICS_SAMPLE_INTERVAL
+
+log = logging.getLogger("FIPI-Bot")
+
+BROWSER_PROCESS_NAMES = {'chrome', 'chromium', 'chromium-browser', 'chromedriver',
+                         'chrome.exe', 'chromedriver.exe'}
+
+# Последний снимок метрик - читается статусом и проверками ресурсов без обращения к psutil
+snapshot: Dict = {
+    "timestamp": 0.0,
+    "cpu_percent": 0.0,
+    "memory_percent": 0.0,
+    "memory_available_mb": 0.0,
+    "disk_percent": 0.0,
+    "chrome_count": 0,
+    "chrome_rss_mb": 0.0,
+    "chrome_processes": {},  # pid -> {"name", "rss_mb", "create_time"}
+    "worker_rss_mb": 0.0,
+    "worker_processes": {},  # pid -> rss_mb (вместе с Chrome воркера)
+}
+
+# Источник PID воркеров пула парсинга (регистрирует queue_manager)
+_worker_pids_provider = None
+
+# Первый вызов cpu_percent без интервала всегда возвращает 0.0 - "заводим" счетчик заранее
+psutil.cpu_percent(interval=None)
+
+
+def set_worker_pids_provider(provider):
+    """Регистрирует функцию, возвращающую PID воркеров пула"""
+    global _worker_pids_provider
+    _worker_pids_provider = provider
+
+
+def _sample_workers() -> Dict:
+    """RSS воркеров пула в MB вместе с дочерними процессами (chromedriver и Chrome)"""
+    workers = {}
+    if _worker_pids_provider is None:
+        return workers
+    for pid in _worker_pids_provider():
+        try:
+            proc = psutil.Process(pid)
+            rss = proc.memory_info().rss
+            for child in proc.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+            workers[pid] = rss / 1024 / 1024
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return workers
+
+
+def sample_metrics() -> Dict:
+    """Снимает метрики одним проходом и обновляет общий снимок"""
+    chrome_processes = {}
+    chrome_rss = 0.0
+
+    for proc in psutil.process_iter(['pid', 'name', 'memory_info', 'create_time']):
+        try:
+            name = proc.info['name']
+            if not name or name.lower() not in BROWSER_PROCESS_NAMES:
+                continue
+            rss_mb = proc.info['memory_info'].rss / 1024 / 1024 if proc.info['memory_info'] else 0.0
+            chrome_processes[proc.info['pid']] = {
+                "name": name,
+                "rss_mb": rss_mb,
+                "create_time": proc.info['create_time'],
+            }
+            chrome_rss += rss_mb
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+
+    workers = _sample_workers()
+    mem = psutil.virtual_memory()
+    snapshot.update({
+        "timestamp": time.time(),
+        "cpu_percent": psutil.cpu_percent(interval=None),
+        "memory_percent": mem.percent,
+        "memory_available_mb": mem.available / 1024 / 1024,
+        "disk_percent": psutil.disk_usage('/').percent,
+        "chrome_count": len(chrome_processes),
+        "chrome_rss_mb": chrome_rss,
+        "chrome_processes": chrome_processes,
+        "worker_rss_mb": sum(workers.values()),
+        "worker_processes": workers,
+    })
+    return snapshot
+
+
+def get_snapshot() -> Dict:
+    """Возвращает последний снимок метрик (при первом обращении снимает его сразу)"""
+    if not snapshot["timestamp"]:
+        try:
+            sample_metrics()
+        except Exception as e:
+            log.warning(f"⚠️ Ошибка снятия метрик: {e}")
+    return snapshot
+
+
+def snapshot_age() -> float:
+    """Возраст снимка в секундах"""
+    if not snapshot["timestamp"]:
+        return float("inf")
+    return time.time() - snapshot["timestamp"]
+
+
+async def metrics_sampler():
+    """Фоновая задача: обновляет снимок метрик с фиксированным интервалом"""
+    log.info(f"📈 Сбор системных метрик каждые {METRICS_SAMPLE_INTERVAL} сек")
+    while True:
+        try:
+            await asyncio.to_thread(sample_metrics)
+        except Exception as e:
+            log.warning(f"⚠️ Ошибка сбора метрик: {e}")
+        await asyncio.sleep(METRICS_SAMPLE_INTERVAL)
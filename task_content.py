@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Содержимое заданий в хранилище, адресуемом хэшем
+
+При включенном TASK_CONTENT_CAPTURE парсер сравнения снимает текст каждого
+задания из iframe. Текст сохраняется файлом blob_<хэш>.gz только если такого
+хэша еще нет, а для прохода записывается манифест "ID -> хэш" (тоже по хэшу).
+Задание считается отредактированным, если его ID есть в обоих манифестах,
+а хэши различаются. Место растет только на реальные правки.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict
+
+from id_set import IdSet
+from config import TASK_CONTENT_DIR
+
+log = logging.getLogger("FIPI-Bot")
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def _path(kind: str, digest: str) -> str:
+    return os.path.join(TASK_CONTENT_DIR, f"{kind}_{digest}.gz")
+
+
+def _write_once(kind: str, data: bytes) -> str:
+    """Записывает данные, если файла с таким хэшем еще нет; возвращает хэш"""
+    digest = hashlib.sha256(data).hexdigest()[:24]
+    path = _path(kind, digest)
+    if not os.path.exists(path):
+        os.makedirs(TASK_CONTENT_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return digest
+
+
+def _read(kind: str, digest: str) -> bytes:
+    with gzip.open(_path(kind, digest), "rb") as f:
+        return f.read()
+
+
+def normalize(text: str) -> str:
+    """Текст задания без различий в пробелах и переносах"""
+    return WHITESPACE.sub(" ", text or "").strip()
+
+
+def write_blob(text: str) -> str:
+    return _write_once("blob", normalize(text).encode("utf-8"))
+
+
+def read_blob(digest: str) -> str:
+    return _read("blob", digest).decode("utf-8")
+
+
+def write_manifest(hashes: Dict[str, str]) -> str:
+    """Сохраняет манифест "ID -> хэш содержимого" и возвращает его хэш"""
+    return _write_once("manifest", json.dumps(hashes, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+
+
+def read_manifest(digest: str) -> Dict[str, str]:
+    return json.loads(_read("manifest", digest))
+
+
+def edited_ids(previous: Dict[str, str], current: Dict[str, str]) -> IdSet:
+    """ID, присутствующие в обоих манифестах с разным содержимым"""
+    return IdSet(task_id for task_id, digest in current.items()
+                 if task_id in previous and previous[task_id] != digest)
+
+
+def clean_content(keep_manifests: set, max_age_hours: int = 24) -> int:
+    """Удаляет манифесты без ссылок и тексты, на которые не ссылаются оставшиеся манифесты"""
+    if not os.path.isdir(TASK_CONTENT_DIR):
+        return 0
+    keep_blobs = set()
+    for digest in keep_manifests:
+        try:
+            keep_blobs.update(read_manifest(digest).values())
+        except (OSError, ValueError) as e:
+            log.warning(f"⚠️ Не удалось прочитать манифест {digest}: {e}")
+            return 0  # Без полного списка ссылок тексты удалять нельзя
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for name in os.listdir(TASK_CONTENT_DIR):
+        kind, _, rest = name.partition("_")
+        digest = rest.split(".", 1)[0]
+        keep = keep_manifests if kind == "manifest" else keep_blobs
+        path = os.path.join(TASK_CONTENT_DIR, name)
+        try:
+            if digest not in keep and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError as e:
+            log.warning(f"⚠️ Не удалось удалить {name}: {e}")
+    return removed
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import LocalJobQueue
+
+
+def test_complete_after_lost_lease_is_rejected():
+    queue = LocalJobQueue()
+    queue.push({"task_id": "t1", "url": "u", "operation": "Создание файла ID"})
+
+    assert queue.lease("old", lease_seconds=0)["task_id"] == "t1"
+    time.sleep(0.01)
+    assert queue.requeue_expired() == 1
+    assert queue.lease("new")["worker"] == "new"
+
+    cancelled = {"status": "cancelled", "result": None, "error": "Парсинг отменен"}
+    assert not queue.heartbeat("t1", "old")
+    assert not queue.complete("t1", "old", cancelled)
+    job = queue.get("t1")
+    assert job["status"] == "running" and job["worker"] == "new"
+
+    assert queue.complete("t1", "new", {"status": "success", "result": [], "error": None})
+    assert queue.get("t1")["result"]["status"] == "success"
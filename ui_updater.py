@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Планировщик редактирования сообщений о прогрессе с учетом лимитов Telegram
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Dict, Tuple
+
+from telegram.error import RetryAfter, BadRequest
+
+from config import UI_GLOBAL_EDITS_PER_SECOND, UI_CHAT_MIN_INTERVAL
+
+log = logging.getLogger("FIPI-Bot")
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    """Длительность паузы из RetryAfter (int или timedelta в зависимости от версии PTB)"""
+    retry_after = getattr(error, "retry_after", 1)
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class ProgressUpdater:
+    """Хранит только последний текст для каждого сообщения и отправляет правки в рамках бюджета"""
+
+    def __init__(self, global_rate: float = UI_GLOBAL_EDITS_PER_SECOND,
+                 chat_interval: float = UI_CHAT_MIN_INTERVAL):
+        self.global_rate = global_rate
+        self.chat_interval = chat_interval
+        self.pending: Dict[int, Tuple[object, str, str]] = {}  # id(query) -> (query, chat_id, text)
+        self.last_text: Dict[int, str] = {}
+        self.chat_last_edit: Dict[str, float] = {}
+        self.in_flight: Dict[int, asyncio.Task] = {}  # id(query) -> отправляемая правка
+        self.paused_until = 0.0
+        self.sent = 0
+        self.skipped = 0
+        self.task = None
+
+    def schedule(self, query, chat_id: str, text: str):
+        """Ставит текст в очередь; более ранний неотправленный текст заменяется"""
+        key = id(query)
+        if self.last_text.get(key) == text:
+            self.pending.pop(key, None)
+            self.skipped += 1
+            return
+        if key in self.pending:
+            self.skipped += 1
+        self.pending[key] = (query, chat_id, text)
+        self._ensure_running()
+
+    async def drop(self, query):
+        """Забывает сообщение перед финальной правкой и дожидается уже отправляемой
+        правки прогресса, чтобы она не пришла позже и не перезаписала результат"""
+        key = id(query)
+        self.pending.pop(key, None)
+        self.last_text.pop(key, None)
+        edit = self.in_flight.pop(key, None)
+        if edit is not None:
+            await asyncio.wait([edit])
+
+    def _ensure_running(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def _next_ready(self, now: float):
+        """Первое сообщение, чей чат уже исчерпал паузу между правками"""
+        for key, (query, chat_id, text) in self.pending.items():
+            if now - self.chat_last_edit.get(chat_id, 0.0) >= self.chat_interval:
+                return key
+        return None
+
+    async def _run(self):
+        while self.pending:
+            await asyncio.sleep(1 / self.global_rate)
+            now = time.monotonic()
+            if now < self.paused_until:
+                continue
+
+            key = self._next_ready(now)
+            if key is None:
+                continue
+
+            query, chat_id, text = self.pending.pop(key)
+            self.chat_last_edit[chat_id] = now
+            edit = asyncio.create_task(query.edit_message_text(text))
+            self.in_flight[key] = edit
+            try:
+                await edit
+                self.sent += 1
+                if self.in_flight.get(key) is edit:
+                    self.last_text[key] = text
+            except RetryAfter as e:
+                delay = _retry_after_seconds(e)
+                self.paused_until = time.monotonic() + delay
+                if self.in_flight.get(key) is edit:
+                    # Сообщение не забыто через drop() - повторим текст после паузы
+                    self.pending.setdefault(key, (query, chat_id, text))
+                log.warning(f"⚠️ Flood limit Telegram, пауза правок на {delay:.0f} сек")
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    if self.in_flight.get(key) is edit:
+                        self.last_text[key] = text
+                else:
+                    log.warning(f"⚠️ Ошибка обновления прогресса: {e}")
+            except Exception as e:
+                log.warning(f"⚠️ Ошибка обновления прогресса: {e}")
+            finally:
+                if self.in_flight.get(key) is edit:
+                    del self.in_flight[key]
+
+
+# Общий планировщик правок для всех задач
+progress_updater = ProgressUpdater()
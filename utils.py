@@ -15,6 +15,9 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
 from config import OGE_SUBJECTS, EGE_SUBJECTS
+from network_filter import NetworkFilter
+from rate_limiter import acquire
+from host_health import allow_request, record_success, record_failure, host_of
 
 log = logging.getLogger("FIPI-Bot")
 
@@ -34,10 +37,11 @@ def create_webdriver():
         opts.add_argument("--disable-dev-shm-usage")
         opts.add_argument("--disable-gpu")
         opts.add_argument("--disable-extensions")
-        opts.add_argument("--disable-images")
+        opts.add_argument("--blink-settings=imagesEnabled=false")
         opts.add_argument("--user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36")
         opts.add_argument("--window-size=1920,1080")
         opts.add_argument("--log-level=3")
+        NetworkFilter.configure_options(opts)
         
         # Создаем сервис и драйвер
         service = Service(chromedriver_path)
@@ -46,6 +50,9 @@ def create_webdriver():
         driver.set_page_load_timeout(60)
         driver.implicitly_wait(10)
         
+        # Блокировка шрифтов, медиа и сторонних счетчиков
+        NetworkFilter().attach(driver)
+        
         log.info(f"WebDriver создан с системным ChromeDriver: {chromedriver_path}")
         return driver
         
@@ -56,6 +63,10 @@ def create_webdriver():
 def subj_by_url(url: str) -> str:
     """Определяет точное название предмета по URL"""
     try:
+        from batch_ids import is_batch_target, batch_urls
+        if is_batch_target(url):
+            return f"Все мои предметы ({len(batch_urls(url))})"
+
         # Импортируем конфигурации
         from config import OGE_SUBJECTS, EGE_SUBJECTS
         
@@ -100,10 +111,23 @@ def subj_by_url(url: str) -> str:
         return "Неизвестный предмет"
 
 def get_current_count(url: str) -> Optional[int]:
-    """Точный подсчет количества заданий"""
+    """Точный подсчет количества заданий (не запускает браузер, пока сайт на паузе)"""
+    if not allow_request(url):
+        log.info(f"🔌 {host_of(url)} на паузе, подсчет для {url} пропущен")
+        return None
+    count = _fetch_current_count(url)
+    if count is None:
+        record_failure(url, "Не удалось получить количество заданий")
+    else:
+        record_success(url)
+    return count
+
+def _fetch_current_count(url: str) -> Optional[int]:
+    """Подсчет количества заданий в браузере"""
     driver = None
     try:
         driver = create_webdriver()
+        acquire(url)
         driver.get(url)
         time.sleep(3)
         
@@ -153,6 +177,7 @@ def get_current_count(url: str) -> Optional[int]:
             
             # Переходим на последнюю страницу для точного подсчета
             last_btn = btns[-1]
+            acquire(url)
             driver.execute_script("arguments[0].click();", last_btn)
             time.sleep(3)
             
@@ -3,6 +3,8 @@ import logging
 import psutil
 from datetime import datetime
 
+from system_metrics import get_snapshot
+
 log = logging.getLogger("WebDriverMonitor")
 
 
@@ -25,14 +27,11 @@ class WebDriverMonitor:
                 await asyncio.sleep(60)
 
     async def check_chrome_processes(self):
-        """Проверка Chrome процессов"""
-        chrome_count = 0
-        total_memory = 0
-
-        for proc in psutil.process_iter(['pid', 'name', 'memory_info']):
-            if proc.info['name'] in ['chrome', 'chromium']:
-                chrome_count += 1
-                total_memory += proc.info['memory_info'].rss / 1024 / 1024  # MB
+        """Проверка Chrome процессов (по снимку фонового сборщика метрик)"""
+        metrics = get_snapshot()
+        self.chrome_processes = metrics["chrome_processes"]
+        chrome_count = metrics["chrome_count"]
+        total_memory = metrics["chrome_rss_mb"]
 
         if chrome_count > 10:  # Слишком много процессов
             log.warning(f"Много Chrome процессов: {chrome_count}")
@@ -43,12 +42,13 @@ class WebDriverMonitor:
     async def cleanup_chrome_processes(self):
         """Очистка зависших Chrome процессов"""
         cleaned = 0
-        for proc in psutil.process_iter(['pid', 'name', 'create_time']):
+        now = datetime.now().timestamp()
+        for pid, info in list(self.chrome_processes.items()):
             try:
                 # Завершаем старые процессы (>1 часа)
-                if (proc.info['name'] in ['chrome', 'chromium'] and
-                        datetime.now().timestamp() - proc.info['create_time'] > 3600):
-                    proc.terminate()
+                if (info['name'] in ['chrome', 'chromium'] and
+                        now - info['create_time'] > 3600):
+                    psutil.Process(pid).terminate()
                     cleaned += 1
             except (psutil.NoSuchProcess, psutil.AccessDenied):
                 pass
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка webhook-режима: отправляет записанные обновления на локальный webhook-сервер
+
+Запуск: python webhook_replay.py updates.jsonl [--concurrency 10] [--repeat 1]
+Файл - по одному JSON-объекту Update в строке (например, из getUpdates).
+Без файла отправляются синтетические нажатия кнопок главного меню.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from config import WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH
+from webhook_server import get_webhook_secret, SECRET_HEADER
+
+MENU_BUTTONS = ["📋 Мои подписки", "ℹ️ Статус очереди", "📅 Расписание и напоминания"]
+
+
+def load_updates(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthetic_updates(count: int, chat_id: int) -> list:
+    """Текстовые сообщения от одного тестового пользователя"""
+    now = int(time.time())
+    user = {"id": chat_id, "is_bot": False, "first_name": "Test"}
+    return [{
+        "update_id": 900000000 + i,
+        "message": {
+            "message_id": i + 1,
+            "date": now,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": user,
+            "text": MENU_BUTTONS[i % len(MENU_BUTTONS)],
+        },
+    } for i in range(count)]
+
+
+async def replay(updates: list, url: str, secret: str, concurrency: int) -> dict:
+    """Отправляет обновления и собирает статусы ответов и задержки"""
+    statuses = {}
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        async def post(update: dict):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json=update, headers={SECRET_HEADER: secret})
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        await asyncio.gather(*(post(u) for u in updates))
+
+    latencies.sort()
+    return {
+        "statuses": statuses,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        "max_ms": latencies[-1] * 1000 if latencies else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправка обновлений на webhook-сервер бота")
+    parser.add_argument("file", nargs="?", help="JSONL-файл с обновлениями")
+    parser.add_argument("--url", default=f"http://{WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    parser.add_argument("--count", type=int, default=20, help="Синтетических обновлений без файла")
+    parser.add_argument("--chat-id", type=int, default=1, help="Чат синтетических обновлений")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--bad-secret", action="store_true", help="Проверить отказ при неверном секрете")
+    args = parser.parse_args()
+
+    updates = load_updates(args.file) if args.file else synthetic_updates(args.count, args.chat_id)
+    updates = updates * args.repeat
+    secret = "wrong-secret" if args.bad_secret else get_webhook_secret()
+
+    started = time.perf_counter()
+    report = asyncio.run(replay(updates, args.url, secret, args.concurrency))
+    elapsed = time.perf_counter() - started
+
+    print(f"📨 Отправлено обновлений: {len(updates)} за {elapsed:.2f} сек")
+    print(f"📊 Ответы: {report['statuses']}")
+    print(f"⏱️ Задержка ответа: p50 {report['p50_ms']:.1f} мс, max {report['max_ms']:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Прием обновлений Telegram через webhook - встроенный асинхронный HTTP-сервер
+
+Сервер слушает WEBHOOK_LISTEN:WEBHOOK_PORT (TLS завершает обратный прокси),
+проверяет заголовок X-Telegram-Bot-Api-Secret-Token и кладет обновления
+в очередь приложения. Если принято MAX_PENDING_UPDATES необработанных
+обновлений (считает ChatOrderedUpdateProcessor), отвечает 503 - Telegram
+повторит доставку позже, и нажатия пользователей не теряются.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import signal
+
+from telegram import Update
+
+from config import (BOT_TOKEN, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+                    WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS)
+
+log = logging.getLogger("FIPI-Bot")
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+MAX_BODY_SIZE = 1024 * 1024  # Обновления Telegram намного меньше
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+def get_webhook_secret() -> str:
+    """Секрет webhook: из конфигурации или детерминированно из токена бота"""
+    if WEBHOOK_SECRET:
+        return WEBHOOK_SECRET
+    return hashlib.sha256(f"webhook:{BOT_TOKEN}".encode("utf-8")).hexdigest()
+
+
+class WebhookServer:
+    """Минимальный HTTP/1.1 сервер, принимающий только POST на WEBHOOK_PATH"""
+
+    def __init__(self, app, secret: str, path: str = WEBHOOK_PATH):
+        self.app = app
+        self.secret = secret
+        self.path = path
+        self.server = None
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self, host: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT):
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        log.info(f"🌐 Webhook-сервер слушает {host}:{port}{self.path}")
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            log.info(f"🌐 Webhook-сервер остановлен (принято {self.received}, отклонено {self.rejected})")
+
+    async def respond(self, writer: asyncio.StreamWriter, status: int, keep_alive: bool = True):
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+        )
+        await writer.drain()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Обрабатывает запросы одного соединения (Telegram держит их открытыми)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    await self.respond(writer, 413, keep_alive=False)
+                    return
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close"
+
+                status = await self.handle_request(method, path, headers, body)
+                await self.respond(writer, status, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except Exception as e:
+            log.error(f"❌ Ошибка webhook-соединения: {e}")
+        finally:
+            writer.close()
+
+    async def handle_request(self, method: str, path: str, headers: dict, body: bytes) -> int:
+        """Проверяет запрос и кладет обновление в очередь; возвращает HTTP-статус"""
+        if path.split("?", 1)[0] != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, ""), self.secret):
+            self.rejected += 1
+            log.warning("⚠️ Webhook-запрос с неверным секретом отклонен")
+            return 403
+        try:
+            update = Update.de_json(json.loads(body.decode("utf-8")), self.app.bot)
+        except Exception as e:
+            log.warning(f"⚠️ Некорректное обновление в webhook: {e}")
+            return 400
+        if self.app.update_processor.is_full(self.app.update_queue.qsize()):
+            # Telegram повторит доставку - обновление не потеряется
+            self.rejected += 1
+            log.warning("⚠️ Слишком много необработанных обновлений, Telegram повторит доставку")
+            return 503
+        self.app.update_queue.put_nowait(update)
+        self.received += 1
+        return 200
+
+
+async def run_webhook(app, on_stop=None):
+    """Запускает приложение в режиме webhook до получения SIGTERM/SIGINT"""
+    if not WEBHOOK_URL:
+        raise RuntimeError("Для режима webhook укажите WEBHOOK_URL в config.py")
+
+    secret = get_webhook_secret()
+    server = WebhookServer(app, secret)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with app:
+        await app.start()
+        await server.start()
+        # Накопившиеся за время перезапуска обновления не сбрасываем
+        await app.bot.set_webhook(
+            url=WEBHOOK_URL,
+            secret_token=secret,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=False,
+        )
+        log.info(f"🌐 Webhook зарегистрирован: {WEBHOOK_URL}")
+        try:
+            await stop.wait()
+        finally:
+            log.info("📡 Остановка webhook-режима")
+            # Вебхук в Telegram оставляем: обновления дождутся следующего запуска
+            await server.stop()
+            if on_stop is not None:
+                await on_stop()
+            await app.stop()